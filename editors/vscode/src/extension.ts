@@ -10,6 +10,8 @@ import {
 } from 'vscode-languageclient';
 import QueryPanel from './webViews/query/queryPanel';
 import RenderPanel from './webViews/render/renderPanel';
+import { QueryTarget } from './webViews/query/common';
+import { RenderedSql } from './webViews/render/common';
 import * as vscode from 'vscode';
 import { ConfigViewProvider } from "./webViews/config/config-view-provider";
 import { TrilogyConfigService } from "./trilogyConfigService";
@@ -28,6 +30,10 @@ function getClientOptions(): LanguageClientOptions {
 			{ scheme: 'untitled', language: 'trilogy' },
 		],
 		outputChannelName: 'trilogy',
+		// The server rechecks closed files, and their importers, when these change
+		synchronize: {
+			fileEvents: vscode.workspace.createFileSystemWatcher('**/*.preql'),
+		},
 	};
 }
 
@@ -71,19 +77,29 @@ function registerUI(context: ExtensionContext) {
 	const serveService = TrilogyServeService.getInstance();
 
 	context.subscriptions.push(
-		vscode.commands.registerCommand('trilogy.runQuery', (command) => {
-			QueryPanel.createOrShow(context.extensionUri).then((panel) => {
-				panel.runQuery(command);
+		vscode.commands.registerCommand('trilogy.runQuery', (command, target?: QueryTarget) => {
+			QueryPanel.createOrShow(context.extensionUri, client).then((panel) => {
+				panel.runQuery(command, target);
 			});
 
 		}),
-		vscode.commands.registerCommand('trilogy.renderQuery', (command, dialect) => {
-			return RenderPanel.createOrShow(context.extensionUri).then((panel) => {
-				return panel.queryRender(command, dialect).then((panel) => {
-					return panel;
-				});
-			});
-
+		vscode.commands.registerCommand('trilogy.renderQuery', async (command, dialect, target?: QueryTarget) => {
+			const panel = await RenderPanel.createOrShow(context.extensionUri);
+			if (target && client) {
+				// the server renders the statement for each of the workspace's dialects
+				try {
+					const rendered = await client.sendRequest<RenderedSql[]>('trilogy/renderSql', target);
+					if (rendered.length) {
+						return panel.queryRender(
+							rendered.map(result => `-- ${result.dialect}\n${result.sql ?? `-- ${result.error}`}`),
+							rendered[0].dialect,
+						);
+					}
+				} catch (err) {
+					console.error(err);
+				}
+			}
+			return panel.queryRender(command, dialect);
 		}),
 		vscode.commands.registerCommand('trilogy.serveFolder', async () => {
 			await serveService.selectAndServeFolder();
@@ -1,4 +1,3 @@
-
 // Row data type - replaces duckdb's TableData
 export type RowData = { [key: string]: any };
 
@@ -19,6 +18,27 @@ export interface IMessage {
     exception?: string | null;
     results?: RowData[];
     headers?: ColumnDescription[];
+    // whether the server holds more rows of the result
+    hasMore?: boolean;
+    // the result stopped at the configured row or byte limit
+    truncated?: boolean;
 }
 
+// The document a query came from, and the position of its statement when the
+// language server should compile it
+export interface QueryTarget {
+    textDocument: { uri: string };
+    position?: { line: number; character: number };
+}
 
+// A page of results from the language server's trilogy/executeQuery request
+export interface QueryPage {
+    columns: { name: string; type: string }[];
+    rows: any[][];
+    cursor: string | null;
+    offset: number;
+    done: boolean;
+    cached: boolean;
+    truncated: boolean;
+    sample: number | null;
+}
@@ -1,83 +1,40 @@
 import * as vscode from 'vscode';
-import * as path from 'path';
+import { LanguageClient } from 'vscode-languageclient';
 import { Disposable } from '../dispose';
-import { DuckDBInstance, DuckDBConnection } from "@duckdb/node-api";
-import { ColumnDescription, IMessage, RowData } from './common';
-import { TrilogyConfigService } from '../../trilogyConfigService';
+import { ColumnDescription, IMessage, QueryPage, QueryTarget, RowData } from './common';
 
+const EXECUTE_QUERY = 'trilogy/executeQuery';
+const CLOSE_QUERY = 'trilogy/closeQuery';
+
+/**
+ * Runs queries through the language server, which keeps one DuckDB connection
+ * per workspace (running the trilogy.toml setup scripts once) and returns
+ * results a page at a time. The open result's cursor is held here and passed
+ * back for each further page.
+ */
 export class QueryDocument extends Disposable implements vscode.CustomDocument {
 
     static async create(
         uri: vscode.Uri,
         backupId: string | undefined,
+        client: LanguageClient,
     ): Promise<QueryDocument | PromiseLike<QueryDocument>> {
         // If we have a backup, read that. Otherwise read the resource from the workspace
         const trueURI = typeof backupId === 'string' ? vscode.Uri.parse(backupId) : uri;
-        const instance = new QueryDocument(trueURI);
-        await instance.init();
-        return instance;
+        return new QueryDocument(trueURI, client);
     }
 
     private readonly _uri: vscode.Uri;
-    private _instance: DuckDBInstance | null = null;
-    private _connection: DuckDBConnection | null = null;
-    private _configService: TrilogyConfigService;
-    private _setupCompleted: boolean = false;
+    private readonly _client: LanguageClient;
+    private _cursor: string | null = null;
 
-    private constructor(uri: vscode.Uri) {
+    private constructor(uri: vscode.Uri, client: LanguageClient) {
         super();
         this._uri = uri;
-        this._configService = TrilogyConfigService.getInstance();
-    }
-
-    private async init() {
-        // Create an in-memory DuckDB instance
-        this._instance = await DuckDBInstance.create(':memory:');
-        this._connection = await this._instance.connect();
-        await this.runSetupScripts();
-    }
-
-    private async runSetupScripts(): Promise<void> {
-        const activeConfig = this._configService.activeConfig;
-        if (!activeConfig || !activeConfig.setupFiles || activeConfig.setupFiles.length === 0) {
-            this._setupCompleted = true;
-            return;
-        }
-
-        // Get the directory of the trilogy.toml file
-        const configDir = path.dirname(activeConfig.path);
-
-        for (const setupFile of activeConfig.setupFiles) {
-            try {
-                const setupPath = path.isAbsolute(setupFile)
-                    ? setupFile
-                    : path.join(configDir, setupFile);
-
-                const fileUri = vscode.Uri.file(setupPath);
-                const content = await vscode.workspace.fs.readFile(fileUri);
-                const sql = new TextDecoder('utf-8').decode(content);
-
-                // Execute the setup SQL
-                try {
-                    await this.connection.run(sql);
-                    console.log(`Successfully ran setup script: ${setupFile}`);
-                } catch (err) {
-                    console.error(`Error running setup script ${setupFile}:`, err);
-                    // Continue with other scripts even if one fails
-                }
-            } catch (error) {
-                console.error(`Failed to read setup script ${setupFile}:`, error);
-            }
-        }
-
-        this._setupCompleted = true;
+        this._client = client;
     }
 
     public get uri() { return this._uri; }
-    public get connection() { return this._connection!; }
-    public get dialect(): string {
-        return this._configService.getActiveDialect();
-    }
 
     private readonly _onDidDispose = this._register(new vscode.EventEmitter<void>());
     /**
@@ -92,85 +49,86 @@ export class QueryDocument extends Disposable implements vscode.CustomDocument {
      */
     dispose(): void {
         this._onDidDispose.fire();
-        // Close connection and instance
-        if (this._connection) {
-            this._connection.closeSync();
-        }
-        if (this._instance) {
-            this._instance.closeSync();
-        }
+        this.closeCursor();
         super.dispose();
     }
 
-    private formatSql(sql: string, limit: number, offset: number): string {
-        return `SELECT * FROM (\n${sql.replace(';', '')}\n) LIMIT ${limit} OFFSET ${offset}`;
-    }
-
-    private cleanResults(results: RowData[]): RowData[] {
-        // DuckDB can sometimes give us BigInt values, which won't JSON.stringify
-        // https://github.com/duckdb/duckdb-node/blob/f9a910d544835f55dac36485d767b1c2f6aafb87/src/statement.cpp#L122
-        for (const row of results) {
-            for (const [key, value] of Object.entries(row)) {
-                if (typeof value === "bigint") {
-                    row[key] = Number(value);
-                }
-            }
+    /**
+     * Release the open result on the server, if it was not read to the end.
+     */
+    private closeCursor(): void {
+        if (this._cursor) {
+            const cursor = this._cursor;
+            this._cursor = null;
+            this._client.sendRequest(CLOSE_QUERY, { cursor }).then(undefined, () => undefined);
         }
-        return results;
     }
 
-    /**
-     * Execute SQL and return results as row objects
-     */
-    private async executeAndGetRows(sql: string): Promise<RowData[]> {
-        const reader = await this.connection.runAndReadAll(sql);
-        return reader.getRowObjects() as RowData[];
+    private toHeaders(page: QueryPage): ColumnDescription[] {
+        return page.columns.map(column => ({
+            column_name: column.name,
+            column_type: column.type,
+            null: '',
+            key: null,
+            default: null,
+            extra: null,
+        }));
     }
 
-    async runQuery(sql: string, limit: number, callback: (msg: IMessage) => void): Promise<void> {
-        // check if it is a CALL statement
-        const checkSQL = sql.toLowerCase().trim();
-        if (checkSQL.startsWith('call') || checkSQL.startsWith('install') || checkSQL.startsWith('load')) {
-            callback({ type: 'query-parse', success: true, message: 'finished-parse' });
-            try {
-                const rows = await this.executeAndGetRows(sql);
-                callback({ type: 'query', headers: [], sql: sql, success: true, results: this.cleanResults(rows), exception: null });
-            } catch (err: any) {
-                callback({ type: 'query', sql: sql, success: false, message: err.message, exception: err.message });
-            }
-            return;
-        }
+    private toRows(page: QueryPage): RowData[] {
+        return page.rows.map(row => {
+            const record: RowData = {};
+            page.columns.forEach((column, index) => { record[column.name] = row[index]; });
+            return record;
+        });
+    }
 
-        // Fetch resulting column names and types via DESCRIBE
+    /**
+     * Run a query and send its first page.
+     *
+     * Given a statement's position, the server compiles the statement itself,
+     * so its results can be cached and sampled; otherwise `sql` is run as
+     * written, with relative paths resolved from the target document's workspace.
+     */
+    async runQuery(sql: string, target: QueryTarget | undefined, pageSize: number, callback: (msg: IMessage) => void): Promise<void> {
+        this.closeCursor();
+        const params = target?.position
+            ? { ...target, pageSize }
+            : { sql, pageSize, textDocument: target?.textDocument };
         try {
-            const descRows = await this.executeAndGetRows(`DESCRIBE (${sql.replace(';', '')});`);
-            const headers: ColumnDescription[] = descRows.map(row => ({
-                column_name: String(row['column_name'] || row['name'] || ''),
-                column_type: String(row['column_type'] || row['type'] || ''),
-                null: String(row['null'] || ''),
-                key: row['key'] ? String(row['key']) : null,
-                default: row['default'] ? String(row['default']) : null,
-                extra: row['extra'] ? String(row['extra']) : null,
-            }));
-
-            // Execute query with limit
-            try {
-                const rows = await this.executeAndGetRows(this.formatSql(sql, limit, 0));
-                callback({ type: 'query', sql: sql, success: true, headers: headers, results: this.cleanResults(rows), exception: null });
-            } catch (err: any) {
-                callback({ type: 'query', sql: sql, success: false, message: err.message, exception: err.message });
-            }
+            const page = await this._client.sendRequest<QueryPage>(EXECUTE_QUERY, params);
+            this._cursor = page.cursor;
+            callback({
+                type: 'query',
+                sql: sql,
+                success: true,
+                headers: this.toHeaders(page),
+                results: this.toRows(page),
+                hasMore: !page.done,
+                truncated: page.truncated,
+                exception: null,
+            });
         } catch (err: any) {
-            callback({ type: 'query-parse', success: false, message: err.message, exception: err.message });
+            callback({ type: 'query', sql: sql, success: false, message: err.message, exception: err.message });
         }
     }
 
-    async fetchMore(sql: string, limit: number, offset: number, callback: (msg: IMessage) => void): Promise<void> {
+    /**
+     * Send the next page of the open result.
+     */
+    async fetchMore(pageSize: number, callback: (msg: IMessage) => void): Promise<void> {
+        if (!this._cursor) {
+            callback({ type: 'more', success: true, results: [], hasMore: false });
+            return;
+        }
         try {
-            const rows = await this.executeAndGetRows(this.formatSql(sql, limit, offset));
-            callback({ type: 'more', success: true, results: this.cleanResults(rows) });
+            const page = await this._client.sendRequest<QueryPage>(EXECUTE_QUERY, { cursor: this._cursor, pageSize });
+            this._cursor = page.cursor;
+            callback({ type: 'more', success: true, results: this.toRows(page), hasMore: !page.done, truncated: page.truncated });
         } catch (err: any) {
-            callback({ type: 'more', success: false, message: err.message });
+            // an expired cursor cannot be read again
+            this._cursor = null;
+            callback({ type: 'more', success: false, message: err.message, hasMore: false });
         }
     }
 }
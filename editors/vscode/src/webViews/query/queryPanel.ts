@@ -1,9 +1,12 @@
 import * as vscode from 'vscode';
+import { LanguageClient } from 'vscode-languageclient';
 import { getWebviewOptions, replaceWebviewHtmlTokens, getNonce } from '../utility';
 import { QueryDocument, } from './queryDocument';
-import { IMessage } from './common';
+import { IMessage, QueryTarget } from './common';
 
 const utf8TextDecoder = new TextDecoder("utf8");
+// Rows fetched from the language server per request
+const QUERY_PAGE_SIZE = 100;
 
 class QueryPanel {
     /**
@@ -47,6 +50,9 @@ class QueryPanel {
                         vscode.window.showInformationMessage(`Input received: ${message.text}`);
                         this.runQuery(message.text);
                         return;
+                    case 'more':
+                        this.fetchMore();
+                        return;
                     case 'alert':
                         vscode.window.showErrorMessage(message.text);
                         return;
@@ -57,13 +63,28 @@ class QueryPanel {
         );
     }
 
-    public async runQuery(query: string) {
+    public async runQuery(query: string, target?: QueryTarget) {
         //notify the panel a query is running
         this._panel.webview.postMessage({ type: 'query-start' });
-        await this._queryDocument.runQuery(query, 100, (msg: IMessage) => { this._last_msg = msg; this._panel.webview.postMessage(msg); });
+        await this._queryDocument.runQuery(query, target, QUERY_PAGE_SIZE, (msg: IMessage) => { this._last_msg = msg; this._panel.webview.postMessage(msg); });
+    }
+
+    public async fetchMore() {
+        await this._queryDocument.fetchMore(QUERY_PAGE_SIZE, (msg: IMessage) => {
+            // keep the whole result for when the panel is shown again
+            if (this._last_msg && msg.success) {
+                this._last_msg = {
+                    ...this._last_msg,
+                    results: [...(this._last_msg.results || []), ...(msg.results || [])],
+                    hasMore: msg.hasMore,
+                    truncated: msg.truncated,
+                };
+            }
+            this._panel.webview.postMessage(msg);
+        });
     }
 
-    public static async createOrShow(extensionUri: vscode.Uri) {
+    public static async createOrShow(extensionUri: vscode.Uri, client: LanguageClient) {
         const column = vscode.window.activeTextEditor
             ? vscode.window.activeTextEditor.viewColumn
             : undefined;
@@ -84,24 +105,24 @@ class QueryPanel {
             getWebviewOptions(extensionUri),
         );
 
-        QueryPanel.currentPanel = await QueryPanel.create(panel, extensionUri);
+        QueryPanel.currentPanel = await QueryPanel.create(panel, extensionUri, client);
         return QueryPanel.currentPanel;
     }
 
-    public static async revive(panel: vscode.WebviewPanel, extensionUri: vscode.Uri) {
-        QueryPanel.currentPanel = await QueryPanel.create(panel, extensionUri);
+    public static async revive(panel: vscode.WebviewPanel, extensionUri: vscode.Uri, client: LanguageClient) {
+        QueryPanel.currentPanel = await QueryPanel.create(panel, extensionUri, client);
     }
 
-    private static async create(panel: vscode.WebviewPanel, extensionUri: vscode.Uri): Promise<QueryPanel> {
+    private static async create(panel: vscode.WebviewPanel, extensionUri: vscode.Uri, client: LanguageClient): Promise<QueryPanel> {
         const queryPanel = new QueryPanel(panel, extensionUri);
-        await queryPanel.initializeQueryDocument(extensionUri);
+        await queryPanel.initializeQueryDocument(extensionUri, client);
         queryPanel._update();
         return queryPanel;
     }
 
-    private async initializeQueryDocument(extensionUri: vscode.Uri) {
+    private async initializeQueryDocument(extensionUri: vscode.Uri, client: LanguageClient) {
         try {
-            this._queryDocument = await QueryDocument.create(extensionUri, '');
+            this._queryDocument = await QueryDocument.create(extensionUri, undefined, client);
         } catch (err) {
             console.error(err);
         }
@@ -118,6 +139,8 @@ class QueryPanel {
 
         // Clean up our resources
         this._panel.dispose();
+        // releases the result the server holds open
+        this._queryDocument?.dispose();
 
         while (this._disposables.length) {
             const x = this._disposables.pop();
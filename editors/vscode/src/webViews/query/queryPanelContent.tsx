@@ -18,6 +18,10 @@ interface QueryResultsState {
     currentPage: number;
     loading: boolean;
     exception: string | null;
+    // the server holds more rows than have been fetched
+    hasMore: boolean;
+    truncated: boolean;
+    loadingMore: boolean;
 }
 
 class QueryResults extends Component<{ headers: ColumnDescription[]; data: any[] }> {
@@ -74,10 +78,19 @@ class QueryWrapper extends Component<{ vscode: any }, QueryResultsState> {
             exception: null,
             currentPage: 1,
             loading: false,
+            hasMore: false,
+            truncated: false,
+            loadingMore: false,
         };
     }
 
     handleNextPage = (): void => {
+        const { currentPage, data, hasMore, loadingMore } = this.state;
+        // fetch the next rows from the server before paging past those loaded
+        if ((currentPage + 1) * ITEMS_PER_PAGE > data.length && hasMore && !loadingMore) {
+            this.setState({ loadingMore: true });
+            this.props.vscode.postMessage({ command: 'more' });
+        }
         this.setState((prevState) => ({
             currentPage: prevState.currentPage + 1,
         }));
@@ -89,7 +102,7 @@ class QueryWrapper extends Component<{ vscode: any }, QueryResultsState> {
         }));
     };
     render() {
-        const { currentPage, headers, data, loading, sql, exception } = this.state;
+        const { currentPage, headers, data, loading, sql, exception, hasMore, truncated, loadingMore } = this.state;
         if (loading) {
             return (
                 <div className="w-full min-h-screen  flex flex-col items-center">
@@ -115,7 +128,9 @@ class QueryWrapper extends Component<{ vscode: any }, QueryResultsState> {
         return (
             <div className="w-full min-h-screen  flex flex-col items-center">
                 <div className="w-full max-w-4xl p-6  shadow-md rounded-lg">
-                    <h2 className="text-l font-semibold mb-2 text-white-700">Response ({data.length} rows)</h2>
+                    <h2 className="text-l font-semibold mb-2 text-white-700">
+                        Response ({data.length}{hasMore ? '+' : ''} rows{truncated ? ', truncated at the configured limit' : ''})
+                    </h2>
                     <QueryResults data={currentData} headers={headers} />
                     <div className="flex justify-between items-center mt-6">
                         <button
@@ -129,7 +144,7 @@ class QueryWrapper extends Component<{ vscode: any }, QueryResultsState> {
                         <span className="text-white-500 py-4">Page {currentPage}</span>
                         <button
                             onClick={this.handleNextPage}
-                            disabled={endIndex >= data.length}
+                            disabled={(endIndex >= data.length && !hasMore) || loadingMore}
                             className="px-4 py-2 ttext-white-500 rounded-md hover:bg-gray-400 disabled:opacity-50 disabled:cursor-not-allowed transition"
 
                         >
@@ -170,7 +185,27 @@ const queryWrapperRef = createRef<QueryWrapper>();
                 return;
             case 'query':
                 if (queryWrapperRef.current) {
-                    queryWrapperRef.current.setState({ data: message.results, headers: message.headers, sql: message.sql, loading: false, exception: message.exception });
+                    queryWrapperRef.current.setState({
+                        data: message.results || [],
+                        headers: message.headers || [],
+                        sql: message.sql,
+                        loading: false,
+                        exception: message.exception,
+                        currentPage: 1,
+                        hasMore: Boolean(message.hasMore),
+                        truncated: Boolean(message.truncated),
+                        loadingMore: false,
+                    });
+                }
+                return;
+            case 'more':
+                if (queryWrapperRef.current) {
+                    queryWrapperRef.current.setState((prevState) => ({
+                        data: message.success ? [...prevState.data, ...(message.results || [])] : prevState.data,
+                        hasMore: Boolean(message.hasMore),
+                        truncated: prevState.truncated || Boolean(message.truncated),
+                        loadingMore: false,
+                    }));
                 }
                 return;
             case 'query-parse':
@@ -7,4 +7,10 @@ export interface IMessage {
     dialect:string
 }
 
-
+// One dialect's result from the language server's trilogy/renderSql request
+export interface RenderedSql {
+    dialect: string;
+    sql: string | null;
+    error: string | null;
+    cached: boolean;
+}
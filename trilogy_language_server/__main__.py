@@ -2,6 +2,7 @@
 
 import argparse
 import logging
+import multiprocessing
 import os
 from trilogy_language_server.server import trilogy_server
 import sys
@@ -10,6 +11,10 @@ logging.basicConfig(level=logging.DEBUG)
 
 
 def main():
+    # Workspace checks run in worker processes; in the frozen binary, spawned
+    # workers re-run this entry point and must hand over to multiprocessing
+    # before parsing arguments or starting a server
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser(
         description="Trilogy Language Server. Defaults over stdio.",
         prog="trilogy_language_server",
@@ -20,10 +25,17 @@ def main():
     )
     parser.add_argument("--host", default="127.0.0.1", help="Bind to this address")
     parser.add_argument("--port", type=int, default=2087, help="Bind to this port")
+    parser.add_argument(
+        "--stall-threshold",
+        type=float,
+        default=1.0,
+        help="Log a stack dump when the event loop is blocked this many seconds (0 disables)",
+    )
     args = parser.parse_args()
     if os.environ.get("in-ci"):
         print("Running in a unit test, exiting")
         sys.exit(0)
+    trilogy_server.watchdog.threshold = args.stall_threshold
     if args.tcp:
         trilogy_server.start_tcp(args.host, args.port)
     else:
@@ -72,6 +72,18 @@ if __name__ == "__main__":
     except subprocess.CalledProcessError as e:
         print("Error executing requirements install command:", e)
         sys.exit(1)
+    # Regenerate the function catalog against the installed pytrilogy so the
+    # bundled artifact matches the frozen parser
+    catalog_command = prefixes + [
+        f"{python_path}",
+        "-m",
+        "trilogy_language_server.function_catalog",
+    ]
+    try:
+        subprocess.check_call(catalog_command, cwd=base)
+    except subprocess.CalledProcessError as e:
+        print("Error generating function catalog:", e)
+        sys.exit(1)
     command = prefixes + [f"{pyinstaller_path}", f"{SCRIPT_NAME}.spec", "--noconfirm"]
 
     try:
@@ -0,0 +1,753 @@
+"""Server-side filtering and ranking for completion requests."""
+
+import heapq
+import math
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
+from itertools import count
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import attrs
+from lsprotocol.types import (
+    CompletionItem,
+    CompletionItemKind,
+    InsertTextFormat,
+)
+
+from trilogy_language_server.models import (
+    ConceptInfo,
+    ConceptLocation,
+    DatasourceInfo,
+)
+from trilogy_language_server.parsing import TRILOGY_FUNCTIONS
+
+# Maximum number of items returned per request; the list is marked incomplete
+# when more candidates match so the client asks again as the user types.
+MAX_COMPLETION_ITEMS = 100
+
+# Sort categories, in display order
+CONCEPT = 0
+KEYWORD = 1
+FUNCTION = 2
+DATASOURCE = 3
+
+KEYWORDS = [
+    "select",
+    "key",
+    "property",
+    "metric",
+    "const",
+    "datasource",
+    "import",
+    "as",
+    "where",
+    "order",
+    "by",
+    "limit",
+    "asc",
+    "desc",
+    "and",
+    "or",
+    "not",
+    "in",
+    "between",
+    "like",
+    "is",
+    "null",
+    "true",
+    "false",
+    "grain",
+    "address",
+    "auto",
+    "persist",
+    "into",
+    "rowset",
+    "merge",
+    "show",
+]
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_."
+
+
+def _offset(text: str, line: int, character: int) -> int:
+    """
+    Convert a position to a string offset, clamped to the end of its line, or
+    -1 when the document has fewer lines.
+
+    Walks to the requested line with ``str.find`` rather than splitting the
+    whole document.
+    """
+    start = 0
+    for _ in range(line):
+        start = text.find("\n", start)
+        if start < 0:
+            return -1
+        start += 1
+    end = text.find("\n", start)
+    return start + min(character, (end if end >= 0 else len(text)) - start)
+
+
+def extract_prefix(text: str, line: int, character: int) -> str:
+    """Return the identifier fragment (including namespace dots) before the cursor."""
+    cursor = _offset(text, line, character)
+    if cursor < 0:
+        return ""
+    begin = cursor
+    while begin > 0 and _is_word_char(text[begin - 1]):
+        begin -= 1
+    return text[begin:cursor]
+
+
+class CompletionCandidate:
+    """
+    A completion target, matched on its label, address and description.
+
+    ``item`` is the LSP item without documentation; it is built once and shared
+    by every request against the same index, while documentation is only
+    produced by ``completionItem/resolve``.
+    """
+
+    __slots__ = ("label", "category", "source", "data", "usage", "_item")
+
+    def __init__(
+        self,
+        label: str,
+        category: int,
+        source: Any = None,
+        data: Optional[Dict[str, Any]] = None,
+        usage: int = 0,
+    ) -> None:
+        self.label = label
+        self.category = category
+        self.source = source
+        self.data = data
+        # references to the candidate in its document, used as a ranking boost
+        self.usage = usage
+        self._item: Optional[CompletionItem] = None
+
+    @property
+    def item(self) -> CompletionItem:
+        if self._item is None:
+            self._item = build_completion_item(self)
+        return self._item
+
+    @property
+    def address(self) -> Optional[str]:
+        """The namespaced address, when it says more than the label."""
+        if self.category != CONCEPT or self.source.namespace == "local":
+            return None
+        return self.source.address
+
+    @property
+    def description(self) -> Optional[str]:
+        if self.category == CONCEPT:
+            return self.source.description
+        if self.category == FUNCTION:
+            return self.source["description"]
+        return None
+
+    def rank(self) -> Tuple[int, int, int, str]:
+        return (-self.usage, self.category, len(self.label), self.label)
+
+
+_INDEX_VERSIONS = count()
+
+
+class CandidateIndex:
+    """
+    A snapshot of completion candidates.
+
+    Every candidate is fuzzy matched, so there is no lookup structure; the
+    version tells snapshots apart in score cache keys.
+    """
+
+    def __init__(self, candidates: Sequence[CompletionCandidate]) -> None:
+        self.candidates = list(candidates)
+        self.version = next(_INDEX_VERSIONS)
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+
+# Fuzzy match scoring
+_FIRST_CHAR_BONUS = 8
+_BOUNDARY_BONUS = 6
+_CONSECUTIVE_BONUS = 4
+_PREFIX_BONUS = 10
+_EXACT_BONUS = 20
+_MAX_GAP_PENALTY = 10
+# Penalties for matching a secondary field rather than the label
+_ADDRESS_PENALTY = 2
+_DESCRIPTION_SCORE = 1
+
+
+@lru_cache(maxsize=16384)
+def _boundaries(text: str) -> Tuple[bool, ...]:
+    """Flag the characters that start a word: after ``_``/``.``/space or camelCase humps."""
+    flags = []
+    previous = ""
+    for char in text:
+        flags.append(
+            not previous
+            or previous in "_. -"
+            or (previous.islower() and char.isupper())
+        )
+        previous = char
+    return tuple(flags)
+
+
+def _match_positions(
+    pattern: str,
+    lowered: str,
+    boundaries: Tuple[bool, ...],
+    first: int,
+    prefer_boundaries: bool,
+) -> List[int]:
+    """Place ``pattern`` in ``lowered`` starting at ``first``; the rest must fit."""
+    positions = [first]
+    for idx in range(1, len(pattern)):
+        char = pattern[idx]
+        position = lowered.find(char, positions[-1] + 1)
+        if prefer_boundaries and position != positions[-1] + 1:
+            # Jump ahead to a word start when the rest of the pattern still fits
+            candidate = position
+            while candidate >= 0 and not boundaries[candidate]:
+                candidate = lowered.find(char, candidate + 1)
+            if candidate >= 0 and _is_subsequence(
+                pattern[idx + 1 :], lowered, candidate + 1
+            ):
+                position = candidate
+        positions.append(position)
+    return positions
+
+
+def _is_subsequence(pattern: str, text: str, start: int = 0) -> bool:
+    for char in pattern:
+        start = text.find(char, start)
+        if start < 0:
+            return False
+        start += 1
+    return True
+
+
+def fuzzy_score(pattern: str, text: str) -> Optional[int]:
+    """
+    Score ``text`` as a fuzzy match for the lowercased ``pattern``, or None.
+
+    Every pattern character must appear in order, the first one at the start
+    of a word. Matches at the start, at snake_case/camelCase word boundaries and
+    runs of consecutive characters score higher; gaps between matched
+    characters cost a little.
+    """
+    if not pattern:
+        return 0
+    lowered = text.lower()
+    if lowered.startswith(pattern):
+        return (
+            _PREFIX_BONUS
+            + len(pattern) * (1 + _CONSECUTIVE_BONUS)
+            + (_EXACT_BONUS if len(pattern) == len(lowered) else 0)
+        )
+    boundaries = _boundaries(text)
+    first = lowered.find(pattern[0])
+    while first >= 0 and not (
+        boundaries[first] and _is_subsequence(pattern[1:], lowered, first + 1)
+    ):
+        first = lowered.find(pattern[0], first + 1)
+    if first < 0:
+        return None
+    best: Optional[int] = None
+    for prefer_boundaries in (False, True):
+        positions = _match_positions(
+            pattern, lowered, boundaries, first, prefer_boundaries
+        )
+        score = len(positions)
+        for idx, position in enumerate(positions):
+            if position == 0:
+                score += _FIRST_CHAR_BONUS
+            elif boundaries[position]:
+                score += _BOUNDARY_BONUS
+            if idx and position == positions[idx - 1] + 1:
+                score += _CONSECUTIVE_BONUS
+        score -= min(
+            positions[-1] - positions[0] + 1 - len(positions), _MAX_GAP_PENALTY
+        )
+        best = score if best is None else max(best, score)
+    return best
+
+
+def _description_match(pattern: str, description: str) -> bool:
+    """Whether a word in ``description`` starts with ``pattern``."""
+    lowered = description.lower()
+    position = lowered.find(pattern)
+    while position >= 0:
+        if position == 0 or not lowered[position - 1].isalnum():
+            return True
+        position = lowered.find(pattern, position + 1)
+    return False
+
+
+def candidate_score(candidate: CompletionCandidate, pattern: str) -> Optional[int]:
+    """Best fuzzy score across the candidate's label, address and description."""
+    scores = []
+    label = fuzzy_score(pattern, candidate.label)
+    if label is not None:
+        scores.append(label)
+    address = candidate.address
+    if address and address != candidate.label:
+        score = fuzzy_score(pattern, address)
+        if score is not None:
+            scores.append(score - _ADDRESS_PENALTY)
+    if not scores:
+        description = candidate.description
+        if description and _description_match(pattern, description):
+            scores.append(_DESCRIPTION_SCORE)
+    return max(scores) if scores else None
+
+
+def usage_bonus(usage: int) -> int:
+    """Logarithmic boost for how often a concept is referenced in the document."""
+    return round(2 * math.log2(1 + usage))
+
+
+Scored = List[Tuple[int, CompletionCandidate]]
+
+
+class ScoreCache:
+    """
+    Fuzzy match results keyed by (prefix, index versions).
+
+    A fuzzy match for a pattern is also a match for every prefix of it, so a
+    longer prefix only rescores the candidates that matched a cached shorter
+    one: each keystroke narrows the previous result instead of rescanning
+    every candidate.
+    """
+
+    def __init__(self, size: int = 64) -> None:
+        self.size = size
+        self._entries: "OrderedDict[Tuple[str, Tuple[int, ...]], Scored]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, prefix: str, versions: Tuple[int, ...]) -> Optional[Scored]:
+        entry = self._entries.get((prefix, versions))
+        if entry is not None:
+            self._entries.move_to_end((prefix, versions))
+        return entry
+
+    def closest(self, prefix: str, versions: Tuple[int, ...]) -> Optional[Scored]:
+        """Return the cached result for the longest shorter prefix, if any."""
+        for end in range(len(prefix) - 1, 0, -1):
+            entry = self.get(prefix[:end], versions)
+            if entry is not None:
+                return entry
+        return None
+
+    def put(self, prefix: str, versions: Tuple[int, ...], scored: Scored) -> None:
+        self._entries[(prefix, versions)] = scored
+        self._entries.move_to_end((prefix, versions))
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+def score_candidates(
+    indexes: Sequence[CandidateIndex], prefix: str, cache: Optional[ScoreCache] = None
+) -> Scored:
+    """Fuzzy match ``prefix`` against every candidate, refining cached results."""
+    prefix = prefix.lower()
+    versions = tuple(index.version for index in indexes)
+    if cache is not None:
+        cached = cache.get(prefix, versions)
+        if cached is not None:
+            return cached
+        previous = cache.closest(prefix, versions)
+    else:
+        previous = None
+    pool: Iterable[CompletionCandidate] = (
+        [candidate for _, candidate in previous]
+        if previous is not None
+        else (candidate for index in indexes for candidate in index.candidates)
+    )
+    scored: Scored = []
+    for candidate in pool:
+        score = candidate_score(candidate, prefix)
+        if score is not None:
+            scored.append((score + usage_bonus(candidate.usage), candidate))
+    if cache is not None:
+        cache.put(prefix, versions, scored)
+    return scored
+
+
+def top_candidates(
+    indexes: Sequence[CandidateIndex],
+    prefix: str,
+    limit: int = MAX_COMPLETION_ITEMS,
+    cache: Optional[ScoreCache] = None,
+) -> Tuple[List[CompletionCandidate], bool]:
+    """Return the best ``limit`` matches across indexes and whether more matched."""
+    if not prefix:
+        matches = [c for index in indexes for c in index.candidates]
+        if len(matches) <= limit:
+            return sorted(matches, key=CompletionCandidate.rank), False
+        return heapq.nsmallest(limit, matches, key=CompletionCandidate.rank), True
+
+    scored = score_candidates(indexes, prefix, cache)
+
+    def order(entry: Tuple[int, CompletionCandidate]) -> Tuple[Any, ...]:
+        return (-entry[0],) + entry[1].rank()
+
+    best = heapq.nsmallest(limit, scored, key=order)
+    return [candidate for _, candidate in best], len(scored) > limit
+
+
+class DocumentIndex:
+    """
+    Completion candidates for a single document.
+
+    ``members`` maps each namespace to an index over its concepts' bare names, so
+    ``b.`` completes only the members of ``b``.
+    """
+
+    def __init__(
+        self,
+        concepts: Sequence[CompletionCandidate],
+        datasources: Sequence[CompletionCandidate],
+    ) -> None:
+        self.concepts = CandidateIndex(concepts)
+        self.datasources = CandidateIndex(datasources)
+        grouped: Dict[str, List[CompletionCandidate]] = defaultdict(list)
+        for candidate in concepts:
+            grouped[candidate.source.namespace].append(candidate)
+        self.members = {
+            namespace: CandidateIndex(members) for namespace, members in grouped.items()
+        }
+
+
+def build_document_index(
+    concept_info: Dict[str, ConceptInfo],
+    datasources: Sequence[DatasourceInfo],
+    uri: Optional[str] = None,
+    locations: Sequence[ConceptLocation] = (),
+) -> DocumentIndex:
+    """Index the concepts and datasources known for a single document."""
+    usage = Counter(
+        location.concept_address for location in locations if not location.is_definition
+    )
+    concepts = [
+        CompletionCandidate(
+            concept.name,
+            CONCEPT,
+            concept,
+            {"uri": uri, "concept": address},
+            usage[address],
+        )
+        for address, concept in concept_info.items()
+        # Skip internal concepts
+        if concept.namespace != "__preql_internal"
+    ]
+    return DocumentIndex(
+        concepts,
+        [
+            CompletionCandidate(
+                ds.name, DATASOURCE, ds, {"uri": uri, "datasource": ds.name}
+            )
+            for ds in datasources
+        ],
+    )
+
+
+KEYWORD_CANDIDATES = {
+    keyword: CompletionCandidate(keyword, KEYWORD) for keyword in KEYWORDS
+}
+FUNCTION_CANDIDATES = [
+    CompletionCandidate(name, FUNCTION, info, {"function": name})
+    for name, info in TRILOGY_FUNCTIONS.items()
+]
+
+
+def keyword_index(keywords: Sequence[str]) -> CandidateIndex:
+    return CandidateIndex([KEYWORD_CANDIDATES[keyword] for keyword in keywords])
+
+
+def build_static_index() -> CandidateIndex:
+    """Index the keywords and built-in functions, which never change."""
+    candidates = list(KEYWORD_CANDIDATES.values()) + FUNCTION_CANDIDATES
+    # Built eagerly: static items are shared by every request for the session
+    for candidate in candidates:
+        _ = candidate.item
+    return CandidateIndex(candidates)
+
+
+def concept_kind(concept: ConceptInfo) -> CompletionItemKind:
+    # Determine icon based on purpose
+    if concept.purpose == "key":
+        return CompletionItemKind.Field
+    elif concept.purpose == "property":
+        return CompletionItemKind.Property
+    elif concept.purpose == "metric":
+        return CompletionItemKind.Value
+    elif concept.purpose == "constant":
+        return CompletionItemKind.Constant
+    return CompletionItemKind.Variable
+
+
+def concept_documentation(concept: ConceptInfo) -> str:
+    doc_parts = [f"**{concept.purpose}** `{concept.name}`: `{concept.datatype}`"]
+    if concept.description:
+        doc_parts.append(concept.description)
+    if concept.lineage:
+        doc_parts.append(
+            f"Derivation: `{concept.lineage[:50]}...`"
+            if len(concept.lineage) > 50
+            else f"Derivation: `{concept.lineage}`"
+        )
+    return "\n\n".join(doc_parts)
+
+
+def datasource_documentation(ds: DatasourceInfo) -> str:
+    return f"**Datasource:** `{ds.name}`\n\n**Address:** `{ds.address}`"
+
+
+def build_completion_item(candidate: CompletionCandidate) -> CompletionItem:
+    """Build the documentation-free LSP item for a candidate."""
+    if candidate.category == CONCEPT:
+        concept: ConceptInfo = candidate.source
+        return CompletionItem(
+            label=concept.name,
+            kind=concept_kind(concept),
+            detail=f"{concept.purpose}: {concept.datatype}",
+            insert_text=concept.name,
+            data=candidate.data,
+        )
+    elif candidate.category == KEYWORD:
+        return CompletionItem(
+            label=candidate.label,
+            kind=CompletionItemKind.Keyword,
+            detail="keyword",
+            insert_text=candidate.label,
+        )
+    elif candidate.category == FUNCTION:
+        return CompletionItem(
+            label=candidate.label,
+            kind=CompletionItemKind.Function,
+            detail=candidate.source["signature"],
+            insert_text=f"{candidate.label}($1)",
+            insert_text_format=InsertTextFormat.Snippet,
+            data=candidate.data,
+        )
+    ds: DatasourceInfo = candidate.source
+    return CompletionItem(
+        label=ds.name,
+        kind=CompletionItemKind.Struct,
+        detail=f"datasource -> {ds.address}",
+        insert_text=ds.name,
+        data=candidate.data,
+    )
+
+
+STATIC_INDEX = build_static_index()
+
+
+def to_completion_item(
+    candidate: CompletionCandidate, rank: int, prefix: str = ""
+) -> CompletionItem:
+    """
+    Copy the cached item for a candidate; ``rank`` fixes the client-side order.
+
+    Items matched through their address or description get the typed prefix as
+    their filter text so the client's own label filter does not drop them.
+    """
+    item = attrs.evolve(candidate.item, sort_text=f"{rank:05d}")
+    if prefix and fuzzy_score(prefix.lower(), candidate.label) is None:
+        item.filter_text = prefix
+    return item
+
+
+def resolve_documentation(
+    data: Dict[str, Any],
+    concept_info: Dict[str, ConceptInfo],
+    datasources: Sequence[DatasourceInfo],
+) -> Optional[str]:
+    """Compute the markdown documentation for a previously returned item."""
+    if "function" in data:
+        info = TRILOGY_FUNCTIONS.get(data["function"])
+        return info["description"] if info else None
+    if "concept" in data:
+        concept = concept_info.get(data["concept"])
+        return concept_documentation(concept) if concept else None
+    if "datasource" in data:
+        for ds in datasources:
+            if ds.name == data["datasource"]:
+                return datasource_documentation(ds)
+    return None
+
+
+# Syntactic position of the cursor, used to pick the candidate sets
+STATEMENT = "statement"
+SELECT = "select"
+WHERE = "where"
+ORDER = "order"
+DATASOURCE_COLUMNS = "datasource_columns"
+IMPORT = "import"
+LIMIT = "limit"
+GENERAL = "general"
+
+STATEMENT_INDEX = keyword_index(
+    [
+        "select",
+        "where",
+        "key",
+        "property",
+        "metric",
+        "const",
+        "auto",
+        "datasource",
+        "import",
+        "persist",
+        "rowset",
+        "merge",
+        "show",
+    ]
+)
+EXPRESSION_INDEX = keyword_index(
+    ["and", "or", "not", "in", "between", "like", "is", "null", "true", "false"]
+)
+CLAUSE_INDEXES = {
+    SELECT: keyword_index(["as", "where", "order", "by", "limit"]),
+    WHERE: keyword_index(["select", "order", "by", "limit"]),
+    ORDER: keyword_index(["asc", "desc", "limit"]),
+}
+FUNCTION_INDEX = CandidateIndex(FUNCTION_CANDIDATES)
+
+# Keywords that switch the clause within a statement
+_CLAUSE_KEYWORDS = {
+    "select": SELECT,
+    "where": WHERE,
+    "order": ORDER,
+    "by": ORDER,
+    "limit": LIMIT,
+}
+
+
+def _statement_words(text: str, offset: int) -> List[Tuple[str, int]]:
+    """
+    Lex the statement containing ``offset`` up to ``offset``.
+
+    Returns the lowercased words before the cursor with their parenthesis depth,
+    skipping strings and comments.
+    """
+    words: List[Tuple[str, int]] = []
+    depth = 0
+    idx = 0
+    while idx < offset:
+        char = text[idx]
+        if char in "'\"`":
+            end = text.find(char, idx + 1)
+            idx = offset if end < 0 else end + 1
+        elif char == "#" or text.startswith("//", idx):
+            end = text.find("\n", idx)
+            idx = offset if end < 0 else end + 1
+        elif char == ";":
+            words, depth = [], 0
+            idx += 1
+        elif char in "([":
+            depth += 1
+            idx += 1
+        elif char in ")]":
+            depth = max(depth - 1, 0)
+            idx += 1
+        elif _is_word_char(char):
+            start = idx
+            while idx < offset and _is_word_char(text[idx]):
+                idx += 1
+            words.append((text[start:idx].lower(), depth))
+        else:
+            idx += 1
+    return words
+
+
+def completion_context(text: str, line: int, character: int, prefix: str = "") -> str:
+    """
+    Classify the cursor position from the statement text before it.
+
+    The tree from the last parse is usually stale or missing while a statement is
+    being typed, so this lexes the current statement rather than walking it.
+    """
+    offset = _offset(text, line, character)
+    offset = (len(text) if offset < 0 else offset) - len(prefix)
+    words = _statement_words(text, offset)
+    if not words:
+        return STATEMENT
+    first = words[0][0]
+    if first == "import":
+        return IMPORT
+    if first == "datasource":
+        return DATASOURCE_COLUMNS if words[-1][1] > 0 else GENERAL
+    for word, depth in reversed(words):
+        if depth == 0 and word in _CLAUSE_KEYWORDS:
+            return _CLAUSE_KEYWORDS[word]
+    return GENERAL
+
+
+def context_indexes(
+    document: DocumentIndex,
+    context: str,
+    prefix: str,
+    trigger: Optional[str] = None,
+) -> Tuple[List[CandidateIndex], str, bool]:
+    """
+    Return the indexes relevant at the cursor, the prefix to search them with,
+    and whether either left out candidates the next keystroke may need.
+
+    A dotted prefix searches only the namespace's members. With no prefix (a
+    trigger character), only concepts are offered outside statement starts, so
+    ``,`` and ``.`` never dump the full keyword and function list.
+    """
+    if "." in prefix:
+        namespace, _, member = prefix.rpartition(".")
+        members = document.members.get(namespace)
+        return ([members] if members else []), member, True
+    if trigger == ".":
+        return [], prefix, True
+    if context == STATEMENT:
+        return [STATEMENT_INDEX], prefix, bool(prefix)
+    if context in (IMPORT, LIMIT):
+        return [], prefix, False
+    if not prefix:
+        return [document.concepts], prefix, True
+    if context == DATASOURCE_COLUMNS:
+        return [document.concepts], prefix, True
+    if context == GENERAL:
+        return [document.concepts, STATIC_INDEX, document.datasources], prefix, True
+    indexes = [document.concepts, FUNCTION_INDEX, CLAUSE_INDEXES[context]]
+    if context == WHERE:
+        indexes.append(EXPRESSION_INDEX)
+    return indexes, prefix, True
+
+
+def complete(
+    indexes: Sequence[CandidateIndex],
+    prefix: str,
+    limit: Optional[int] = None,
+    cache: Optional[ScoreCache] = None,
+) -> Tuple[List[CompletionItem], bool]:
+    """Return ranked completion items for ``prefix`` and whether the list is partial."""
+    candidates, truncated = top_candidates(
+        indexes, prefix, limit or MAX_COMPLETION_ITEMS, cache
+    )
+    return [
+        to_completion_item(c, rank, prefix) for rank, c in enumerate(candidates)
+    ], truncated
@@ -0,0 +1,191 @@
+"""Pull diagnostic reports, with result ids so unchanged results are not resent."""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from lsprotocol import converters
+from lsprotocol.types import (
+    Diagnostic,
+    RelatedFullDocumentDiagnosticReport,
+    RelatedUnchangedDocumentDiagnosticReport,
+    WorkspaceFullDocumentDiagnosticReport,
+    WorkspaceUnchangedDocumentDiagnosticReport,
+)
+from pygls.uris import from_fs_path
+
+from trilogy_language_server.error_reporting import get_statement_diagnostics
+from trilogy_language_server.imports import file_imports
+from trilogy_language_server.result_cache import files_fingerprint
+from trilogy_language_server.semantic import SemanticDiagnostics
+from trilogy_language_server.statements import StatementTreeCache
+
+TRILOGY_EXTENSIONS = (".preql",)
+# Directories never holding user models
+SKIPPED_DIRECTORIES = {".git", "node_modules", "__pycache__", ".venv", "venv"}
+
+_converter = converters.get_converter()
+
+DocumentReport = Union[
+    RelatedFullDocumentDiagnosticReport, RelatedUnchangedDocumentDiagnosticReport
+]
+WorkspaceReport = Union[
+    WorkspaceFullDocumentDiagnosticReport, WorkspaceUnchangedDocumentDiagnosticReport
+]
+
+
+def result_id(diagnostics: List[Diagnostic]) -> str:
+    """
+    Identify a diagnostic result by its content.
+
+    Edits that leave the diagnostics unchanged keep the same id, so the client
+    is told the result is unchanged instead of being sent it again.
+    """
+    payload = json.dumps(_converter.unstructure(diagnostics), sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def document_report(
+    diagnostics: List[Diagnostic], previous_result_id: Optional[str]
+) -> DocumentReport:
+    current = result_id(diagnostics)
+    if current == previous_result_id:
+        return RelatedUnchangedDocumentDiagnosticReport(result_id=current)
+    return RelatedFullDocumentDiagnosticReport(items=diagnostics, result_id=current)
+
+
+def workspace_files(roots: Iterable[Path]) -> Iterator[Path]:
+    """Yield the Trilogy files under each root, skipping tool directories."""
+    seen = set()
+    for root in roots:
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = sorted(
+                name for name in subdirectories if name not in SKIPPED_DIRECTORIES
+            )
+            for name in sorted(files):
+                path = Path(directory) / name
+                if path.suffix in TRILOGY_EXTENSIONS and path not in seen:
+                    seen.add(path)
+                    yield path
+
+
+class FileResult(NamedTuple):
+    mtime_ns: int
+    size: int
+    result_id: str
+    diagnostics: List[Diagnostic]
+    # fingerprint of the files it imports, transitively
+    imports: str
+
+
+def check_file(path: Path) -> Optional[FileResult]:
+    """
+    Check a file from disk, or return None if it cannot be read.
+
+    Module level so it can run in worker processes.
+    """
+    try:
+        stat = path.stat()
+        text = path.read_text(encoding="utf-8")
+        imports = files_fingerprint(file_imports(path))
+    except (OSError, UnicodeDecodeError):
+        return None
+    statement_trees = StatementTreeCache()
+    _, diagnostics = get_statement_diagnostics(text, statement_trees)
+    semantic = SemanticDiagnostics().run(statement_trees.statements, path.parent)
+    diagnostics = diagnostics + (semantic or [])
+    return FileResult(
+        stat.st_mtime_ns, stat.st_size, result_id(diagnostics), diagnostics, imports
+    )
+
+
+class WorkspaceDiagnostics:
+    """
+    Diagnostics for files that are not open in the editor.
+
+    Files are checked from disk and their results kept until the file, or a
+    file it imports, changes modification time or size. Results are shared by
+    the event loop and executor threads, so access is guarded by ``lock``.
+    """
+
+    def __init__(self) -> None:
+        self.results: Dict[Path, FileResult] = {}
+        self.lock = threading.Lock()
+        # files checked from disk, for tests and metrics
+        self.checked = 0
+
+    def fresh(self, path: Path) -> Optional[FileResult]:
+        """Return the cached result for ``path`` if the file is unchanged."""
+        with self.lock:
+            cached = self.results.get(path)
+        if cached is None:
+            return None
+        try:
+            stat = path.stat()
+            if cached.mtime_ns != stat.st_mtime_ns or cached.size != stat.st_size:
+                return None
+            imports = files_fingerprint(file_imports(path))
+        except OSError:
+            return None
+        # an importer's diagnostics change with the files it imports
+        return cached if imports == cached.imports else None
+
+    def store(self, path: Path, result: Optional[FileResult]) -> None:
+        with self.lock:
+            self.checked += 1
+            if result is None:
+                self.results.pop(path, None)
+            else:
+                self.results[path] = result
+
+    def file_diagnostics(self, path: Path) -> Optional[FileResult]:
+        """Return the diagnostics for ``path``, or None if it cannot be read."""
+        cached = self.fresh(path)
+        if cached is not None:
+            return cached
+        result = check_file(path)
+        self.store(path, result)
+        return result
+
+    def reports(
+        self,
+        roots: Iterable[Path],
+        previous_result_ids: Dict[str, str],
+        skip: Iterable[str] = (),
+    ) -> List[WorkspaceReport]:
+        """Report every file under ``roots`` except the URIs in ``skip``."""
+        skipped = set(skip)
+        reports: List[WorkspaceReport] = []
+        found = set()
+        for path in workspace_files(roots):
+            uri = from_fs_path(str(path))
+            if uri is None or uri in skipped:
+                continue
+            result = self.file_diagnostics(path)
+            if result is None:
+                continue
+            found.add(path)
+            if previous_result_ids.get(uri) == result.result_id:
+                reports.append(
+                    WorkspaceUnchangedDocumentDiagnosticReport(
+                        uri=uri, version=None, result_id=result.result_id
+                    )
+                )
+            else:
+                reports.append(
+                    WorkspaceFullDocumentDiagnosticReport(
+                        uri=uri,
+                        version=None,
+                        items=result.diagnostics,
+                        result_id=result.result_id,
+                    )
+                )
+        # forget deleted files
+        with self.lock:
+            for path in set(self.results) - found:
+                if from_fs_path(str(path)) not in skipped:
+                    del self.results[path]
+        return reports
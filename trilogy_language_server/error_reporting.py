@@ -1,51 +1,221 @@
-from typing import List, Tuple
-import re
+from typing import Any, FrozenSet, List, NamedTuple, Optional, Tuple
 import logging
-from trilogy.parsing.parse_engine_v2 import parse_syntax
 from trilogy.core.exceptions import InvalidSyntaxException
 from trilogy.parsing.v2.syntax import SyntaxNode
+from trilogy_language_server.statements import StatementTreeCache, string_end
 from lsprotocol.types import (
     Diagnostic,
+    DiagnosticSeverity,
     Position,
     Range,
 )
 
+# Parser errors append a rendered snippet of the source after this marker
+_LOCATION_MARKER = "\nLocation:"
 
-# Pattern to extract line/column from InvalidSyntaxException messages.
-# Example: " --> 1:36\n  |..."
-_SYNTAX_ERROR_LOCATION_RE = re.compile(r"-->\s*(\d+):(\d+)")
 
+class SyntaxErrorLocation(NamedTuple):
+    """Where a parse failed, 0-based and relative to the parsed text."""
 
-def _parse_syntax_exception_location(
+    line: int
+    column: int
+    end_line: int
+    end_column: int
+    expected: FrozenSet[str]
+    message: str
+
+
+def _line_starts(text: str) -> List[int]:
+    starts = [0]
+    position = text.find("\n")
+    while position >= 0:
+        starts.append(position + 1)
+        position = text.find("\n", position + 1)
+    return starts
+
+
+def _token_range(text: str, line: int, column: int) -> Tuple[int, int, int, int]:
+    """
+    Range of the token at a position, found by scanning the source text.
+
+    Errors at the end of the text (or of a line) cover the last token before
+    them instead, so they stay visible.
+    """
+    starts = _line_starts(text)
+    line = min(max(line, 0), len(starts) - 1)
+    offset = min(starts[line] + max(column, 0), len(text))
+    line_end = text.find("\n", offset)
+    line_end = len(text) if line_end < 0 else line_end
+    if offset >= line_end or text[offset].isspace():
+        # step back over whitespace to the previous token
+        start = offset
+        while start > 0 and text[start - 1].isspace():
+            start -= 1
+        if start == 0:
+            return line, column, line, column
+        end = start
+        start -= 1
+        while start > 0 and _is_word(text[start - 1]) and _is_word(text[start]):
+            start -= 1
+    else:
+        start = offset
+        char = text[offset]
+        if char in "'\"`":
+            end = string_end(text, offset)
+        elif _is_word(char):
+            end = offset
+            while end < line_end and _is_word(text[end]):
+                end += 1
+        else:
+            end = offset + 1
+    return (*_position(starts, start), *_position(starts, end))
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _position(starts: List[int], offset: int) -> Tuple[int, int]:
+    low, high = 0, len(starts) - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if starts[middle] <= offset:
+            low = middle
+        else:
+            high = middle - 1
+    return low, offset - starts[low]
+
+
+def _error_message(error: InvalidSyntaxException) -> str:
+    """The exception's own message, without the rendered source snippet."""
+    raw = error.args[0] if error.args and isinstance(error.args[0], str) else ""
+    return raw.partition(_LOCATION_MARKER)[0].strip()
+
+
+def _pest_location(
+    raw: str,
+) -> Optional[Tuple[int, int, FrozenSet[str]]]:
+    """
+    Read the position and expected rules from a pest error.
+
+    The native pest parser only reports errors as text, in a fixed layout: the
+    first line is `` --> line:column`` and the last is ``  = expected a, b, or
+    c``. Only those two lines are read.
+    """
+    header, _, rest = raw.partition("\n")
+    marker, _, position = header.strip().partition(" ")
+    if marker != "-->":
+        return None
+    line_text, _, column_text = position.partition(":")
+    if not (line_text.isdigit() and column_text.isdigit()):
+        return None
+    expected: FrozenSet[str] = frozenset()
+    last_line = rest.rpartition("\n")[2].strip()
+    if last_line.startswith("= expected "):
+        names = last_line[len("= expected ") :].replace(", or ", ", ")
+        expected = frozenset(
+            name.strip() for name in names.replace(" or ", ", ").split(",")
+        )
+    return int(line_text), int(column_text), expected
+
+
+def syntax_error_location(
+    error: InvalidSyntaxException, text: str
+) -> SyntaxErrorLocation:
+    """
+    Locate a parse failure from the parser's own error, not the message text.
+
+    Lark errors carry the unexpected token with its span and the set of
+    acceptable terminals. Pest errors are chained as the ``ValueError`` the
+    native parser raised, which is read for its position and expected rules.
+    Without either, the failure is placed at the start of the text.
+    """
+    message = _error_message(error)
+    # lark and pest exceptions are duck-typed so neither backend is imported
+    cause: Any = error.__cause__ or error.__context__
+    line, column = 0, 0
+    expected: FrozenSet[str] = frozenset()
+    token = getattr(cause, "token", None)
+    if token is not None and getattr(token, "line", None) is not None:
+        expected = frozenset(getattr(cause, "accepts", None) or cause.expected)
+        if token.end_line is not None and token.end_column is not None:
+            return SyntaxErrorLocation(
+                token.line - 1,
+                token.column - 1,
+                token.end_line - 1,
+                token.end_column - 1,
+                expected,
+                message,
+            )
+        line, column = token.line - 1, token.column - 1
+    elif isinstance(getattr(cause, "line", None), int) and cause.line > 0:
+        # lark's UnexpectedCharacters and UnexpectedEOF
+        line, column = cause.line - 1, cause.column - 1
+        expected = frozenset(
+            getattr(cause, "allowed", None) or getattr(cause, "expected", None) or ()
+        )
+    elif isinstance(cause, ValueError) and cause.args:
+        located = _pest_location(cause.args[0])
+        if located is not None:
+            line, column = located[0] - 1, located[1] - 1
+            expected = located[2]
+            if message.startswith("-->"):
+                # an uncoded pest error; its message is only the layout above
+                message = "Syntax error: expected " + ", ".join(sorted(expected))
+    return SyntaxErrorLocation(
+        *_token_range(text, line, column), expected, message or "Syntax error"
+    )
+
+
+def _syntax_diagnostic(
     error: InvalidSyntaxException,
-) -> Tuple[int, int]:
-    """Extract line and column from an InvalidSyntaxException message."""
-    m = _SYNTAX_ERROR_LOCATION_RE.search(str(error))
-    if m:
-        return int(m.group(1)), int(m.group(2))
-    return 1, 1
+    text: str,
+    line_offset: int = 0,
+    column_offset: int = 0,
+) -> Diagnostic:
+    location = syntax_error_location(error, text)
 
+    def position(line: int, column: int) -> Position:
+        # columns only shift on the first line of a statement
+        return Position(
+            line + line_offset, column + (column_offset if line == 0 else 0)
+        )
 
-def get_diagnostics(
-    doctext: str,
+    return Diagnostic(
+        Range(
+            position(location.line, location.column),
+            position(location.end_line, location.end_column),
+        ),
+        location.message,
+        severity=DiagnosticSeverity.Error,
+        data={"expected": sorted(location.expected)} if location.expected else None,
+    )
+
+
+def get_statement_diagnostics(
+    doctext: str, cache: StatementTreeCache
 ) -> Tuple[SyntaxNode | None, List[Diagnostic]]:
-    diagnostics: List[Diagnostic] = []
-    parse_tree = None
+    """
+    Parse statement by statement, reporting one diagnostic per broken statement.
 
+    The returned tree holds every statement that parsed, so analysis continues
+    for the rest of the document while one statement is being edited.
+    """
     try:
-        doc = parse_syntax(doctext)
-        parse_tree = doc.tree
-    except InvalidSyntaxException as e:
-        line, column = _parse_syntax_exception_location(e)
-        diagnostics.append(
-            Diagnostic(
-                Range(
-                    Position(line - 1, column - 1),
-                    Position(line - 1, column),
-                ),
-                str(e),
-            )
-        )
+        parse_tree, failures = cache.parse(doctext)
     except Exception:
         logging.exception("parser raised exception")
-    return parse_tree, diagnostics
+        return None, []
+    return parse_tree, [
+        _syntax_diagnostic(
+            failure.error, failure.span.text, failure.span.line, failure.span.column
+        )
+        for failure in failures
+    ]
+
+
+def get_diagnostics(
+    doctext: str,
+) -> Tuple[SyntaxNode | None, List[Diagnostic]]:
+    """Diagnostics for a standalone text, recovering at statement boundaries."""
+    return get_statement_diagnostics(doctext, StatementTreeCache())
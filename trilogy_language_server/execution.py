@@ -0,0 +1,616 @@
+"""Runs queries against a long-lived DuckDB connection per workspace, a page at a time."""
+
+import asyncio
+import datetime
+import json
+import logging
+import threading
+import tomllib
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import duckdb
+from trilogy.scripts.project_config import find_trilogy_config
+
+from trilogy_language_server.result_cache import ResultCache
+from trilogy_language_server.sampling import SampleCache, SampleSource
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Rows per page; DuckDB produces results in vectors of 2048 rows
+DEFAULT_PAGE_SIZE = 2048
+# Seconds DuckDB may spend on a query unless configured otherwise
+DEFAULT_TIMEOUT = 300.0
+# Seconds between progress reports while DuckDB is busy
+PROGRESS_INTERVAL = 0.5
+# Client setting holding the default ``timeout``, ``maxRows`` and ``maxBytes``
+QUERY_SETTING = "trilogyLanguageServer.query"
+
+
+def setup_scripts(root: Path) -> List[Path]:
+    """
+    The SQL scripts the project's ``trilogy.toml`` runs on a new connection.
+
+    They are listed under ``[setup] sql``, relative to the config file.
+    """
+    config = find_trilogy_config(root)
+    if config is None:
+        return []
+    try:
+        setup = tomllib.loads(config.read_text(encoding="utf-8")).get("setup")
+    except (OSError, tomllib.TOMLDecodeError):
+        return []
+    scripts = setup.get("sql") if isinstance(setup, dict) else None
+    if isinstance(scripts, str):
+        scripts = [scripts]
+    if not isinstance(scripts, list):
+        return []
+    return [config.parent / script for script in scripts if isinstance(script, str)]
+
+
+class QueryInterrupted(Exception):
+    """A query was stopped before it completed."""
+
+
+class QueryCancelled(QueryInterrupted):
+    pass
+
+
+class QueryTimeout(QueryInterrupted, TimeoutError):
+    pass
+
+
+class QueryLimits(NamedTuple):
+    """Bounds on a query's execution; None leaves one unbounded."""
+
+    # seconds DuckDB may spend on the query, summed over its pages
+    timeout: Optional[float] = DEFAULT_TIMEOUT
+    # rows returned before the result is cut off
+    max_rows: Optional[int] = None
+    # bytes of Arrow data returned before the result is cut off
+    max_bytes: Optional[int] = None
+
+    def override(self, **limits: Any) -> "QueryLimits":
+        """Replace the limits given; None keeps the current one, 0 removes it."""
+        values = {
+            name: value or None for name, value in limits.items() if value is not None
+        }
+        return self._replace(**values)
+
+
+class QueryProgress(NamedTuple):
+    # seconds DuckDB has spent on the query
+    elapsed: float
+    # rows returned so far
+    rows: int
+    # DuckDB's estimate of the running step's completion, when it has one
+    percentage: Optional[float]
+
+
+class QueryWatch:
+    """
+    Tracks the time DuckDB spends on a query, interrupting the cursor it is
+    running on when the query is cancelled or exceeds its time budget.
+    """
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.timeout = timeout
+        self.spent = 0.0
+        self.rows = 0
+        self.cursor: Any = None
+        self.started: Optional[float] = None
+        self.reason: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def interrupt(self, reason: str = "cancelled") -> None:
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason
+            if self.cursor is not None:
+                self.cursor.interrupt()
+
+    def error(self) -> QueryInterrupted:
+        if self.reason == "timeout":
+            return QueryTimeout(f"Query exceeded its time limit of {self.timeout:g}s")
+        return QueryCancelled("Query was cancelled")
+
+    @contextmanager
+    def running(self, cursor: Any) -> Iterator[None]:
+        """Run a DuckDB call on ``cursor`` within the remaining time budget."""
+        timer: Optional[threading.Timer] = None
+        with self.lock:
+            if self.reason is not None:
+                raise self.error()
+            if self.timeout is not None:
+                remaining = self.timeout - self.spent
+                if remaining <= 0:
+                    self.reason = "timeout"
+                    raise self.error()
+                timer = threading.Timer(remaining, self.interrupt, args=("timeout",))
+                timer.daemon = True
+                timer.start()
+            self.cursor = cursor
+            self.started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if self.reason is None:
+                raise
+            raise self.error() from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with self.lock:
+                self.spent += time.monotonic() - (self.started or time.monotonic())
+                self.cursor = None
+                self.started = None
+
+    def progress(self) -> QueryProgress:
+        with self.lock:
+            elapsed = self.spent
+            percentage: Optional[float] = None
+            if self.started is not None:
+                elapsed += time.monotonic() - self.started
+            if self.cursor is not None:
+                try:
+                    percentage = self.cursor.query_progress()
+                except Exception:
+                    percentage = None
+            return QueryProgress(
+                elapsed,
+                self.rows,
+                percentage if percentage is not None and percentage > 0 else None,
+            )
+
+
+def json_value(value: Any) -> Any:
+    """Convert a result value to something JSON can carry."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, dict):
+        return {str(key): json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+class QueryPage(NamedTuple):
+    columns: List[Dict[str, str]]
+    rows: List[List[Any]]
+    # token to fetch the next page with, None once the result is exhausted
+    cursor: Optional[str]
+    # index of the first row of this page in the full result
+    offset: int
+    # whether the result was read from the result cache
+    cached: bool = False
+    # whether a row or byte limit cut the result off
+    truncated: bool = False
+    # percentage of the root datasources read, when run on their samples
+    sample: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "columns": self.columns,
+            "rows": self.rows,
+            "cursor": self.cursor,
+            "offset": self.offset,
+            "done": self.cursor is None,
+            "cached": self.cached,
+            "truncated": self.truncated,
+            "sample": self.sample,
+        }
+
+
+class QueryCursor:
+    """An open result, read one Arrow record batch at a time within its limits."""
+
+    def __init__(
+        self,
+        connection: Any,
+        reader: Any,
+        watch: QueryWatch,
+        limits: QueryLimits = QueryLimits(),
+        cached: bool = False,
+    ) -> None:
+        self.connection = connection
+        self.reader = reader
+        self.watch = watch
+        self.limits = limits
+        self.cached = cached
+        self.columns = [
+            {"name": field.name, "type": str(field.type)} for field in reader.schema
+        ]
+        self.offset = 0
+        self.bytes = 0
+        self.truncated = False
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _kept_rows(self, batch: Any) -> int:
+        """Rows of ``batch`` that fit within the row and byte limits."""
+        kept = batch.num_rows
+        if self.limits.max_rows is not None:
+            kept = min(kept, self.limits.max_rows - self.offset)
+        if self.limits.max_bytes is not None and batch.nbytes:
+            remaining = self.limits.max_bytes - self.bytes
+            if batch.nbytes > remaining:
+                kept = min(kept, remaining * batch.num_rows // batch.nbytes)
+        return max(kept, 0)
+
+    def read(self) -> Optional[List[List[Any]]]:
+        """Read the next batch as rows, or None once the result is exhausted."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            if self.truncated:
+                return None
+            try:
+                with self.watch.running(self.connection):
+                    batch = self.reader.read_next_batch()
+            except StopIteration:
+                return None
+            kept = self._kept_rows(batch)
+            if kept < batch.num_rows:
+                # stop reading; the rest of the result is never computed
+                batch = batch.slice(0, kept)
+                self.truncated = True
+            columns = [column.to_pylist() for column in batch.columns]
+            rows = [[json_value(value) for value in row] for row in zip(*columns)]
+            self.offset += len(rows)
+            self.bytes += batch.nbytes
+            self.watch.rows = self.offset
+            return rows
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class QueryExecutor:
+    """
+    Executes SQL on one in-memory DuckDB database per workspace.
+
+    Connections are opened on first use and kept, so attached files, settings
+    and temporary tables persist between queries. Each query runs on its own
+    cursor of the workspace connection and is streamed as Arrow record batches;
+    a page is one batch, and the returned cursor token reads the next one
+    without re-running the query or holding the whole result in memory.
+    Unread results are closed after ``idle_timeout`` seconds, and the oldest
+    is closed once more than ``max_cursors`` are open.
+
+    Queries started with a cache key are written to ``results`` as Parquet
+    in one pass and paged from there, so running them again reads the file
+    instead of executing the query.
+
+    Root datasources can be read from deterministic samples instead, taken
+    into ``samples`` once and again only when their files change.
+
+    Each query runs within its ``QueryLimits``: DuckDB is interrupted once
+    the query has spent its time budget, and reading stops at the row or
+    byte limit. Cancelling ``execute`` or ``next_page`` interrupts DuckDB
+    too, and both report progress while DuckDB is busy.
+    """
+
+    def __init__(
+        self,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_cursors: int = 16,
+        idle_timeout: float = 300.0,
+        executor: Optional[Executor] = None,
+        results: Optional[ResultCache] = None,
+        progress_interval: float = PROGRESS_INTERVAL,
+        samples: Optional[SampleCache] = None,
+    ) -> None:
+        self.page_size = page_size
+        self.results = results
+        self.samples = samples
+        self.progress_interval = progress_interval
+        self.max_cursors = max_cursors
+        self.idle_timeout = idle_timeout
+        self.connections: Dict[Path, Any] = {}
+        self.cursors: OrderedDict[str, QueryCursor] = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="trilogy-query"
+        )
+
+    def connection(self, root: Path) -> Any:
+        """
+        The workspace's connection; relative file paths resolve from ``root``.
+
+        A new connection first runs the project's setup scripts.
+        """
+        with self.lock:
+            connection = self.connections.get(root)
+            if connection is None:
+                connection = duckdb.connect()
+                connection.execute("SET GLOBAL file_search_path = ?", [str(root)])
+                for script in setup_scripts(root):
+                    # a broken script should not stop queries that do not need it
+                    try:
+                        connection.execute(script.read_text(encoding="utf-8"))
+                    except (OSError, UnicodeDecodeError, duckdb.Error) as e:
+                        logger.warning("Setup script %s failed: %s", script, e)
+                self.connections[root] = connection
+            return connection
+
+    def cursor(self, root: Path) -> Any:
+        """A new cursor on the workspace's connection, reporting its progress."""
+        cursor = self.connection(root).cursor()
+        cursor.execute("SET enable_progress_bar = true")
+        cursor.execute("SET enable_progress_bar_print = false")
+        return cursor
+
+    def cached_result(
+        self, root: Path, sql: str, key: str, watch: QueryWatch
+    ) -> Tuple[Path, bool]:
+        """
+        The Parquet file holding the result of ``sql``, and whether it was
+        already cached; a missing result is written by running the query.
+        """
+        assert self.results is not None
+        path = self.results.get(key)
+        if path is not None:
+            return path, True
+
+        def write(target: Path) -> None:
+            self.copy(root, sql, target, watch)
+
+        return self.results.put(key, write), False
+
+    def copy(self, root: Path, sql: str, target: Path, watch: QueryWatch) -> None:
+        """Write the result of ``sql`` to ``target`` as Parquet."""
+        query = sql.strip().rstrip(";")
+        location = str(target).replace("'", "''")
+        cursor = self.cursor(root)
+        try:
+            with watch.running(cursor):
+                cursor.execute(f"COPY ({query}) TO '{location}' (FORMAT parquet)")
+        finally:
+            cursor.close()
+
+    def take_samples(
+        self,
+        root: Path,
+        sources: List[SampleSource],
+        percent: float,
+        watch: Optional[QueryWatch] = None,
+    ) -> Dict[str, Path]:
+        """The sample of each source by name, taking those not yet cached."""
+        assert self.samples is not None
+        watch = watch or QueryWatch()
+        return {
+            source.name: self.samples.sample(
+                source,
+                percent,
+                lambda sql, target: self.copy(root, sql, target, watch),
+            )
+            for source in sources
+        }
+
+    def start(
+        self,
+        root: Path,
+        sql: str,
+        page_size: Optional[int] = None,
+        cache_key: Optional[str] = None,
+        limits: QueryLimits = QueryLimits(),
+        watch: Optional[QueryWatch] = None,
+    ) -> QueryPage:
+        """Run ``sql`` and return its first page, via the cache given a key."""
+        self.expire()
+        watch = watch or QueryWatch(limits.timeout)
+        parameters: Optional[List[str]] = None
+        cached = False
+        path: Optional[Path] = None
+        if cache_key is not None and self.results is not None:
+            if limits.max_rows is None and limits.max_bytes is None:
+                path, cached = self.cached_result(root, sql, cache_key, watch)
+            else:
+                # Caching runs the query to completion, which a row or byte
+                # cap is there to avoid: capped queries only read a result
+                # that is already cached
+                path = self.results.get(cache_key)
+                cached = path is not None
+        if path is not None:
+            sql, parameters = "SELECT * FROM read_parquet(?)", [str(path)]
+        cursor = self.cursor(root)
+        try:
+            with watch.running(cursor):
+                cursor.execute(sql, parameters)
+                batch_size = page_size or self.page_size
+                to_reader = getattr(cursor, "to_arrow_reader", None)
+                reader = (
+                    to_reader(batch_size)
+                    if to_reader is not None
+                    else cursor.fetch_record_batch(batch_size)
+                )
+        except Exception:
+            cursor.close()
+            raise
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.cursors[token] = QueryCursor(cursor, reader, watch, limits, cached)
+            while len(self.cursors) > self.max_cursors:
+                self.cursors.popitem(last=False)[1].close()
+        return self.fetch(token)
+
+    def fetch(self, token: str) -> QueryPage:
+        """Return the next page of an open result."""
+        with self.lock:
+            result = self.cursors.get(token)
+            if result is not None:
+                self.cursors.move_to_end(token)
+        if result is None:
+            raise KeyError(f"Unknown or expired query cursor: {token}")
+        offset = result.offset
+        try:
+            rows = result.read()
+        except QueryInterrupted:
+            self.close(token)
+            raise
+        if not rows or result.truncated:
+            self.close(token)
+            return QueryPage(
+                result.columns,
+                rows or [],
+                None,
+                offset,
+                result.cached,
+                result.truncated,
+            )
+        return QueryPage(result.columns, rows, token, offset, result.cached)
+
+    def close(self, token: str) -> bool:
+        with self.lock:
+            result = self.cursors.pop(token, None)
+        if result is None:
+            return False
+        result.close()
+        return True
+
+    def expire(self) -> None:
+        """Close results that have not been read for ``idle_timeout`` seconds."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            stale = [
+                token
+                for token, result in self.cursors.items()
+                if result.last_used < cutoff
+            ]
+        for token in stale:
+            self.close(token)
+
+    async def execute(
+        self,
+        root: Path,
+        sql: str,
+        page_size: Optional[int] = None,
+        cache_key: Optional[str] = None,
+        limits: QueryLimits = QueryLimits(),
+        on_progress: Optional[Callable[[QueryProgress], None]] = None,
+    ) -> QueryPage:
+        watch = QueryWatch(limits.timeout)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor,
+            self.start,
+            root,
+            sql,
+            page_size,
+            cache_key,
+            limits,
+            watch,
+        )
+        return await self._wait(future, watch, on_progress)
+
+    async def next_page(
+        self,
+        token: str,
+        on_progress: Optional[Callable[[QueryProgress], None]] = None,
+    ) -> QueryPage:
+        with self.lock:
+            result = self.cursors.get(token)
+        watch = result.watch if result is not None else QueryWatch()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self.fetch, token)
+        return await self._wait(future, watch, on_progress)
+
+    async def sample(
+        self,
+        root: Path,
+        sources: List[SampleSource],
+        percent: float,
+        limits: QueryLimits = QueryLimits(),
+        on_progress: Optional[Callable[[QueryProgress], None]] = None,
+    ) -> Dict[str, Path]:
+        watch = QueryWatch(limits.timeout)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor, self.take_samples, root, sources, percent, watch
+        )
+        return await self._wait(future, watch, on_progress)
+
+    def explain(
+        self, root: Path, sql: str, watch: Optional[QueryWatch] = None
+    ) -> Dict[str, Any]:
+        """Run ``sql`` under EXPLAIN ANALYZE, returning DuckDB's JSON profile."""
+        watch = watch or QueryWatch()
+        cursor = self.cursor(root)
+        try:
+            with watch.running(cursor):
+                row = cursor.execute(
+                    f"EXPLAIN (ANALYZE, FORMAT JSON) {sql.strip().rstrip(';')}"
+                ).fetchone()
+        finally:
+            cursor.close()
+        if row is None:
+            raise ValueError("EXPLAIN ANALYZE returned no plan")
+        return json.loads(row[-1])
+
+    async def profile(
+        self,
+        root: Path,
+        sql: str,
+        limits: QueryLimits = QueryLimits(),
+        on_progress: Optional[Callable[[QueryProgress], None]] = None,
+    ) -> Dict[str, Any]:
+        watch = QueryWatch(limits.timeout)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self.explain, root, sql, watch)
+        return await self._wait(future, watch, on_progress)
+
+    async def _wait(
+        self,
+        future: "asyncio.Future[T]",
+        watch: QueryWatch,
+        on_progress: Optional[Callable[[QueryProgress], None]],
+    ) -> T:
+        """Await a result, reporting progress and interrupting DuckDB if cancelled."""
+        try:
+            while True:
+                done, _ = await asyncio.wait([future], timeout=self.progress_interval)
+                if done:
+                    return future.result()
+                if on_progress is not None:
+                    on_progress(watch.progress())
+        except asyncio.CancelledError:
+            watch.interrupt()
+            raise
+
+    def shutdown(self) -> None:
+        with self.lock:
+            cursors = list(self.cursors.values())
+            connections = list(self.connections.values())
+            self.cursors.clear()
+            self.connections.clear()
+        for result in cursors:
+            result.close()
+        for connection in connections:
+            connection.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,326 @@
+"""Statement-level formatting, so only the statements being edited are rendered."""
+
+import hashlib
+from bisect import bisect_right
+from dataclasses import dataclass, field, fields
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from lsprotocol.types import Position, Range, TextEdit
+from trilogy.authoring import Concept, DataType, Environment, Purpose
+from trilogy.constants import DEFAULT_NAMESPACE
+from trilogy.core.statements.author import ImportStatement
+from trilogy.parsing.parse_engine_v2 import TopLevelStatementParser
+from trilogy.parsing.render import Renderer
+from trilogy.parsing.v2.import_service import ImportHydrationService, ImportRequest
+from trilogy.parsing.v2.syntax import (
+    SyntaxDocument,
+    SyntaxNode,
+    SyntaxToken,
+    SyntaxTokenKind,
+)
+
+from trilogy_language_server.semantic import StatementHydration
+from trilogy_language_server.statements import StatementSpan
+
+# A replacement of the text between two offsets
+OffsetEdit = Tuple[int, int, str]
+
+
+class LineIndex:
+    """Converts between document offsets and LSP positions."""
+
+    def __init__(self, text: str) -> None:
+        self.starts = [0]
+        position = text.find("\n")
+        while position >= 0:
+            self.starts.append(position + 1)
+            position = text.find("\n", position + 1)
+        self.length = len(text)
+
+    def position(self, offset: int) -> Position:
+        line = bisect_right(self.starts, offset) - 1
+        return Position(line, offset - self.starts[line])
+
+    def offset(self, position: Position) -> int:
+        if position.line >= len(self.starts):
+            return self.length
+        return min(self.starts[position.line] + position.character, self.length)
+
+
+def statement_end(span: StatementSpan) -> int:
+    """Document offset just after the statement, trailing whitespace excluded."""
+    return span.start + len(span.text.rstrip())
+
+
+def _render_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def line_edits(original: str, rendered: str, offset: int) -> List[OffsetEdit]:
+    """
+    Edits turning ``original`` (at ``offset`` in the document) into ``rendered``.
+
+    Only the lines that differ are replaced, so unchanged lines of a statement
+    keep their position for the editor's cursors and markers.
+    """
+    old_lines = original.splitlines(keepends=True)
+    new_lines = rendered.splitlines(keepends=True)
+    starts = [offset]
+    for line in old_lines:
+        starts.append(starts[-1] + len(line))
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        (starts[i1], starts[i2], "".join(new_lines[j1:j2]))
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def _merge(edits: List[OffsetEdit], text: str) -> List[OffsetEdit]:
+    """Join edits that touch, so no two edits share a boundary."""
+    merged: List[OffsetEdit] = []
+    for start, end, new_text in sorted(edits, key=lambda edit: edit[:2]):
+        if merged and merged[-1][1] >= start:
+            last_start, last_end, last_text = merged[-1]
+            merged[-1] = (
+                last_start,
+                max(end, last_end),
+                last_text + text[last_end:start] + new_text,
+            )
+        else:
+            merged.append((start, end, new_text))
+    return merged
+
+
+_REFERENCE_TOKENS = (SyntaxTokenKind.IDENTIFIER, SyntaxTokenKind.WILDCARD_IDENTIFIER)
+
+
+def _references(node: SyntaxNode) -> Iterator[str]:
+    """Yield the concept names written in a statement."""
+    for child in node.children:
+        if isinstance(child, SyntaxToken):
+            if child.kind in _REFERENCE_TOKENS and "*" not in child.value:
+                yield child.value
+        else:
+            yield from _references(child)
+
+
+@dataclass
+class StubImportService(ImportHydrationService):
+    """
+    Import service that records aliased imports instead of parsing them.
+
+    Formatting only needs the names an import brings in, which the document
+    already spells out as ``alias.name``. Standard library imports and imports
+    into the local namespace, whose names cannot be told apart from local
+    ones, are still resolved.
+    """
+
+    stubbed: Set[str] = field(default_factory=set)
+    # aliases whose stubs could not hydrate a statement, loaded for real
+    resolved: Set[str] = field(default_factory=set)
+
+    def execute(self, request: ImportRequest) -> ImportStatement:
+        if (
+            request.is_stdlib
+            or request.alias in (DEFAULT_NAMESPACE, None, "")
+            or request.alias in self.resolved
+        ):
+            return super().execute(request)
+        self.stubbed.add(request.alias)
+        return ImportStatement(
+            alias=request.alias,
+            input_path=request.input_path,
+            path=Path(request.input_path),
+            concepts=request.concepts,
+            leading_dots=request.leading_dots,
+        )
+
+
+class StatementFormatter(StatementHydration[Optional[str]]):
+    """
+    Renders statements one at a time, caching each rendered form.
+
+    A statement that fails to hydrate renders as None and is left untouched.
+    Hashes of the document's statements known to be formatted are kept, so
+    formatting an already formatted document hydrates nothing. Aliased imports
+    are not loaded: each ``alias.name`` a statement references is declared as
+    an untyped stub before it is hydrated, so formatting time depends only on
+    the document being formatted. When a statement referencing stubs fails to
+    hydrate, as stubs cannot say whether a concept is a key or a metric, the
+    imports it references are loaded after all and the statement retried.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.renderer = Renderer()
+        self.formatted: Set[str] = set()
+        # aliases of imports that were stubbed rather than loaded
+        self.stubbed: Set[str] = set()
+        # aliases that are loaded, as their stubs failed a statement
+        self.resolved: Set[str] = set()
+        # the statement importing each stubbed alias, to load it from
+        self.imports: Dict[str, Tuple[str, SyntaxNode]] = {}
+
+    def stub_references(self, environment: Environment, tree: SyntaxNode) -> None:
+        """Declare the stubbed imports' concepts referenced by a statement."""
+        for name in _references(tree):
+            parts = name.split(".")
+            if parts[0] not in self.stubbed:
+                continue
+            # ``alias.key.property`` also needs ``alias.key``
+            for end in range(2, len(parts) + 1):
+                if ".".join(parts[:end]) not in environment.concepts:
+                    environment.add_concept(
+                        Concept(
+                            name=parts[end - 1],
+                            namespace=".".join(parts[: end - 1]),
+                            datatype=DataType.UNKNOWN,
+                            purpose=Purpose.KEY,
+                        )
+                    )
+
+    def check(
+        self, environment: Environment, text: str, tree: SyntaxNode
+    ) -> Optional[str]:
+        try:
+            return self.render(environment, text, tree)
+        except Exception:
+            pass
+        aliases = {name.split(".")[0] for name in _references(tree)} & self.stubbed
+        if not aliases:
+            return None
+        try:
+            for alias in sorted(aliases):
+                self.resolve(environment, alias)
+            return self.render(environment, text, tree)
+        except Exception:
+            return None
+
+    def render(self, environment: Environment, text: str, tree: SyntaxNode) -> str:
+        stubbed = set(self.stubbed)
+        self.stub_references(environment, tree)
+        parser = TopLevelStatementParser(environment=environment)
+        service = parser.hydrator.import_service
+        parser.hydrator.import_service = StubImportService(
+            **{item.name: getattr(service, item.name) for item in fields(service)},
+            stubbed=self.stubbed,
+            resolved=self.resolved,
+        )
+        output = parser.parse(SyntaxDocument(text=text, tree=tree))
+        for alias in self.stubbed - stubbed:
+            self.imports[alias] = (text, tree)
+        return "\n".join(self.renderer.to_string(item) for item in output)
+
+    def resolve(self, environment: Environment, alias: str) -> None:
+        """Replace the stubs of an import with the concepts it really declares."""
+        self.stubbed.discard(alias)
+        self.resolved.add(alias)
+        for name in [
+            name for name in environment.concepts if name.startswith(alias + ".")
+        ]:
+            del environment.concepts[name]
+        text, tree = self.imports[alias]
+        TopLevelStatementParser(environment=environment).parse(
+            SyntaxDocument(text=text, tree=tree)
+        )
+
+    def edits(
+        self,
+        text: str,
+        statements: Sequence[Tuple[StatementSpan, SyntaxNode]],
+        working_path: Path,
+        start: int = 0,
+        end: Optional[int] = None,
+        whole_document: bool = False,
+    ) -> Optional[List[TextEdit]]:
+        """
+        Edits formatting the statements overlapping offsets ``start`` to ``end``.
+
+        Statements after the last selected one are not hydrated at all, and
+        statements that already match their rendered form produce no edit.
+        Formatting the whole document also normalizes the whitespace between
+        statements. Returns None if no selected statement could be rendered.
+        """
+        end = len(text) if end is None else end
+        selected = [
+            idx
+            for idx, (span, _) in enumerate(statements)
+            if span.start <= end and statement_end(span) >= start
+        ]
+        if not selected:
+            return [] if statements else None
+        stale = [
+            idx
+            for idx in selected
+            if _render_hash(statements[idx][0].text.rstrip()) not in self.formatted
+        ]
+        rendered: List[Optional[str]] = []
+        if stale:
+            results = self.statement_results(
+                statements, working_path, limit=stale[-1] + 1
+            )
+            if results is None:
+                return None
+            rendered = results
+        if (
+            stale
+            and len(stale) == len(selected)
+            and all(rendered[idx] is None for idx in stale)
+        ):
+            return None
+
+        edits: List[OffsetEdit] = []
+        # Only hashes of this document's statements, and of the forms they are
+        # being rendered to, are kept
+        formatted = {
+            _render_hash(span.text.rstrip()) for span, _ in statements
+        } & self.formatted
+        for idx in stale:
+            span = statements[idx][0]
+            original = span.text.rstrip()
+            new_text = rendered[idx]
+            if new_text is None:
+                continue
+            formatted.add(_render_hash(new_text))
+            if new_text != original:
+                edits.extend(line_edits(original, new_text, span.start))
+        self.formatted = formatted
+        if whole_document:
+            edits.extend(_gap_edits(text, [span for span, _ in statements]))
+        lines = LineIndex(text)
+        return [
+            TextEdit(
+                range=Range(start=lines.position(s), end=lines.position(e)),
+                new_text=new_text,
+            )
+            for s, e, new_text in _merge(edits, text)
+        ]
+
+
+def _gap_edits(text: str, spans: Sequence[StatementSpan]) -> List[OffsetEdit]:
+    """
+    Normalize the whitespace around statements as the renderer would.
+
+    Statements are separated by a single newline, or a single space when the
+    next one (a trailing comment) starts on the same line. Gaps holding
+    anything but whitespace surround a statement that did not parse and are
+    left alone.
+    """
+    if not spans:
+        return []
+    gaps = [(0, spans[0].start, "")]
+    for previous, span in zip(spans, spans[1:]):
+        gap_start = statement_end(previous)
+        gap = text[gap_start : span.start]
+        gaps.append((gap_start, span.start, "\n" if "\n" in gap else " "))
+    tail_start = statement_end(spans[-1])
+    gaps.append((tail_start, len(text), "\n" if "\n" in text[tail_start:] else ""))
+    return [
+        (gap_start, gap_end, replacement)
+        for gap_start, gap_end, replacement in gaps
+        if text[gap_start:gap_end] != replacement
+        and not text[gap_start:gap_end].strip()
+    ]
@@ -0,0 +1,417 @@
+"""
+Catalog of Trilogy functions for completion and signature help.
+
+The catalog is generated from pytrilogy's function registry (arity, accepted
+argument types and return type) and overlaid with hand-written documentation.
+Only functions the grammar can call by name are listed. It is serialized to
+``function_catalog.json`` at build time and bundled with the packaged server;
+when pytrilogy's version differs, the server regenerates it once per version
+into the user's cache directory.
+
+Regenerate with ``python -m trilogy_language_server.function_catalog``.
+"""
+
+import json
+import logging
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from trilogy_language_server.result_cache import default_cache_directory
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = Path(__file__).parent / "function_catalog.json"
+
+# Hand-written documentation, preferred over the generated descriptions
+FUNCTION_DOCUMENTATION: Dict[str, Dict[str, Any]] = {
+    "count": {
+        "signature": "count(concept) -> int",
+        "description": "Count the number of distinct values of a concept.",
+        "parameters": [
+            {
+                "name": "concept",
+                "description": "The concept to count distinct values of",
+            }
+        ],
+    },
+    "sum": {
+        "signature": "sum(concept) -> numeric",
+        "description": "Calculate the sum of all values of a concept.",
+        "parameters": [
+            {"name": "concept", "description": "The numeric concept to sum"}
+        ],
+    },
+    "avg": {
+        "signature": "avg(concept) -> float",
+        "description": "Calculate the average of all values of a concept.",
+        "parameters": [
+            {"name": "concept", "description": "The numeric concept to average"}
+        ],
+    },
+    "min": {
+        "signature": "min(concept) -> value",
+        "description": "Find the minimum value of a concept.",
+        "parameters": [
+            {"name": "concept", "description": "The concept to find the minimum of"}
+        ],
+    },
+    "max": {
+        "signature": "max(concept) -> value",
+        "description": "Find the maximum value of a concept.",
+        "parameters": [
+            {"name": "concept", "description": "The concept to find the maximum of"}
+        ],
+    },
+    "coalesce": {
+        "signature": "coalesce(value1, value2, ...) -> value",
+        "description": "Return the first non-null value from the arguments.",
+        "parameters": [
+            {"name": "value1", "description": "First value to check"},
+            {"name": "value2", "description": "Second value to check (optional)"},
+        ],
+    },
+    "concat": {
+        "signature": "concat(string1, string2, ...) -> string",
+        "description": "Concatenate multiple strings together.",
+        "parameters": [
+            {"name": "string1", "description": "First string"},
+            {"name": "string2", "description": "Second string"},
+        ],
+    },
+    "len": {
+        "signature": "len(string) -> int",
+        "description": "Return the length of a string.",
+        "parameters": [{"name": "string", "description": "The string to measure"}],
+    },
+    "upper": {
+        "signature": "upper(string) -> string",
+        "description": "Convert a string to uppercase.",
+        "parameters": [{"name": "string", "description": "The string to convert"}],
+    },
+    "lower": {
+        "signature": "lower(string) -> string",
+        "description": "Convert a string to lowercase.",
+        "parameters": [{"name": "string", "description": "The string to convert"}],
+    },
+    "trim": {
+        "signature": "trim(string) -> string",
+        "description": "Remove leading and trailing whitespace from a string.",
+        "parameters": [{"name": "string", "description": "The string to trim"}],
+    },
+    "substring": {
+        "signature": "substring(string, start, length) -> string",
+        "description": "Extract a substring from a string.",
+        "parameters": [
+            {"name": "string", "description": "The source string"},
+            {"name": "start", "description": "Starting position (1-indexed)"},
+            {"name": "length", "description": "Number of characters to extract"},
+        ],
+    },
+    "abs": {
+        "signature": "abs(value) -> numeric",
+        "description": "Return the absolute value of a number.",
+        "parameters": [{"name": "value", "description": "The numeric value"}],
+    },
+    "round": {
+        "signature": "round(value, decimals?) -> numeric",
+        "description": "Round a number to the specified number of decimal places.",
+        "parameters": [
+            {"name": "value", "description": "The numeric value to round"},
+            {
+                "name": "decimals",
+                "description": "Number of decimal places (default: 0)",
+            },
+        ],
+    },
+    "floor": {
+        "signature": "floor(value) -> int",
+        "description": "Round a number down to the nearest integer.",
+        "parameters": [{"name": "value", "description": "The numeric value"}],
+    },
+    "ceil": {
+        "signature": "ceil(value) -> int",
+        "description": "Round a number up to the nearest integer.",
+        "parameters": [{"name": "value", "description": "The numeric value"}],
+    },
+    "date": {
+        "signature": "date(value) -> date",
+        "description": "Convert a string, datetime or timestamp to a date.",
+        "parameters": [{"name": "value", "description": "The value to convert"}],
+    },
+    "year": {
+        "signature": "year(date) -> int",
+        "description": "Extract the year from a date.",
+        "parameters": [{"name": "date", "description": "The date to extract from"}],
+    },
+    "month": {
+        "signature": "month(date) -> int",
+        "description": "Extract the month from a date.",
+        "parameters": [{"name": "date", "description": "The date to extract from"}],
+    },
+    "day": {
+        "signature": "day(date) -> int",
+        "description": "Extract the day from a date.",
+        "parameters": [{"name": "date", "description": "The date to extract from"}],
+    },
+    "cast": {
+        "signature": "cast(value, type) -> value",
+        "description": "Cast a value to a different data type.",
+        "parameters": [
+            {"name": "value", "description": "The value to cast"},
+            {"name": "type", "description": "The target data type"},
+        ],
+    },
+    "case": {
+        "signature": "case(when condition then value, ..., else default) -> value",
+        "description": "Conditional expression that returns different values based on conditions.",
+        "parameters": [
+            {"name": "condition", "description": "Boolean condition to test"},
+            {"name": "value", "description": "Value to return if condition is true"},
+        ],
+    },
+    "nullif": {
+        "signature": "nullif(value1, value2) -> value",
+        "description": "Return NULL if value1 equals value2, otherwise return value1.",
+        "parameters": [
+            {
+                "name": "value1",
+                "description": "The value to compare and potentially return",
+            },
+            {"name": "value2", "description": "The value to compare against"},
+        ],
+    },
+    "like": {
+        "signature": "like(string, pattern) -> bool",
+        "description": "Check if a string matches a pattern (using % and _ wildcards).",
+        "parameters": [
+            {"name": "string", "description": "The string to match"},
+            {"name": "pattern", "description": "The pattern to match against"},
+        ],
+    },
+    "unnest": {
+        "signature": "unnest(array) -> values",
+        "description": "Expand an array into multiple rows.",
+        "parameters": [{"name": "array", "description": "The array to expand"}],
+    },
+    "array_agg": {
+        "signature": "array_agg(value) -> array",
+        "description": "Aggregate values into an array.",
+        "parameters": [{"name": "value", "description": "The values to aggregate"}],
+    },
+}
+
+# Grammar spellings that map to a registry function
+FUNCTION_ALIASES: Dict[str, str] = {
+    "date_trunc": "date_truncate",
+}
+
+# A call in the grammar: ``"name"i "("``, ``"name("i`` or ``/name\(\)/``
+_GRAMMAR_CALL = re.compile(r'"(\w+)"i?\s*"\("|"(\w+)\("i?|/(\w+)\\\(\\\)/')
+
+# Functions with dedicated syntax, described only by their documentation
+SYNTAX_FUNCTIONS = {"case"}
+
+# Accepted-type sets at least this large are rendered as ``any``
+_ANY_TYPE_THRESHOLD = 12
+
+
+def grammar_function_names() -> Set[str]:
+    """Names pytrilogy's grammar parses as function calls, lowercased."""
+    import trilogy.parsing
+
+    grammar = (Path(trilogy.parsing.__file__).parent / "trilogy.lark").read_text()
+    return {
+        name.lower()
+        for match in _GRAMMAR_CALL.finditer(grammar)
+        for name in match.groups()
+        if name
+    }
+
+
+def _type_label(types: Any) -> str:
+    values = sorted(str(getattr(t, "value", t)) for t in types)
+    if "any" in values or len(values) >= _ANY_TYPE_THRESHOLD:
+        return "any"
+    return " | ".join(values)
+
+
+def _argument_types(config: Any) -> List[str]:
+    """Accepted types per declared argument; variadic functions have one entry."""
+    inputs = config.valid_inputs
+    count = max(config.arg_count, 1)
+    if inputs is None:
+        return ["any"] * count
+    if isinstance(inputs, list):
+        return [_type_label(types) for types in inputs]
+    return [_type_label(inputs)] * count
+
+
+def _return_type(config: Any) -> str:
+    if config.output_type_function is not None or config.output_type is None:
+        return "any"
+    return str(getattr(config.output_type, "value", config.output_type))
+
+
+def _parameters(
+    types: List[str], variadic: bool, documented: Optional[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Name the arguments, preferring the documented names.
+
+    The registry models some surface syntax with extra internal arguments (the
+    characters ``trim`` strips, say), so documented arity wins when it differs.
+    """
+    documented_params = (documented or {}).get("parameters", [])
+    if documented_params:
+        if variadic:
+            first = documented_params[0]
+            return [
+                {**first, "name": first["name"].rstrip("0123456789"), "types": types[0]}
+            ]
+        padded = types + ["any"] * (len(documented_params) - len(types))
+        return [
+            {**param, "types": arg_types}
+            for param, arg_types in zip(documented_params, padded)
+        ]
+    parameters = []
+    for idx, arg_types in enumerate(types):
+        label = "value" if arg_types == "any" or " | " in arg_types else arg_types
+        if not variadic and (types.count(arg_types) > 1 or label == "value"):
+            label = f"{label}{idx + 1}" if len(types) > 1 else label
+        parameters.append({"name": label, "description": "", "types": arg_types})
+    return parameters
+
+
+def build_entry(name: str, config: Any, family: str) -> Dict[str, Any]:
+    """Describe one registry function in the catalog's serializable form."""
+    documented = FUNCTION_DOCUMENTATION.get(name)
+    types = _argument_types(config) if config.arg_count != 0 else []
+    variadic = config.arg_count < 0
+    parameters = _parameters(types, variadic, documented)
+    arguments = ", ".join(param["name"] for param in parameters)
+    if variadic:
+        arguments += ", ..."
+    if documented:
+        # the documented signature marks optional arguments and names the
+        # result more precisely than the registry's type functions
+        signature = documented["signature"]
+        return_type = signature.rsplit("-> ", 1)[-1]
+        description = documented["description"]
+    else:
+        return_type = _return_type(config)
+        signature = f"{name}({arguments}) -> {return_type}"
+        description = f"{family.capitalize()} function returning `{return_type}`."
+    return {
+        "name": name,
+        "signature": signature,
+        "description": description,
+        "parameters": parameters,
+        "arg_count": config.arg_count,
+        "return_type": return_type,
+        "purpose": config.output_purpose.value if config.output_purpose else None,
+        "family": family,
+    }
+
+
+def generate_catalog() -> Dict[str, Any]:
+    """Build the catalog from pytrilogy's function registry."""
+    from trilogy import __version__
+    from trilogy.core.functions import FUNCTION_REGISTRY, function_family
+
+    callable_names = grammar_function_names()
+    callable_names.update(
+        name for alias, name in FUNCTION_ALIASES.items() if alias in callable_names
+    )
+    functions: Dict[str, Dict[str, Any]] = {}
+    for function_type, config in FUNCTION_REGISTRY.items():
+        name = function_type.value
+        if name not in callable_names:
+            continue
+        if name in SYNTAX_FUNCTIONS:
+            continue
+        functions[name] = build_entry(name, config, function_family(function_type))
+    # Documented functions with their own syntax, or modelled as operators
+    for name, documented in FUNCTION_DOCUMENTATION.items():
+        if name not in functions:
+            functions[name] = {
+                **documented,
+                "name": name,
+                "arg_count": len(documented["parameters"]),
+                "return_type": documented["signature"].rsplit("-> ", 1)[-1],
+                "purpose": None,
+                "family": "other",
+            }
+    return {
+        "trilogy_version": __version__,
+        "functions": dict(sorted(functions.items())),
+    }
+
+
+def write_catalog(path: Path = CATALOG_PATH) -> Dict[str, Any]:
+    catalog = generate_catalog()
+    path.write_text(json.dumps(catalog, indent=1, sort_keys=True) + "\n")
+    return catalog
+
+
+def default_catalog_directory() -> Path:
+    return default_cache_directory().parent / "function_catalogs"
+
+
+def _read_catalog(path: Path, version: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    try:
+        catalog = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if catalog.get("trilogy_version") != version:
+        return None
+    return catalog["functions"]
+
+
+def load_function_catalog(
+    path: Path = CATALOG_PATH, cache_directory: Optional[Path] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the bundled catalog, or when it is missing or built against a
+    different pytrilogy version, one generated for the installed version.
+
+    A generated catalog is kept in ``cache_directory`` so it is only generated
+    once per version. The bundled file is never written here; the build
+    regenerates it.
+    """
+    from trilogy import __version__
+
+    functions = _read_catalog(path, __version__)
+    if functions is not None:
+        return functions
+    directory = cache_directory or default_catalog_directory()
+    cached = directory / f"function_catalog-{__version__}.json"
+    functions = _read_catalog(cached, __version__)
+    if functions is not None:
+        return functions
+    logger.info("Function catalog is stale, generating one for %s", __version__)
+    catalog = generate_catalog()
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        # written aside and renamed, so concurrent servers never read half a file
+        staging = directory / f".{uuid.uuid4().hex}.json"
+        staging.write_text(json.dumps(catalog, sort_keys=True))
+        os.replace(staging, cached)
+    except OSError as e:
+        logger.info("Could not cache the function catalog: %s", e)
+    return catalog["functions"]
+
+
+def lookup_function(
+    catalog: Dict[str, Dict[str, Any]], name: str
+) -> Optional[Dict[str, Any]]:
+    """Find a function by name or grammar alias, case-insensitively."""
+    name = name.lower()
+    return catalog.get(name) or catalog.get(FUNCTION_ALIASES.get(name, ""))
+
+
+if __name__ == "__main__":
+    written = write_catalog()
+    print(f"Wrote {len(written['functions'])} functions to {CATALOG_PATH}")
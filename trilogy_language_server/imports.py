@@ -0,0 +1,85 @@
+"""The files a document imports, resolved on disk like the parser does."""
+
+import re
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Deque, Iterable, List, Optional, Set, Tuple
+
+from trilogy_language_server.statements import split_statements
+
+_IMPORT_RE = re.compile(r"^\s*import\s+(\.*)([\w.]+)", re.IGNORECASE | re.MULTILINE)
+
+
+def import_targets(path: Path, text: str) -> List[Path]:
+    """
+    Return the files imported by ``path``, resolved like the parser does.
+
+    Imports are relative to the importing file; each leading dot past the first
+    goes up a directory. Standard library imports are skipped.
+    """
+    targets = []
+    for span in split_statements(text):
+        match = _IMPORT_RE.search(span.text)
+        if match is None:
+            continue
+        dots, name = match.groups()
+        parts = name.split(".")
+        if parts[0] == "std":
+            continue
+        root = path.parent
+        for _ in range(max(len(dots) - 1, 0)):
+            root = root.parent
+        targets.append(root.joinpath(*parts[:-1], parts[-1] + ".preql"))
+    return targets
+
+
+@lru_cache(maxsize=1024)
+def _file_imports(path: Path, modified: int, size: int) -> Tuple[Path, ...]:
+    # keyed by the file's stamp, so an unchanged file is read once
+    try:
+        return tuple(import_targets(path, path.read_text(encoding="utf-8")))
+    except (OSError, UnicodeDecodeError):
+        return ()
+
+
+def read_imports(path: Path) -> List[Path]:
+    """The files imported by the file at ``path``, or none if it is unreadable."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return []
+    return list(_file_imports(path, stat.st_mtime_ns, stat.st_size))
+
+
+def _closure(targets: Iterable[Path], exclude: Optional[Path] = None) -> List[Path]:
+    queue: Deque[Path] = deque(targets)
+    found: List[Path] = []
+    seen: Set[Path] = set() if exclude is None else {exclude}
+    while queue:
+        path = queue.popleft()
+        if path in seen or not path.is_file():
+            continue
+        seen.add(path)
+        found.append(path)
+        queue.extend(read_imports(path))
+    return found
+
+
+def imported_files(working_path: Path, texts: Iterable[str]) -> List[Path]:
+    """
+    The existing files statements at ``working_path`` import, transitively.
+
+    Returns an empty list without touching the disk when no statement imports.
+    """
+    targets: List[Path] = []
+    for text in texts:
+        if _IMPORT_RE.search(text):
+            # import_targets resolves from the importing file's directory
+            targets.extend(import_targets(working_path / "_", text))
+    return _closure(targets)
+
+
+def file_imports(path: Path) -> List[Path]:
+    """The existing files the file at ``path`` imports, transitively."""
+    return _closure(read_imports(path), exclude=path)
@@ -0,0 +1,495 @@
+"""Concurrent load driver for the TCP mode of the language server.
+
+Spins up ``python -m trilogy_language_server --tcp`` locally (or attaches to an
+already running server) and fires a configurable mix of didChange / hover /
+completion / references traffic from several concurrent editing sessions.
+
+pygls serves a single client connection per TCP server, so concurrent clients
+are modelled the way an editor multiplexes them: independent sessions, each
+with its own document and request stream, sharing one connection. Requests are
+scheduled open-loop (arrivals do not wait on earlier responses) so queueing in
+the server shows up in the tail latencies instead of being hidden by the driver.
+
+Example::
+
+    python -m trilogy_language_server.load_test --clients 8 --rate 5 \\
+        --duration 30 --mix didChange=4,hover=3,completion=2,references=1
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from lsprotocol.types import (
+    ClientCapabilities,
+    CompletionParams,
+    DidChangeTextDocumentParams,
+    DidOpenTextDocumentParams,
+    HoverParams,
+    InitializeParams,
+    InitializedParams,
+    Position,
+    PublishDiagnosticsParams,
+    ReferenceContext,
+    ReferenceParams,
+    TextDocumentContentChangeWholeDocument,
+    TextDocumentIdentifier,
+    TextDocumentItem,
+    VersionedTextDocumentIdentifier,
+    CancelParams,
+    TEXT_DOCUMENT_COMPLETION,
+    TEXT_DOCUMENT_HOVER,
+    TEXT_DOCUMENT_PUBLISH_DIAGNOSTICS,
+    TEXT_DOCUMENT_REFERENCES,
+    WINDOW_LOG_MESSAGE,
+    WINDOW_SHOW_MESSAGE,
+)
+from pydantic import BaseModel, Field
+from pygls.exceptions import (
+    JsonRpcContentModified,
+    JsonRpcException,
+    JsonRpcRequestCancelled,
+)
+from pygls.lsp.client import LanguageClient
+from pygls.uris import from_fs_path
+
+DID_CHANGE = "didChange"
+HOVER = "hover"
+COMPLETION = "completion"
+REFERENCES = "references"
+
+METHODS = [DID_CHANGE, HOVER, COMPLETION, REFERENCES]
+
+DEFAULT_MIX = "didChange=4,hover=3,completion=2,references=1"
+
+
+class MethodStats(BaseModel):
+    """Latency and outcome counters for a single LSP method."""
+
+    method: str
+    sent: int = 0
+    completed: int = 0
+    errors: int = 0
+    # the server answered with RequestCancelled / ContentModified
+    cancelled: int = 0
+    # no answer within the request timeout; the driver sent $/cancelRequest
+    dropped: int = 0
+    latencies_ms: List[float] = Field(default_factory=list)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "sent": self.sent,
+            "completed": self.completed,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "dropped": self.dropped,
+            "p50_ms": percentile(self.latencies_ms, 50),
+            "p90_ms": percentile(self.latencies_ms, 90),
+            "p99_ms": percentile(self.latencies_ms, 99),
+            "max_ms": max(self.latencies_ms, default=0.0),
+        }
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse a ``method=weight,...`` specification into normalized weights."""
+    weights: Dict[str, float] = {}
+    for part in mix.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, raw_weight = part.partition("=")
+        name = name.strip()
+        if name not in METHODS:
+            raise ValueError(
+                f"Unknown method '{name}' in mix, expected one of {METHODS}"
+            )
+        weight = float(raw_weight) if raw_weight else 1.0
+        if weight < 0:
+            raise ValueError(f"Negative weight for '{name}' in mix")
+        weights[name] = weights.get(name, 0.0) + weight
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Mix must contain at least one positive weight")
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; returns 0.0 for an empty sample."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def build_sample_document(concepts: int = 50) -> Tuple[str, List[Position]]:
+    """
+    Generate a model with ``concepts`` keys/properties/metrics and a few selects.
+
+    Returns the text and the positions of concept references, which are used as
+    hover / completion / references targets.
+    """
+    lines: List[str] = []
+    targets: List[Position] = []
+    keys = max(1, concepts // 3)
+    for idx in range(keys):
+        lines.append(f"key id_{idx} int;")
+        lines.append(f"property id_{idx}.name_{idx} string;")
+        lines.append(f"metric total_{idx} <- count(id_{idx});")
+    lines.append("")
+    for idx in range(keys):
+        lines.append(f"datasource source_{idx} (")
+        lines.append(f"    id_{idx}: id_{idx},")
+        lines.append(f"    name_{idx}: name_{idx},")
+        lines.append(")")
+        lines.append(f"grain (id_{idx})")
+        lines.append(f"address table_{idx};")
+        lines.append("")
+    for idx in range(keys):
+        line = f"select id_{idx}, name_{idx}, total_{idx};"
+        targets.append(Position(line=len(lines), character=line.index("id_") + 1))
+        targets.append(Position(line=len(lines), character=line.index("total_") + 1))
+        lines.append(line)
+    return "\n".join(lines) + "\n", targets
+
+
+class Session:
+    """A single simulated editor: one document, one request stream."""
+
+    def __init__(
+        self,
+        client: LanguageClient,
+        uri: str,
+        text: str,
+        targets: List[Position],
+        stats: Dict[str, MethodStats],
+        timeout: float,
+        rng: random.Random,
+    ) -> None:
+        self.client = client
+        self.uri = uri
+        self.text = text
+        self.targets = targets
+        self.stats = stats
+        self.timeout = timeout
+        self.rng = rng
+        self.version = 1
+        # didChange has no response; its latency is the time until the server
+        # first publishes diagnostics for the changed version, by version
+        self.pending_changes: Dict[int, float] = {}
+
+    def open(self) -> None:
+        self.client.text_document_did_open(
+            DidOpenTextDocumentParams(
+                text_document=TextDocumentItem(
+                    uri=self.uri,
+                    language_id="trilogy",
+                    version=self.version,
+                    text=self.text,
+                )
+            )
+        )
+
+    def on_diagnostics(self, version: Optional[int]) -> None:
+        # later publishes for the same version (semantic checks) are not counted
+        started = self.pending_changes.pop(version, None) if version else None
+        if started is None:
+            return
+        stats = self.stats[DID_CHANGE]
+        stats.completed += 1
+        stats.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+    def expire_changes(self) -> None:
+        """Count didChange notifications that never produced diagnostics."""
+        self.stats[DID_CHANGE].dropped += len(self.pending_changes)
+        self.pending_changes.clear()
+
+    def did_change(self) -> None:
+        self.version += 1
+        # a small, realistic edit: a trailing comment line
+        text = self.text + f"# edit {self.version}\n"
+        self.stats[DID_CHANGE].sent += 1
+        self.pending_changes[self.version] = time.perf_counter()
+        self.client.text_document_did_change(
+            DidChangeTextDocumentParams(
+                text_document=VersionedTextDocumentIdentifier(
+                    uri=self.uri, version=self.version
+                ),
+                content_changes=[TextDocumentContentChangeWholeDocument(text=text)],
+            )
+        )
+
+    def _request_params(self, method: str):
+        position = self.rng.choice(self.targets)
+        document = TextDocumentIdentifier(uri=self.uri)
+        if method == HOVER:
+            return TEXT_DOCUMENT_HOVER, HoverParams(
+                text_document=document, position=position
+            )
+        if method == COMPLETION:
+            return TEXT_DOCUMENT_COMPLETION, CompletionParams(
+                text_document=document, position=position
+            )
+        return TEXT_DOCUMENT_REFERENCES, ReferenceParams(
+            text_document=document,
+            position=position,
+            context=ReferenceContext(include_declaration=True),
+        )
+
+    async def request(self, method: str) -> None:
+        lsp_method, params = self._request_params(method)
+        stats = self.stats[method]
+        msg_id = str(uuid.uuid4())
+        stats.sent += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                self.client.protocol.send_request_async(
+                    lsp_method, params, msg_id=msg_id
+                ),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            stats.dropped += 1
+            self.client.cancel_request(CancelParams(id=msg_id))
+            return
+        except (JsonRpcRequestCancelled, JsonRpcContentModified):
+            stats.cancelled += 1
+            return
+        except JsonRpcException:
+            stats.errors += 1
+            return
+        stats.completed += 1
+        stats.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+    async def run(
+        self,
+        weights: Dict[str, float],
+        rate: float,
+        burst: int,
+        deadline: float,
+        inflight: List["asyncio.Task[None]"],
+    ) -> None:
+        methods = list(weights)
+        probabilities = [weights[m] for m in methods]
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            for method in self.rng.choices(methods, probabilities, k=burst):
+                if method == DID_CHANGE:
+                    self.did_change()
+                else:
+                    inflight.append(asyncio.create_task(self.request(method)))
+
+
+def spawn_server(host: str, port: int) -> subprocess.Popen:
+    """Start the language server in TCP mode."""
+    return subprocess.Popen(
+        [sys.executable, "-m", "trilogy_language_server", "--tcp"]
+        + ["--host", host, "--port", str(port)],
+        cwd=str(Path(__file__).parent.parent),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def connect(client: LanguageClient, host: str, port: int, timeout: float) -> None:
+    """
+    Connect to the server, retrying while it starts up.
+
+    The server shuts down once its first client disconnects, so readiness can't
+    be probed with a throwaway connection; the real client retries instead.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.start_tcp(host, port)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Language server did not start listening on {host}:{port}"
+                )
+            await asyncio.sleep(0.1)
+
+
+async def run_load(
+    host: str,
+    port: int,
+    clients: int,
+    duration: float,
+    rate: float,
+    weights: Dict[str, float],
+    burst: int = 1,
+    timeout: float = 5.0,
+    concepts: int = 50,
+    seed: Optional[int] = None,
+    connect_timeout: float = 30.0,
+) -> Dict[str, MethodStats]:
+    """Drive ``clients`` concurrent sessions for ``duration`` seconds."""
+    stats = {method: MethodStats(method=method) for method in METHODS}
+    rng = random.Random(seed)
+    client = LanguageClient("trilogy-load-test", "v0.1")
+    await connect(client, host, port, connect_timeout)
+    await client.initialize_async(
+        InitializeParams(capabilities=ClientCapabilities(), process_id=None)
+    )
+    client.initialized(InitializedParams())
+
+    text, targets = build_sample_document(concepts)
+    with tempfile.TemporaryDirectory(prefix="trilogy-load-") as directory:
+        workdir = Path(directory)
+        sessions: Dict[str, Session] = {}
+        for idx in range(clients):
+            path = workdir / f"session_{idx}.preql"
+            path.write_text(text)
+            uri = from_fs_path(str(path)) or path.as_uri()
+            sessions[uri] = Session(
+                client, uri, text, targets, stats, timeout, random.Random(rng.random())
+            )
+
+        @client.feature(TEXT_DOCUMENT_PUBLISH_DIAGNOSTICS)
+        def _on_diagnostics(params: PublishDiagnosticsParams) -> None:
+            session = sessions.get(params.uri)
+            if session:
+                session.on_diagnostics(params.version)
+
+        @client.feature(WINDOW_LOG_MESSAGE)
+        @client.feature(WINDOW_SHOW_MESSAGE)
+        def _on_message(params) -> None:
+            pass
+
+        for session in sessions.values():
+            session.open()
+
+        inflight: List["asyncio.Task[None]"] = []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(
+                s.run(weights, rate, burst, deadline, inflight)
+                for s in sessions.values()
+            )
+        )
+        if inflight:
+            await asyncio.gather(*inflight)
+        # give trailing diagnostics one timeout window to arrive
+        await asyncio.sleep(min(timeout, 1.0))
+        for session in sessions.values():
+            session.expire_changes()
+
+        try:
+            await asyncio.wait_for(client.shutdown_async(None), timeout)
+            client.exit(None)
+        except (asyncio.TimeoutError, JsonRpcException):
+            pass
+        await client.stop()
+    return stats
+
+
+def format_report(stats: Dict[str, MethodStats], duration: float) -> str:
+    header = (
+        f"{'method':<12}{'sent':>8}{'ok':>8}{'err':>6}{'cancel':>8}{'drop':>6}"
+        f"{'p50ms':>10}{'p90ms':>10}{'p99ms':>10}{'maxms':>10}"
+    )
+    rows = [header, "-" * len(header)]
+    total = 0
+    for method in METHODS:
+        entry = stats[method]
+        if not entry.sent:
+            continue
+        total += entry.sent
+        s = entry.summary()
+        rows.append(
+            f"{method:<12}{s['sent']:>8}{s['completed']:>8}{s['errors']:>6}"
+            f"{s['cancelled']:>8}{s['dropped']:>6}"
+            f"{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}"
+            f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}"
+        )
+    rows.append(f"{total} messages in {duration:.1f}s ({total / duration:.1f}/s)")
+    return "\n".join(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Load test the Trilogy language server over TCP.",
+        prog="trilogy_language_server.load_test",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Server address")
+    parser.add_argument("--port", type=int, default=2088, help="Server port")
+    parser.add_argument(
+        "--attach",
+        action="store_true",
+        help="Connect to an already running server instead of spawning one",
+    )
+    parser.add_argument(
+        "--clients", type=int, default=4, help="Concurrent editing sessions"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Test length in seconds"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=5.0,
+        help="Mean message arrivals per second, per session",
+    )
+    parser.add_argument(
+        "--burst", type=int, default=1, help="Messages fired per arrival"
+    )
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="method=weight,...")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=5.0,
+        help="Seconds before an unanswered request is cancelled and counted dropped",
+    )
+    parser.add_argument(
+        "--concepts", type=int, default=50, help="Size of the generated model"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Emit a JSON report")
+    args = parser.parse_args(argv)
+
+    weights = parse_mix(args.mix)
+    process = None
+    if not args.attach:
+        process = spawn_server(args.host, args.port)
+    try:
+        stats = asyncio.run(
+            run_load(
+                host=args.host,
+                port=args.port,
+                clients=args.clients,
+                duration=args.duration,
+                rate=args.rate,
+                weights=weights,
+                burst=args.burst,
+                timeout=args.timeout,
+                concepts=args.concepts,
+                seed=args.seed,
+            )
+        )
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    if args.json:
+        print(
+            json.dumps({m: s.summary() for m, s in stats.items() if s.sent}, indent=2)
+        )
+    else:
+        print(format_report(stats, args.duration))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Approximate memory accounting for the per-URI stores on the language server."""
+
+import gc
+import sys
+import tracemalloc
+from types import FunctionType, ModuleType
+from typing import Any, Dict, Iterable, List, Optional
+
+# Shared, effectively immortal objects we never attribute to a cache
+_EXCLUDED_TYPES = (type, ModuleType, FunctionType)
+
+
+def approximate_size(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Approximate the retained size in bytes of ``obj`` and everything it references.
+
+    Walks ``gc.get_referents`` breadth-first, counting each object once. Pass the
+    same ``seen`` set across calls to avoid double counting objects shared
+    between roots.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    pending = [obj]
+    while pending:
+        batch = []
+        for item in pending:
+            if isinstance(item, _EXCLUDED_TYPES) or id(item) in seen:
+                continue
+            seen.add(id(item))
+            size += sys.getsizeof(item, 0)
+            batch.append(item)
+        pending = gc.get_referents(*batch) if batch else []
+    return size
+
+
+def store_report(stores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Report entry counts and approximate sizes per store and per URI.
+
+    Each store is sized independently, so objects shared between stores (an
+    environment referenced from both ``environments`` and a code lens, say) are
+    counted in each of them, while objects shared between URIs of the same store
+    are only counted once.
+    """
+    report: Dict[str, Any] = {}
+    total = 0
+    for name, store in stores.items():
+        seen: set = set()
+        per_uri = {uri: approximate_size(value, seen) for uri, value in store.items()}
+        store_total = sum(per_uri.values())
+        total += store_total
+        report[name] = {
+            "entries": len(store),
+            "bytes": store_total,
+            "uris": dict(sorted(per_uri.items(), key=lambda x: x[1], reverse=True)),
+        }
+    return {"stores": report, "total_bytes": total}
+
+
+class AllocationTracker:
+    """Captures tracemalloc snapshots and diffs them against a baseline."""
+
+    def __init__(self) -> None:
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing() and self.baseline is not None
+
+    def start(self, frames: int = 10) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = self._snapshot()
+
+    def stop(self) -> None:
+        self.baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def diff(self, top: int = 10, rebase: bool = False) -> List[Dict[str, Any]]:
+        """Return the ``top`` allocation sites by growth since the baseline."""
+        if not self.active:
+            raise RuntimeError("Allocation tracking has not been started")
+        assert self.baseline is not None
+        current = self._snapshot()
+        stats = current.compare_to(self.baseline, "lineno")
+        if rebase:
+            self.baseline = current
+        return [format_statistic(stat) for stat in stats[:top]]
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+
+def format_statistic(stat: tracemalloc.StatisticDiff) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    return {
+        "site": f"{frame.filename}:{frame.lineno}",
+        "size_diff": stat.size_diff,
+        "size": stat.size,
+        "count_diff": stat.count_diff,
+        "count": stat.count,
+    }
+
+
+def format_memory_report(report: Dict[str, Any]) -> str:
+    """Render a memory report as human readable text for the client log."""
+    lines = [f"Approximate retained size: {_human(report['total_bytes'])}"]
+    for name, entry in report["stores"].items():
+        lines.append(
+            f"  {name}: {_human(entry['bytes'])} across {entry['entries']} documents"
+        )
+        for uri, size in _take(entry["uris"].items(), 3):
+            lines.append(f"    {uri}: {_human(size)}")
+    allocations = report.get("allocations")
+    if allocations:
+        lines.append("Top allocation sites since baseline:")
+        for site in allocations:
+            lines.append(
+                f"  {site['site']}: {_human(site['size_diff'])}"
+                f" ({site['count_diff']:+d} blocks)"
+            )
+    return "\n".join(lines)
+
+
+def _take(items: Iterable[Any], count: int) -> List[Any]:
+    return [item for _, item in zip(range(count), items)]
+
+
+def _human(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KiB", "MiB"):
+        if abs(value) < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GiB"
@@ -0,0 +1,119 @@
+"""Static complexity metrics of compiled queries, and thresholds flagging them."""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+from trilogy.core.enums import JoinType
+
+# Client setting holding ``maxCtes``, ``maxJoins``, ``maxFanOut`` and
+# ``maxDatasources``
+COMPLEXITY_SETTING = "trilogyLanguageServer.complexity"
+
+
+def _plural(count: int, noun: str) -> str:
+    return f"{count} {noun}" if count == 1 else f"{count} {noun}s"
+
+
+class QueryMetrics(NamedTuple):
+    # CTEs rendered ahead of the final select
+    ctes: int
+    joins: int
+    # joins not keyed on the full grain of their right side, so they may
+    # repeat the rows of their left side
+    fan_out: int
+    # datasources read, by name
+    datasources: List[str]
+
+    def summary(self) -> str:
+        """E.g. ``3 CTEs, 2 joins, 1 fan-out join, 2 datasources``; zeros left out."""
+        parts = [
+            _plural(self.ctes, "CTE"),
+            _plural(self.joins, "join"),
+            _plural(self.fan_out, "fan-out join"),
+            _plural(len(self.datasources), "datasource"),
+        ]
+        return ", ".join(part for part in parts if not part.startswith("0 "))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+
+class ComplexityThresholds(NamedTuple):
+    """Metrics above which a compiled query is flagged; None never flags."""
+
+    max_ctes: Optional[int] = 20
+    max_joins: Optional[int] = 10
+    max_fan_out: Optional[int] = 2
+    max_datasources: Optional[int] = 8
+
+    def override(self, **thresholds: Any) -> "ComplexityThresholds":
+        """Replace the thresholds given; None keeps the current one, 0 removes it."""
+        values = {
+            name: value or None
+            for name, value in thresholds.items()
+            if value is not None
+        }
+        return self._replace(**values)
+
+    def exceeded(self, metrics: QueryMetrics) -> List[str]:
+        """Describe each metric over its threshold."""
+        checks = [
+            (metrics.ctes, self.max_ctes, "CTE"),
+            (metrics.joins, self.max_joins, "join"),
+            (metrics.fan_out, self.max_fan_out, "fan-out join"),
+            (len(metrics.datasources), self.max_datasources, "datasource"),
+        ]
+        return [
+            f"Compiled query has {_plural(value, noun)} (threshold {limit})"
+            for value, limit, noun in checks
+            if limit is not None and value > limit
+        ]
+
+
+def scanned_datasources(cte: Any, cte_names: Set[str]) -> List[str]:
+    """Names of the datasources a CTE reads directly, rather than other CTEs."""
+    source_map: Dict[str, List[str]] = getattr(cte, "source_map", {})
+    return sorted(
+        {
+            source
+            for sources in source_map.values()
+            for source in sources
+            if source and source not in cte_names
+        }
+    )
+
+
+def fans_out(join: Any) -> bool:
+    """Whether a join may match a row of its left side more than once."""
+    right = getattr(join, "right", None)
+    if right is None:
+        # unnesting repeats the row for each element
+        return True
+    grain = getattr(right, "grain", None)
+    if grain is not None and grain.abstract:
+        # a single row
+        return False
+    if getattr(join, "join_type", None) == JoinType.CROSS:
+        return True
+    keys = {pair.right.address for pair in getattr(join, "pairs", None) or []}
+    keys |= {concept.address for concept in getattr(join, "concepts", None) or []}
+    if grain is None or not grain.components:
+        return not keys
+    return not set(grain.components) <= keys
+
+
+def query_metrics(processed: Any) -> QueryMetrics:
+    """Count what a planned query compiles to, without rendering or running it."""
+    ctes = list(getattr(processed, "ctes", []))
+    names = {cte.name for cte in ctes}
+    joins = [join for cte in ctes for join in getattr(cte, "joins", [])]
+    datasources: Set[str] = set()
+    for cte in ctes:
+        datasources.update(scanned_datasources(cte, names))
+    return QueryMetrics(
+        # the last CTE is rendered as the final select, which is not
+        # necessarily the query's base
+        ctes=max(len(ctes) - 1, 0),
+        joins=len(joins),
+        fan_out=len([join for join in joins if fans_out(join)]),
+        datasources=sorted(datasources),
+    )
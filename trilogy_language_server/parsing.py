@@ -7,7 +7,7 @@ from trilogy_language_server.models import (
     ImportInfo,
 )
 from trilogy.parsing.parse_engine_v2 import parse_syntax, TopLevelStatementParser
-from trilogy.parsing.v2.syntax import SyntaxNode, SyntaxToken
+from trilogy.parsing.v2.syntax import SyntaxDocument, SyntaxNode, SyntaxToken
 from typing import List, Union, Dict, Optional, Any
 from lsprotocol.types import (
     CodeLens,
@@ -26,6 +26,8 @@ from trilogy.core.statements.author import (
 )
 from trilogy.dialect.base import BaseDialect
 from trilogy.constants import CONFIG
+from trilogy_language_server.function_catalog import load_function_catalog
+from trilogy_language_server.metrics import QueryMetrics, query_metrics
 
 CONFIG.rendering.parameters = False
 
@@ -119,20 +121,77 @@ def text_to_symbols(text: str) -> List[Token]:
 #     return tokens
 
 
+# Server command profiling the query at a ``{"textDocument", "position"}``
+PROFILE_QUERY_COMMAND = "trilogy.profileQuery"
+
+# Statements compiled to SQL for their lenses
+QUERY_STATEMENTS = (PersistStatement, MultiSelectStatement, SelectStatement)
+
+
+def compile_statements(
+    statements: List[Any],
+    dialect: BaseDialect,
+    environment: Environment,
+    metrics: Optional[Dict[int, QueryMetrics]] = None,
+) -> Dict[int, str]:
+    """
+    Compile every query statement of a document, keyed by statement index.
+
+    Each query is planned and compiled once, on its own against the final
+    environment, so one broken query does not hide the others' SQL. Batching
+    them would share nothing more: trilogy already keeps its build caches
+    (resolved datasources and the concept graph) per environment across
+    calls. Given ``metrics``, the complexity of each compiled query is added
+    to it under the same index.
+    """
+    compiled: Dict[int, str] = {}
+    for idx, stmt in enumerate(statements):
+        if not isinstance(stmt, QUERY_STATEMENTS):
+            continue
+        try:
+            query = dialect.generate_queries(environment, [stmt])[-1]
+            compiled[idx] = dialect.compile_statement(query)
+        except Exception:
+            continue
+        if metrics is not None:
+            metrics[idx] = query_metrics(query)
+    return compiled
+
+
 def parse_statement(
     idx: int,
     x: Union[PersistStatement, MultiSelectStatement, SelectStatement, RawSQLStatement],
     dialect: BaseDialect,
     environment: Environment,
+    sql: Optional[str] = None,
+    uri: Optional[str] = None,
+    metrics: Optional[QueryMetrics] = None,
 ) -> Union[List[CodeLens], None]:
+    """
+    Lenses for one statement; ``sql`` is its compiled query, if already known.
 
-    if isinstance(x, (PersistStatement, MultiSelectStatement, SelectStatement)):
-        processed = dialect.generate_queries(environment, [x])
-        sql = dialect.compile_statement(processed[-1])
+    Given the document's ``uri``, queries can also be profiled, and given
+    their ``metrics`` the Render SQL lens summarizes them.
+    """
+    if isinstance(x, QUERY_STATEMENTS):
+        if sql is None:
+            processed = dialect.generate_queries(environment, [x])
+            sql = dialect.compile_statement(processed[-1])
         if not x.meta:
             return None
         line = x.meta.line_number or 1
-        return [
+        # lets the client ask the server to compile, run or render the statement
+        target = (
+            [
+                {
+                    "textDocument": {"uri": uri},
+                    "position": {"line": line - 1, "character": 0},
+                }
+            ]
+            if uri is not None
+            else []
+        )
+        lenses = [
             CodeLens(
                 range=Range(
                     start=Position(line=line - 1, character=1),
@@ -142,7 +201,7 @@ def parse_statement(
                 command=Command(
                     title="Run Query",
                     command="trilogy.runQuery",
-                    arguments=[sql],
+                    arguments=[sql, *target],
                 ),
             ),
             CodeLens(
@@ -152,12 +211,32 @@ def parse_statement(
                 ),
                 data={"idx": idx},
                 command=Command(
-                    title="Render SQL",
+                    title=(
+                        f"Render SQL ({metrics.summary()})"
+                        if metrics is not None and metrics.summary()
+                        else "Render SQL"
+                    ),
                     command="trilogy.renderQuery",
-                    arguments=[[sql], str(dialect.__class__)],
+                    arguments=[[sql], str(dialect.__class__), *target],
                 ),
             ),
         ]
+        if uri is not None:
+            lenses.append(
+                CodeLens(
+                    range=Range(
+                        start=Position(line=line - 1, character=3),
+                        end=Position(line=line - 1, character=10),
+                    ),
+                    data={"idx": idx},
+                    command=Command(
+                        title="Profile Query",
+                        command=PROFILE_QUERY_COMMAND,
+                        arguments=target,
+                    ),
+                )
+            )
+        return lenses
     elif isinstance(x, RawSQLStatement):
         if not x.meta:
             return None
@@ -172,7 +251,9 @@ def parse_statement(
                 command=Command(
                     title="Run Query",
                     command="trilogy.runQuery",
-                    arguments=[x.text],
+                    # run as written, resolving relative paths from the document
+                    arguments=[x.text]
+                    + ([{"textDocument": {"uri": uri}}] if uri is not None else []),
                 ),
             )
         ]
@@ -180,15 +261,44 @@ def parse_statement(
 
 
 def code_lense_tree(
-    environment: Environment, text, input: SyntaxNode, dialect: BaseDialect
+    environment: Environment,
+    text,
+    input: SyntaxNode,
+    dialect: BaseDialect,
+    uri: Optional[str] = None,
+    metrics: Optional[Dict[int, QueryMetrics]] = None,
 ) -> List[CodeLens]:
+    """
+    Lenses for the statements of a document.
+
+    Given ``metrics``, the complexity of each compiled query is added to it,
+    keyed by the query's first line (0-based).
+    """
     tokens = []
-    doc = parse_syntax(text)
+    # the tree may omit statements that failed to parse, so it is not reparsed
+    doc = SyntaxDocument(text=text, tree=input)
     parser = TopLevelStatementParser(environment=environment)
     pass_two = parser.parse(doc)
+    statement_metrics: Dict[int, QueryMetrics] = {}
+    compiled = compile_statements(pass_two, dialect, environment, statement_metrics)
+    if metrics is not None:
+        for idx, found in statement_metrics.items():
+            meta = pass_two[idx].meta
+            if meta is not None:
+                metrics[(meta.line_number or 1) - 1] = found
     for idx, stmt in enumerate(pass_two):
+        if isinstance(stmt, QUERY_STATEMENTS) and idx not in compiled:
+            continue
         try:
-            x = parse_statement(idx, stmt, dialect, environment=environment)
+            x = parse_statement(
+                idx,
+                stmt,
+                dialect,
+                environment=environment,
+                sql=compiled.get(idx),
+                uri=uri,
+                metrics=statement_metrics.get(idx),
+            )
             if x:
                 tokens += x
         except Exception:
@@ -823,216 +933,4 @@ def get_document_symbols(
 
 
 # Trilogy built-in functions with signature information for signature help
-TRILOGY_FUNCTIONS: dict[str, dict[str, Any]] = {
-    "count": {
-        "signature": "count(concept) -> int",
-        "description": "Count the number of distinct values of a concept.",
-        "parameters": [
-            {
-                "name": "concept",
-                "description": "The concept to count distinct values of",
-            }
-        ],
-    },
-    "sum": {
-        "signature": "sum(concept) -> numeric",
-        "description": "Calculate the sum of all values of a concept.",
-        "parameters": [
-            {"name": "concept", "description": "The numeric concept to sum"}
-        ],
-    },
-    "avg": {
-        "signature": "avg(concept) -> float",
-        "description": "Calculate the average of all values of a concept.",
-        "parameters": [
-            {"name": "concept", "description": "The numeric concept to average"}
-        ],
-    },
-    "min": {
-        "signature": "min(concept) -> value",
-        "description": "Find the minimum value of a concept.",
-        "parameters": [
-            {"name": "concept", "description": "The concept to find the minimum of"}
-        ],
-    },
-    "max": {
-        "signature": "max(concept) -> value",
-        "description": "Find the maximum value of a concept.",
-        "parameters": [
-            {"name": "concept", "description": "The concept to find the maximum of"}
-        ],
-    },
-    "coalesce": {
-        "signature": "coalesce(value1, value2, ...) -> value",
-        "description": "Return the first non-null value from the arguments.",
-        "parameters": [
-            {"name": "value1", "description": "First value to check"},
-            {"name": "value2", "description": "Second value to check (optional)"},
-        ],
-    },
-    "concat": {
-        "signature": "concat(string1, string2, ...) -> string",
-        "description": "Concatenate multiple strings together.",
-        "parameters": [
-            {"name": "string1", "description": "First string"},
-            {"name": "string2", "description": "Second string"},
-        ],
-    },
-    "length": {
-        "signature": "length(string) -> int",
-        "description": "Return the length of a string.",
-        "parameters": [{"name": "string", "description": "The string to measure"}],
-    },
-    "upper": {
-        "signature": "upper(string) -> string",
-        "description": "Convert a string to uppercase.",
-        "parameters": [{"name": "string", "description": "The string to convert"}],
-    },
-    "lower": {
-        "signature": "lower(string) -> string",
-        "description": "Convert a string to lowercase.",
-        "parameters": [{"name": "string", "description": "The string to convert"}],
-    },
-    "trim": {
-        "signature": "trim(string) -> string",
-        "description": "Remove leading and trailing whitespace from a string.",
-        "parameters": [{"name": "string", "description": "The string to trim"}],
-    },
-    "substring": {
-        "signature": "substring(string, start, length) -> string",
-        "description": "Extract a substring from a string.",
-        "parameters": [
-            {"name": "string", "description": "The source string"},
-            {"name": "start", "description": "Starting position (1-indexed)"},
-            {"name": "length", "description": "Number of characters to extract"},
-        ],
-    },
-    "abs": {
-        "signature": "abs(value) -> numeric",
-        "description": "Return the absolute value of a number.",
-        "parameters": [{"name": "value", "description": "The numeric value"}],
-    },
-    "round": {
-        "signature": "round(value, decimals?) -> numeric",
-        "description": "Round a number to the specified number of decimal places.",
-        "parameters": [
-            {"name": "value", "description": "The numeric value to round"},
-            {
-                "name": "decimals",
-                "description": "Number of decimal places (default: 0)",
-            },
-        ],
-    },
-    "floor": {
-        "signature": "floor(value) -> int",
-        "description": "Round a number down to the nearest integer.",
-        "parameters": [{"name": "value", "description": "The numeric value"}],
-    },
-    "ceil": {
-        "signature": "ceil(value) -> int",
-        "description": "Round a number up to the nearest integer.",
-        "parameters": [{"name": "value", "description": "The numeric value"}],
-    },
-    "date": {
-        "signature": "date(year, month, day) -> date",
-        "description": "Create a date from year, month, and day components.",
-        "parameters": [
-            {"name": "year", "description": "The year"},
-            {"name": "month", "description": "The month (1-12)"},
-            {"name": "day", "description": "The day of the month"},
-        ],
-    },
-    "year": {
-        "signature": "year(date) -> int",
-        "description": "Extract the year from a date.",
-        "parameters": [{"name": "date", "description": "The date to extract from"}],
-    },
-    "month": {
-        "signature": "month(date) -> int",
-        "description": "Extract the month from a date.",
-        "parameters": [{"name": "date", "description": "The date to extract from"}],
-    },
-    "day": {
-        "signature": "day(date) -> int",
-        "description": "Extract the day from a date.",
-        "parameters": [{"name": "date", "description": "The date to extract from"}],
-    },
-    "now": {
-        "signature": "now() -> timestamp",
-        "description": "Return the current timestamp.",
-        "parameters": [],
-    },
-    "today": {
-        "signature": "today() -> date",
-        "description": "Return the current date.",
-        "parameters": [],
-    },
-    "cast": {
-        "signature": "cast(value, type) -> value",
-        "description": "Cast a value to a different data type.",
-        "parameters": [
-            {"name": "value", "description": "The value to cast"},
-            {"name": "type", "description": "The target data type"},
-        ],
-    },
-    "case": {
-        "signature": "case(when condition then value, ..., else default) -> value",
-        "description": "Conditional expression that returns different values based on conditions.",
-        "parameters": [
-            {"name": "condition", "description": "Boolean condition to test"},
-            {"name": "value", "description": "Value to return if condition is true"},
-        ],
-    },
-    "if": {
-        "signature": "if(condition, then_value, else_value) -> value",
-        "description": "Return one of two values based on a condition.",
-        "parameters": [
-            {"name": "condition", "description": "Boolean condition to test"},
-            {
-                "name": "then_value",
-                "description": "Value to return if condition is true",
-            },
-            {
-                "name": "else_value",
-                "description": "Value to return if condition is false",
-            },
-        ],
-    },
-    "nullif": {
-        "signature": "nullif(value1, value2) -> value",
-        "description": "Return NULL if value1 equals value2, otherwise return value1.",
-        "parameters": [
-            {
-                "name": "value1",
-                "description": "The value to compare and potentially return",
-            },
-            {"name": "value2", "description": "The value to compare against"},
-        ],
-    },
-    "like": {
-        "signature": "like(string, pattern) -> bool",
-        "description": "Check if a string matches a pattern (using % and _ wildcards).",
-        "parameters": [
-            {"name": "string", "description": "The string to match"},
-            {"name": "pattern", "description": "The pattern to match against"},
-        ],
-    },
-    "unnest": {
-        "signature": "unnest(array) -> values",
-        "description": "Expand an array into multiple rows.",
-        "parameters": [{"name": "array", "description": "The array to expand"}],
-    },
-    "array_agg": {
-        "signature": "array_agg(value) -> array",
-        "description": "Aggregate values into an array.",
-        "parameters": [{"name": "value", "description": "The values to aggregate"}],
-    },
-    "string_agg": {
-        "signature": "string_agg(value, separator) -> string",
-        "description": "Concatenate values into a string with a separator.",
-        "parameters": [
-            {"name": "value", "description": "The values to concatenate"},
-            {"name": "separator", "description": "The separator between values"},
-        ],
-    },
-}
+TRILOGY_FUNCTIONS: Dict[str, Dict[str, Any]] = load_function_catalog()
@@ -0,0 +1,182 @@
+"""Profiles compiled queries with DuckDB's EXPLAIN ANALYZE, attributed per CTE."""
+
+import re
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from trilogy.core.statements.execute import ProcessedQuery
+
+from trilogy_language_server.metrics import scanned_datasources
+
+# CTEs taking at least this share of the query's operator time are hot
+HOT_SHARE = 0.1
+# At most this many hot CTEs are pointed out in the document
+HOT_LIMIT = 3
+# Operators listed per CTE
+OPERATOR_LIMIT = 3
+
+
+def materialize_ctes(sql: str, names: Sequence[str]) -> str:
+    """
+    Mark the named CTEs ``AS MATERIALIZED``.
+
+    DuckDB inlines most CTEs into the query that reads them, which leaves no
+    trace of them in the profile; a materialized CTE is profiled as its own
+    ``CTE`` operator, so its time can be attributed to it.
+    """
+    for name in names:
+        sql = re.sub(
+            rf'^((?:WITH\s+)?"?{re.escape(name)}"?\s+as)\s+\(',
+            r"\1 MATERIALIZED (",
+            sql,
+            count=1,
+            flags=re.IGNORECASE | re.MULTILINE,
+        )
+    return sql
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    return f"{seconds * 1000:.1f} ms"
+
+
+class CteTiming(NamedTuple):
+    seconds: float
+    rows: int
+    operators: List[Tuple[str, float]]
+
+
+def _operator_name(node: Dict[str, Any]) -> str:
+    return str(node.get("operator_name") or node.get("operator_type") or "")
+
+
+def cte_timings(plan: Dict[str, Any], final: str) -> Dict[str, CteTiming]:
+    """
+    Sum the operator time of an EXPLAIN ANALYZE JSON plan per CTE.
+
+    A ``CTE`` operator's first child computes the CTE and its second reads
+    it, so operators are attributed to the innermost CTE being computed, and
+    to ``final`` outside of any.
+    """
+    seconds: Dict[str, float] = {}
+    # the first operator seen in a context is the one producing its rows
+    rows: Dict[str, int] = {}
+    operators: Dict[str, List[Tuple[str, float]]] = {}
+
+    def walk(node: Dict[str, Any], context: str) -> None:
+        name = _operator_name(node)
+        timing = float(node.get("operator_timing") or 0.0)
+        children = node.get("children") or []
+        if name == "CTE" and children:
+            cte = str((node.get("extra_info") or {}).get("CTE Name") or context)
+            seconds[cte] = seconds.get(cte, 0.0) + timing
+            walk(children[0], cte)
+            for child in children[1:]:
+                walk(child, context)
+            return
+        if name and name != "EXPLAIN_ANALYZE":
+            seconds[context] = seconds.get(context, 0.0) + timing
+            operators.setdefault(context, []).append((name, timing))
+            rows.setdefault(context, int(node.get("operator_cardinality") or 0))
+        for child in children:
+            walk(child, context)
+
+    walk(plan, final)
+    return {
+        cte: CteTiming(
+            seconds.get(cte, 0.0),
+            rows.get(cte, 0),
+            sorted(operators.get(cte, []), key=lambda item: -item[1])[:OPERATOR_LIMIT],
+        )
+        for cte in set(seconds) | set(rows)
+    }
+
+
+class CteProfile(NamedTuple):
+    name: str
+    seconds: float
+    rows: int
+    # the most expensive operators, as (operator, seconds)
+    operators: List[Tuple[str, float]]
+    # concepts the CTE derives, rather than passes through
+    concepts: List[str]
+    # datasources the CTE scans
+    datasources: List[str]
+
+
+class QueryProfile(NamedTuple):
+    # hash of the profiled statement's text, to find it again after edits
+    statement: str
+    # wall time of the query
+    seconds: float
+    rows: int
+    # most expensive first
+    ctes: List[CteProfile]
+
+    def share(self, cte: CteProfile) -> float:
+        total = sum(item.seconds for item in self.ctes)
+        return cte.seconds / total if total else 0.0
+
+    def hot(self) -> List[CteProfile]:
+        return [cte for cte in self.ctes if self.share(cte) >= HOT_SHARE][:HOT_LIMIT]
+
+    def to_markdown(self) -> str:
+        lines = [
+            f"**Query profile**: {format_seconds(self.seconds)}, {self.rows:,} rows",
+            "",
+            "| CTE | Time | Share | Rows | Operators | Derives |",
+            "|---|---|---|---|---|---|",
+        ]
+        for cte in self.ctes:
+            operators = ", ".join(
+                f"{name} {format_seconds(seconds)}" for name, seconds in cte.operators
+            )
+            derives = ", ".join(cte.concepts + cte.datasources)
+            lines.append(
+                f"| {cte.name} | {format_seconds(cte.seconds)} "
+                f"| {self.share(cte):.0%} | {cte.rows:,} | {operators} | {derives} |"
+            )
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "ctes": [{**cte._asdict(), "share": self.share(cte)} for cte in self.ctes],
+        }
+
+
+def build_profile(
+    processed: ProcessedQuery, plan: Dict[str, Any], statement: str
+) -> QueryProfile:
+    """Attribute a profiled plan to the CTEs of the query it was compiled to."""
+    names = {cte.name for cte in processed.ctes}
+    # the last CTE is rendered as the final select, outside any CTE operator
+    final = processed.ctes[-1].name
+    timings = cte_timings(plan, final)
+    ctes = []
+    for cte in processed.ctes:
+        timing = timings.get(cte.name, CteTiming(0.0, 0, []))
+        source_map: Dict[str, List[str]] = getattr(cte, "source_map", {})
+        concepts = [
+            column.address
+            for column in cte.output_columns
+            if not source_map.get(column.address)
+        ]
+        ctes.append(
+            CteProfile(
+                cte.name,
+                timing.seconds,
+                timing.rows,
+                timing.operators,
+                list(dict.fromkeys(concepts)),
+                scanned_datasources(cte, names),
+            )
+        )
+    ctes.sort(key=lambda cte: -cte.seconds)
+    return QueryProfile(
+        statement,
+        float(plan.get("latency") or 0.0),
+        timings.get(final, CteTiming(0.0, 0, [])).rows,
+        ctes,
+    )
@@ -0,0 +1,232 @@
+"""Compiles statements to SQL for several dialects, caching each dialect's output."""
+
+import asyncio
+import hashlib
+import tomllib
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from trilogy.authoring import Environment
+from trilogy.dialect.base import BaseDialect
+from trilogy.dialect.enums import Dialects
+from trilogy.parsing.parse_engine_v2 import TopLevelStatementParser
+from trilogy.parsing.v2.syntax import SyntaxDocument, SyntaxNode
+from trilogy.scripts.project_config import find_trilogy_config
+
+from trilogy_language_server.metrics import scanned_datasources
+from trilogy_language_server.parsing import QUERY_STATEMENTS
+
+DEFAULT_DIALECTS = [Dialects.DUCK_DB.value]
+# Client setting listing the dialects to render, per workspace folder
+DIALECT_SETTING = "trilogyLanguageServer.activeDialect"
+
+# (statement hash, environment fingerprint)
+CacheKey = Tuple[str, str]
+
+
+def dialect_name(name: str) -> str:
+    """Normalize a dialect name, e.g. ``duckdb`` to ``duck_db``."""
+    return Dialects(name.strip().lower()).value
+
+
+def _unique_dialects(names: Sequence[Any]) -> List[str]:
+    dialects: List[str] = []
+    for name in names:
+        try:
+            dialect = dialect_name(str(name))
+        except ValueError:
+            continue
+        if dialect not in dialects:
+            dialects.append(dialect)
+    return dialects
+
+
+def workspace_dialects(
+    root: Path, settings: Optional[Sequence[Any]] = None
+) -> List[str]:
+    """
+    The dialects to render for a workspace.
+
+    The engine dialect of the project's ``trilogy.toml`` comes first, followed
+    by the dialects from the client's settings. Unknown names are ignored.
+    """
+    names: List[Any] = []
+    config = find_trilogy_config(root)
+    if config is not None:
+        try:
+            engine = tomllib.loads(config.read_text(encoding="utf-8")).get("engine")
+        except (OSError, tomllib.TOMLDecodeError):
+            engine = None
+        if isinstance(engine, dict) and isinstance(engine.get("dialect"), str):
+            names.append(engine["dialect"])
+    if isinstance(settings, str):
+        settings = [settings]
+    names.extend(settings or [])
+    return _unique_dialects(names) or list(DEFAULT_DIALECTS)
+
+
+class CompiledQuery(NamedTuple):
+    sql: str
+    # names of the datasources the query reads
+    datasources: Tuple[str, ...]
+
+
+class CompiledQueryCache:
+    """A bounded LRU of compiled queries for one dialect."""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.entries: OrderedDict[CacheKey, CompiledQuery] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: CacheKey) -> Optional[CompiledQuery]:
+        compiled = self.entries.get(key)
+        if compiled is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return compiled
+
+    def put(self, key: CacheKey, compiled: CompiledQuery) -> None:
+        self.entries[key] = compiled
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class RenderedSql(NamedTuple):
+    dialect: str
+    sql: Optional[str]
+    error: Optional[str]
+    cached: bool
+    # names of the datasources the query reads, for the server's own use
+    datasources: Tuple[str, ...] = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = self._asdict()
+        del result["datasources"]
+        return result
+
+
+def statement_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class SqlRenderer:
+    """
+    Compiles one statement for several dialects at once.
+
+    Each dialect compiles in its own thread against its own copy of the
+    environment, as planning writes to the environment's caches. Results are
+    kept in a per-dialect LRU keyed by the statement's hash and the
+    fingerprint of the environment it was compiled against.
+    """
+
+    def __init__(self, maxsize: int = 256, executor: Optional[Executor] = None) -> None:
+        self.maxsize = maxsize
+        self.dialects: Dict[str, BaseDialect] = {}
+        self.caches: Dict[str, CompiledQueryCache] = {}
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="trilogy-render"
+        )
+
+    def dialect(self, name: str) -> BaseDialect:
+        name = dialect_name(name)
+        if name not in self.dialects:
+            self.dialects[name] = Dialects(name).default_renderer()
+        return self.dialects[name]
+
+    def cache(self, name: str) -> CompiledQueryCache:
+        name = dialect_name(name)
+        if name not in self.caches:
+            self.caches[name] = CompiledQueryCache(self.maxsize)
+        return self.caches[name]
+
+    def plan(
+        self, name: str, environment: Environment, text: str, tree: SyntaxNode
+    ) -> Any:
+        """Plan a query statement, hydrating it into ``environment``."""
+        output = TopLevelStatementParser(environment=environment).parse(
+            SyntaxDocument(text=text, tree=tree)
+        )
+        queries = [item for item in output if isinstance(item, QUERY_STATEMENTS)]
+        if not queries:
+            raise ValueError("Only select, multiselect and persist statements render")
+        return self.dialect(name).generate_queries(environment, queries)[-1]
+
+    def compile(
+        self, name: str, environment: Environment, text: str, tree: SyntaxNode
+    ) -> CompiledQuery:
+        """Compile a query statement, hydrating it into ``environment``."""
+        processed = self.plan(name, environment, text, tree)
+        names = {cte.name for cte in processed.ctes}
+        datasources = {
+            datasource
+            for cte in processed.ctes
+            for datasource in scanned_datasources(cte, names)
+        }
+        return CompiledQuery(
+            self.dialect(name).compile_statement(processed), tuple(sorted(datasources))
+        )
+
+    async def render(
+        self,
+        names: Sequence[str],
+        environment: Environment,
+        fingerprint: str,
+        text: str,
+        tree: SyntaxNode,
+    ) -> List[RenderedSql]:
+        """Render ``text`` for each dialect, compiling the uncached ones concurrently."""
+        key = (statement_hash(text), fingerprint)
+        results: Dict[str, RenderedSql] = {}
+        pending: Dict[str, "asyncio.Future[CompiledQuery]"] = {}
+        loop = asyncio.get_running_loop()
+        dialects: List[str] = []
+        for requested in names:
+            try:
+                name = dialect_name(requested)
+            except ValueError:
+                name = requested
+                results[name] = RenderedSql(name, None, "Unknown dialect", False)
+            if name in dialects:
+                continue
+            dialects.append(name)
+            if name in results:
+                continue
+            cached = self.cache(name).get(key)
+            if cached is not None:
+                results[name] = RenderedSql(
+                    name, cached.sql, None, True, cached.datasources
+                )
+                continue
+            # copied on the loop, so the document's environment is not read
+            # while the server updates it
+            pending[name] = loop.run_in_executor(
+                self.executor,
+                self.compile,
+                name,
+                environment.duplicate(),
+                text,
+                tree,
+            )
+        compiled = await asyncio.gather(*pending.values(), return_exceptions=True)
+        for name, outcome in zip(pending, compiled):
+            if isinstance(outcome, BaseException):
+                results[name] = RenderedSql(name, None, str(outcome), False)
+            else:
+                self.cache(name).put(key, outcome)
+                results[name] = RenderedSql(
+                    name, outcome.sql, None, False, outcome.datasources
+                )
+        return [results[name] for name in dialects]
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
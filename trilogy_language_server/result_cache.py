@@ -0,0 +1,171 @@
+"""Query results stored on disk as Parquet, keyed by their SQL and source files."""
+
+import glob
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from trilogy.authoring import Environment
+from trilogy.core.enums import AddressType
+from trilogy.core.models.datasource import Address
+
+# Total size of cached results before the least recently used are removed
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Addresses that are never local files
+_NON_FILE_ADDRESSES = (
+    AddressType.QUERY,
+    AddressType.PYTHON_SCRIPT,
+    AddressType.EXECUTABLE,
+    AddressType.SQL,
+)
+
+
+def default_cache_directory() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "trilogy-language-server" / "results"
+
+
+def local_files(address: Address | str, root: Path) -> List[Path]:
+    """
+    The existing files a datasource address names, relative ones resolved from
+    ``root``; empty for addresses that are not local files.
+    """
+    if isinstance(address, str):
+        location = address
+    elif address.type in _NON_FILE_ADDRESSES:
+        return []
+    else:
+        location = address.location
+    path = Path(location)
+    if not path.is_absolute():
+        path = root / path
+    if glob.has_magic(location):
+        return sorted(
+            Path(match) for match in glob.glob(str(path)) if os.path.isfile(match)
+        )
+    return [path] if path.is_file() else []
+
+
+def files_fingerprint(files: Iterable[Path]) -> str:
+    """Fingerprint files by path, size and modification time."""
+    stamps: Set[Tuple[str, int, int]] = set()
+    for path in files:
+        stat = path.stat()
+        stamps.add((str(path), stat.st_size, stat.st_mtime_ns))
+    digest = hashlib.sha1()
+    for stamp in sorted(stamps):
+        digest.update(repr(stamp).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def datasource_fingerprint(
+    environment: Environment, root: Path, datasources: Iterable[str]
+) -> Optional[str]:
+    """
+    Fingerprint the local files the named datasources of ``environment`` read.
+
+    Each file contributes its path, size and modification time, so rewriting a
+    file changes the fingerprint. Returns None when a datasource is not a local
+    file, such as a table or a query, as its result cannot be known to be
+    unchanged.
+    """
+    files: List[Path] = []
+    for name in datasources:
+        datasource = environment.datasources.get(name)
+        found = local_files(datasource.address, root) if datasource else []
+        if not found:
+            return None
+        files.extend(found)
+    return files_fingerprint(files)
+
+
+def result_key(sql: str, fingerprint: str) -> str:
+    return hashlib.sha1(f"{fingerprint}\n{sql}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    A size-bounded LRU of query results, one Parquet file per result.
+
+    Files live in ``directory`` and outlast the server; the index of sizes and
+    recency is read from the directory on first use, ordered by modification
+    time, which is bumped on every hit.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: Optional[OrderedDict[str, int]] = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.parquet"
+
+    def _entries(self) -> OrderedDict[str, int]:
+        if self.entries is None:
+            found = []
+            if self.directory.is_dir():
+                for path in self.directory.glob("*.parquet"):
+                    stat = path.stat()
+                    found.append((stat.st_mtime_ns, path.stem, stat.st_size))
+            self.entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        return self.entries
+
+    @property
+    def size(self) -> int:
+        with self.lock:
+            return sum(self._entries().values())
+
+    def get(self, key: str) -> Optional[Path]:
+        """The cached result for ``key``, marked as most recently used."""
+        with self.lock:
+            entries = self._entries()
+            path = self.path(key)
+            if key not in entries or not path.is_file():
+                entries.pop(key, None)
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+        os.utime(path)
+        return path
+
+    def put(self, key: str, write: Callable[[Path], None]) -> Path:
+        """Store the result ``write`` saves to the path it is given."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        partial = self.directory / f"{key}.{uuid.uuid4().hex}.partial"
+        try:
+            write(partial)
+            os.replace(partial, self.path(key))
+        finally:
+            partial.unlink(missing_ok=True)
+        with self.lock:
+            entries = self._entries()
+            entries[key] = self.path(key).stat().st_size
+            entries.move_to_end(key)
+            self._evict(keep=key)
+        return self.path(key)
+
+    def _evict(self, keep: str) -> None:
+        assert self.entries is not None
+        total = sum(self.entries.values())
+        for key in list(self.entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.entries.pop(key)
+            self.path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self.lock:
+            for key in self._entries():
+                self.path(key).unlink(missing_ok=True)
+            self.entries = OrderedDict()
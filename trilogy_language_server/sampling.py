@@ -0,0 +1,157 @@
+"""Deterministic samples of root datasources, cached on disk for preview runs."""
+
+import hashlib
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from trilogy.authoring import Environment
+from trilogy.core.enums import AddressType
+from trilogy.core.models.datasource import Address
+
+from trilogy_language_server.result_cache import (
+    default_cache_directory,
+    files_fingerprint,
+    local_files,
+)
+
+# Client setting holding ``enabled`` and ``percent``
+SAMPLE_SETTING = "trilogyLanguageServer.sample"
+# Share of each root datasource kept when no percentage is configured
+DEFAULT_SAMPLE_PERCENT = 1.0
+
+
+def default_sample_directory() -> Path:
+    return default_cache_directory().parent / "samples"
+
+
+def sample_percent(value: object, default: Optional[float]) -> Optional[float]:
+    """
+    The percentage a ``sample`` option asks for: True for ``default``, a number
+    for itself, False or 0 for none, and None to keep ``default``.
+    """
+    if value is None or value is True:
+        return default
+    if value is False:
+        return None
+    percent = float(value)  # type: ignore[arg-type]
+    if not 0 <= percent <= 100:
+        raise ValueError(f"Sample percentage must be within 0-100, got {value}")
+    return percent or None
+
+
+def sample_sql(location: str, percent: float) -> str:
+    """
+    Select ``percent`` of the rows of the files at ``location``, a path or glob.
+
+    Rows are kept by a hash of their values rather than at random, so the same
+    files always give the same sample, whatever the thread count; datasources
+    are sampled independently, so joins between samples match fewer rows.
+    """
+    scan = location.replace("'", "''")
+    return (
+        f"SELECT * FROM '{scan}' AS source "
+        f"WHERE hash(source) % 10000 < {round(percent * 100)}"
+    )
+
+
+class SampleSource(NamedTuple):
+    # datasource name
+    name: str
+    # the path or glob of the local files it reads, resolved from the workspace
+    location: str
+    # of those files, so a rewritten file is sampled again
+    fingerprint: str
+
+
+def sample_sources(environment: Environment, root: Path) -> List[SampleSource]:
+    """The root datasources of ``environment`` that read local files."""
+    sources = []
+    for name, datasource in environment.datasources.items():
+        if not datasource.is_root:
+            continue
+        files = local_files(datasource.address, root)
+        if not files:
+            continue
+        address = datasource.address
+        location = address if isinstance(address, str) else address.location
+        sources.append(
+            SampleSource(name, str(root / location), files_fingerprint(files))
+        )
+    return sources
+
+
+def sampled_environment(
+    environment: Environment, samples: Dict[str, Path]
+) -> Environment:
+    """A copy of ``environment`` with the named datasources reading their samples."""
+    sampled = environment.duplicate()
+    for name, path in samples.items():
+        sampled.datasources[name].address = Address(
+            location=str(path), type=AddressType.PARQUET
+        )
+    return sampled
+
+
+class SampleCache:
+    """
+    Samples of datasources stored in ``directory`` as Parquet, one per source
+    location and percentage.
+
+    A sample is named by its source location and the percentage, followed by the
+    files' fingerprint; it is reused until the fingerprint changes, when the
+    sample is taken again and the outdated one removed.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.writing: Dict[str, threading.Lock] = {}
+
+    def _prefix(self, source: SampleSource, percent: float) -> str:
+        key = f"{percent}\n{source.location}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def path(self, source: SampleSource, percent: float) -> Path:
+        prefix = self._prefix(source, percent)
+        return self.directory / f"{prefix}-{source.fingerprint}.parquet"
+
+    def get(self, source: SampleSource, percent: float) -> Optional[Path]:
+        path = self.path(source, percent)
+        return path if path.is_file() else None
+
+    def sample(
+        self,
+        source: SampleSource,
+        percent: float,
+        write: Callable[[str, Path], None],
+    ) -> Path:
+        """
+        The sample of ``source``, taken if missing by ``write``, which saves
+        the result of the SQL it is given to the path it is given.
+        """
+        prefix = self._prefix(source, percent)
+        with self.lock:
+            writing = self.writing.setdefault(prefix, threading.Lock())
+        # a source is sampled once, however many queries are waiting on it
+        with writing:
+            path = self.get(source, percent)
+            if path is not None:
+                return path
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.path(source, percent)
+            partial = self.directory / f"{prefix}.{uuid.uuid4().hex}.partial"
+            try:
+                write(sample_sql(source.location, percent), partial)
+                partial.replace(path)
+            finally:
+                partial.unlink(missing_ok=True)
+            for outdated in self.directory.glob(f"{prefix}-*.parquet"):
+                if outdated != path:
+                    outdated.unlink(missing_ok=True)
+        return path
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.parquet"):
+            path.unlink(missing_ok=True)
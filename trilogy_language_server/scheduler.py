@@ -0,0 +1,186 @@
+"""Checks the whole workspace in the background, most relevant files first."""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+)
+
+from trilogy_language_server.diagnostics import (
+    FileResult,
+    WorkspaceDiagnostics,
+    check_file,
+    workspace_files,
+)
+from trilogy_language_server.imports import read_imports
+
+
+def prioritize(
+    files: Iterable[Path],
+    open_files: Sequence[Path],
+    read_imports: Callable[[Path], List[Path]] = read_imports,
+) -> List[Path]:
+    """
+    Order workspace files for checking.
+
+    Open files come first, then the files they import (transitively, nearest
+    first), then the rest in path order.
+    """
+    remaining = {path.resolve(): path for path in files}
+    ordered: List[Path] = []
+    seen: Set[Path] = set()
+    queue: Deque[Path] = deque(path.resolve() for path in open_files)
+    while queue:
+        path = queue.popleft()
+        if path in seen:
+            continue
+        seen.add(path)
+        if path in remaining:
+            ordered.append(remaining.pop(path))
+        if path.exists():
+            queue.extend(target.resolve() for target in read_imports(path))
+    return ordered + sorted(remaining.values())
+
+
+def _lower_priority() -> None:
+    # Background checks should never compete with the editor's own process
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+class WorkspaceScheduler:
+    """
+    Runs workspace checks in a process pool at low priority.
+
+    One file is dispatched per worker at a time, and dispatching pauses until
+    the server has been free of requests for ``quiet_period`` seconds, so
+    interactive requests are never queued behind background work.
+    """
+
+    def __init__(
+        self,
+        diagnostics: WorkspaceDiagnostics,
+        idle_for: Callable[[], float] = lambda: float("inf"),
+        workers: Optional[int] = None,
+        quiet_period: float = 0.25,
+        executor_factory: Optional[Callable[[int], Executor]] = None,
+    ) -> None:
+        self.diagnostics = diagnostics
+        self.idle_for = idle_for
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.quiet_period = quiet_period
+        self.executor_factory = executor_factory or (
+            # forking would copy the server's running threads and locks
+            lambda workers: ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+            )
+        )
+        self._executor: Optional[Executor] = None
+        self.task: Optional["asyncio.Task[Dict[Path, Optional[FileResult]]]"] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self.executor_factory(self.workers)
+        return self._executor
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(
+        self,
+        roots: List[Path],
+        open_files: List[Path],
+        on_result: Callable[[Path, Optional[FileResult]], None] = lambda *_: None,
+        on_progress: Callable[[int, int], None] = lambda *_: None,
+    ) -> "asyncio.Task[Dict[Path, Optional[FileResult]]]":
+        """Start a workspace check, cancelling one already in progress."""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        self.task = asyncio.get_running_loop().create_task(
+            self.run(roots, open_files, on_result, on_progress)
+        )
+        return self.task
+
+    async def wait_until_idle(self) -> None:
+        while (idle := self.idle_for()) < self.quiet_period:
+            await asyncio.sleep(self.quiet_period - idle)
+
+    def pending(self, roots: List[Path], open_files: List[Path]) -> List[Path]:
+        """Prioritized files without an up to date result."""
+        return [
+            path
+            for path in prioritize(workspace_files(roots), open_files)
+            if self.diagnostics.fresh(path) is None
+        ]
+
+    async def run(
+        self,
+        roots: List[Path],
+        open_files: List[Path],
+        on_result: Callable[[Path, Optional[FileResult]], None] = lambda *_: None,
+        on_progress: Callable[[int, int], None] = lambda *_: None,
+    ) -> Dict[Path, Optional[FileResult]]:
+        """Check every stale file under ``roots``, returning the new results."""
+        loop = asyncio.get_running_loop()
+        # walking the workspace and reading imports touches the disk
+        pending = await loop.run_in_executor(None, self.pending, roots, open_files)
+        total = len(pending)
+        results: Dict[Path, Optional[FileResult]] = {}
+        on_progress(0, total)
+        slots = asyncio.Semaphore(self.workers)
+        in_flight: Set["asyncio.Future[Optional[FileResult]]"] = set()
+        finished = 0
+
+        def finish(path: Path, future: "asyncio.Future[Optional[FileResult]]"):
+            nonlocal finished
+            in_flight.discard(future)
+            slots.release()
+            if future.cancelled():
+                return
+            finished += 1
+            # a file that crashes the checker is retried on the next run
+            if future.exception() is None:
+                result = future.result()
+                self.diagnostics.store(path, result)
+                results[path] = result
+                on_result(path, result)
+            on_progress(finished, total)
+
+        try:
+            for path in pending:
+                await slots.acquire()
+                await self.wait_until_idle()
+                future = loop.run_in_executor(self.executor, check_file, path)
+                in_flight.add(future)
+                future.add_done_callback(functools.partial(finish, path))
+            if in_flight:
+                await asyncio.wait(set(in_flight))
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return results
+
+    def shutdown(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
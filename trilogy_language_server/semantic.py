@@ -0,0 +1,351 @@
+"""Semantic diagnostics from hydrating each statement on its own."""
+
+import hashlib
+import logging
+import re
+import traceback
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from lsprotocol.types import Diagnostic, DiagnosticSeverity, Position, Range
+from trilogy import Environment
+from trilogy.authoring import Concept, ConceptDeclarationStatement
+from trilogy.parsing.parse_engine_v2 import TopLevelStatementParser
+from trilogy.parsing.render import Renderer
+from trilogy.parsing.v2.syntax import SyntaxDocument, SyntaxNode, SyntaxToken
+
+from trilogy_language_server.imports import imported_files
+from trilogy_language_server.result_cache import files_fingerprint
+from trilogy_language_server.statements import StatementSpan
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Undefined concept errors only carry their positions in the message,
+# e.g. "Undefined concept: local.nme (line 2, col 5, in SELECT)."
+_MESSAGE_LOCATION_RE = re.compile(r"line (\d+), col (\d+)")
+
+# Environment attributes a statement can declare into, by name
+_ENVIRONMENT_STORES = (
+    "concepts",
+    "datasources",
+    "functions",
+    "data_types",
+    "named_statements",
+    "merges",
+    "alias_origin_lookup",
+)
+
+
+class StatementDiagnostic(NamedTuple):
+    """A diagnostic relative to its statement: 0-based lines from its start."""
+
+    line: int
+    column: int
+    end_line: int
+    end_column: int
+    message: str
+
+    def to_diagnostic(self, span: StatementSpan) -> Diagnostic:
+        def position(line: int, column: int) -> Position:
+            # columns only shift on the first line of a statement
+            return Position(
+                line + span.line, column + (span.column if line == 0 else 0)
+            )
+
+        return Diagnostic(
+            Range(
+                position(self.line, self.column),
+                position(self.end_line, self.end_column),
+            ),
+            self.message,
+            severity=DiagnosticSeverity.Error,
+        )
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def working_path_fingerprint(working_path: Path) -> str:
+    """Fingerprint of the empty environment at ``working_path``."""
+    return _text_hash(str(working_path))
+
+
+def statement_fingerprint(working_path: Path, text: str) -> str:
+    """
+    Fingerprint a statement's text and, for an import, the files on disk it
+    imports, so editing an imported file changes its fingerprint.
+    """
+    files = imported_files(working_path, [text])
+    if not files:
+        return _text_hash(text)
+    return _text_hash(text + files_fingerprint(files))
+
+
+def document_fingerprint(working_path: Path, statements: Sequence[str]) -> str:
+    """Fingerprint all ``statements`` at ``working_path``, and their imports."""
+    fingerprint = working_path_fingerprint(working_path)
+    for text in statements:
+        fingerprint = _text_hash(
+            fingerprint + statement_fingerprint(working_path, text)
+        )
+    return fingerprint
+
+
+EnvironmentState = Dict[str, Dict[str, Any]]
+
+
+def environment_state(environment: Environment) -> EnvironmentState:
+    """What ``environment`` declares, to diff against after a statement."""
+    state = {
+        store: dict(getattr(environment, store, None) or {})
+        for store in _ENVIRONMENT_STORES
+    }
+    state["imports"] = {
+        alias: [str(getattr(item, "path", item)) for item in items]
+        for alias, items in environment.imports.items()
+    }
+    return state
+
+
+def _render_declaration(renderer: Renderer, value: Any) -> str:
+    try:
+        if isinstance(value, Concept):
+            return renderer.to_string(ConceptDeclarationStatement(concept=value))
+        return renderer.to_string(value)
+    except Exception:
+        # unrenderable: assume it changed, so later statements are rechecked
+        return f"{type(value).__name__}@{id(value)}"
+
+
+def environment_contribution(environment: Environment, before: EnvironmentState) -> str:
+    """
+    Fingerprint what a statement declared into ``environment``.
+
+    Each declaration the statement added, replaced or removed is rendered, so
+    edits that declare the same things (reformatting, or changing a select
+    that declares nothing) contribute the same fingerprint.
+    """
+    renderer = Renderer()
+    after = environment_state(environment)
+    changes = []
+    for store, items in after.items():
+        previous = before.get(store, {})
+        for key, value in items.items():
+            if store == "imports":
+                if previous.get(key) != value:
+                    changes.append(f"{store} {key} {value}")
+            elif previous.get(key) is not value:
+                changes.append(f"{store} {key} {_render_declaration(renderer, value)}")
+        changes.extend(f"{store} {key} removed" for key in previous if key not in items)
+    return _text_hash("\n".join(sorted(changes)))
+
+
+def _word_end(text: str, line: int, column: int) -> int:
+    lines = text.split("\n")
+    if line >= len(lines):
+        return column + 1
+    current = lines[line]
+    end = column
+    while end < len(current) and (current[end].isalnum() or current[end] in "_."):
+        end += 1
+    return max(end, column + 1)
+
+
+def _syntax_location(
+    error: BaseException,
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Find the syntax element being hydrated when ``error`` was raised.
+
+    Hydration errors rarely carry positions, so walk the traceback from the
+    innermost frame outwards for a syntax node or token argument.
+    """
+    meta = getattr(getattr(error, "diagnostic", None), "meta", None)
+    if meta is not None and meta.line is not None:
+        return meta.line, meta.column, meta.end_line, meta.end_column
+    for frame, _ in reversed(list(traceback.walk_tb(error.__traceback__))):
+        for value in frame.f_locals.values():
+            if (
+                isinstance(value, (SyntaxNode, SyntaxToken))
+                and value.line is not None
+                and value.column is not None
+                and value.end_line is not None
+                and value.end_column is not None
+            ):
+                return value.line, value.column, value.end_line, value.end_column
+    return None
+
+
+def locate_error(error: BaseException, text: str) -> List[StatementDiagnostic]:
+    """Turn a hydration error into statement-relative diagnostics."""
+    message = str(error)
+    located = _MESSAGE_LOCATION_RE.findall(message)
+    if located:
+        diagnostics = []
+        for line_text, column_text in located:
+            line, column = int(line_text) - 1, int(column_text) - 1
+            end = _word_end(text, line, column)
+            diagnostics.append(StatementDiagnostic(line, column, line, end, message))
+        return diagnostics
+    location = _syntax_location(error)
+    if location is not None:
+        line, column, end_line, end_column = location
+        return [
+            StatementDiagnostic(
+                line - 1, column - 1, end_line - 1, end_column - 1, message
+            )
+        ]
+    # Fall back to the statement's first line
+    first_line = text.split("\n", 1)[0]
+    return [StatementDiagnostic(0, 0, 0, max(len(first_line), 1), message)]
+
+
+class StatementHydration(ABC, Generic[T]):
+    """
+    Hydrates a document statement by statement, isolating failures.
+
+    Each statement is hydrated separately against the environment built by the
+    statements before it, so one failing statement does not affect the rest.
+    Per-statement results are cached by (statement hash, environment
+    fingerprint), where the fingerprint chains what each earlier statement
+    declared rather than its text: a run only hydrates statements whose text
+    changed or whose inputs were declared differently. An import's hash
+    covers the files it imports, so editing one on disk rechecks the import
+    and, if its declarations changed, the statements after it. The environment before
+    the first changed statement is kept, so repeated edits to one statement do
+    not replay the statements above it.
+    """
+
+    def __init__(self) -> None:
+        # (result, environment fingerprint after the statement) by key
+        self.results: Dict[Tuple[str, str], Tuple[T, str]] = {}
+        self.snapshot: Optional[Tuple[str, Environment]] = None
+        # statements hydrated for new results, for tests and metrics
+        self.checked = 0
+
+    @abstractmethod
+    def check(self, environment: Environment, text: str, tree: SyntaxNode) -> T:
+        """Hydrate one statement into ``environment`` and return its result."""
+
+    def hydrate(
+        self, environment: Environment, text: str, tree: SyntaxNode, fingerprint: str
+    ) -> Tuple[T, str]:
+        """Check a statement, and fingerprint the environment after it."""
+        before = environment_state(environment)
+        result = self.check(environment, text, tree)
+        contribution = environment_contribution(environment, before)
+        return result, _text_hash(fingerprint + contribution)
+
+    def new_environment(self, working_path: Path) -> Environment:
+        return Environment(working_path=working_path)
+
+    def statement_results(
+        self,
+        statements: Sequence[Tuple[StatementSpan, SyntaxNode]],
+        working_path: Path,
+        cancelled: Callable[[], bool] = lambda: False,
+        limit: Optional[int] = None,
+    ) -> Optional[List[T]]:
+        """
+        Return the results of the first ``limit`` statements (default all).
+
+        Returns None if ``cancelled`` reports true before the run completes.
+        """
+        wanted = list(statements[:limit] if limit is not None else statements)
+        fingerprint = working_path_fingerprint(working_path)
+        found: Dict[Tuple[str, str], Tuple[T, str]] = {}
+        results: List[T] = []
+        environment: Optional[Environment] = None
+        # index of the statement ``environment`` is built up to
+        built = 0
+        for idx, (span, tree) in enumerate(wanted):
+            key = (statement_fingerprint(working_path, span.text), fingerprint)
+            cached = found.get(key) or self.results.get(key)
+            if cached is None:
+                if cancelled():
+                    return None
+                if environment is None:
+                    environment = self._environment_at(
+                        statements, idx, fingerprint, working_path
+                    )
+                else:
+                    for skipped, skipped_tree in statements[built:idx]:
+                        self.check(environment, skipped.text, skipped_tree)
+                cached = self.hydrate(environment, span.text, tree, fingerprint)
+                built = idx + 1
+                self.checked += 1
+            found[key] = cached
+            results.append(cached[0])
+            fingerprint = cached[1]
+        # Only results for the current document are kept, including those of
+        # statements past ``limit`` still valid for it
+        for span, _ in statements[len(wanted) :]:
+            key = (statement_fingerprint(working_path, span.text), fingerprint)
+            if key not in self.results:
+                break
+            found[key] = self.results[key]
+            fingerprint = found[key][1]
+        self.results = found
+        return results
+
+    def _environment_at(
+        self,
+        statements: Sequence[Tuple[StatementSpan, SyntaxNode]],
+        index: int,
+        fingerprint: str,
+        working_path: Path,
+    ) -> Environment:
+        """Build the environment before statement ``index`` and snapshot it."""
+        if self.snapshot is not None and self.snapshot[0] == fingerprint:
+            return self.snapshot[1].duplicate()
+        environment = self.new_environment(working_path)
+        for span, tree in statements[:index]:
+            self.check(environment, span.text, tree)
+        self.snapshot = (fingerprint, environment.duplicate())
+        return environment
+
+
+class SemanticDiagnostics(StatementHydration[List[StatementDiagnostic]]):
+    """Semantic errors per statement, from hydrating each one on its own."""
+
+    def run(
+        self,
+        statements: Sequence[Tuple[StatementSpan, SyntaxNode]],
+        working_path: Path,
+        cancelled: Callable[[], bool] = lambda: False,
+    ) -> Optional[List[Diagnostic]]:
+        """Return diagnostics for all statements, or None if cancelled."""
+        results = self.statement_results(statements, working_path, cancelled)
+        if results is None:
+            return None
+        return [
+            diagnostic.to_diagnostic(span)
+            for (span, _), found in zip(statements, results)
+            for diagnostic in found
+        ]
+
+    def check(
+        self, environment: Environment, text: str, tree: SyntaxNode
+    ) -> List[StatementDiagnostic]:
+        try:
+            TopLevelStatementParser(environment=environment).parse(
+                SyntaxDocument(text=text, tree=tree)
+            )
+        except Exception as e:
+            return locate_error(e, text)
+        return []
@@ -1,19 +1,25 @@
+import asyncio
 import typing as t
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pygls.lsp.server import LanguageServer
-from pygls.uris import to_fs_path
+from pygls.protocol import LanguageServerProtocol
+from pygls.uris import from_fs_path, to_fs_path
 from lsprotocol.types import (
     TEXT_DOCUMENT_COMPLETION,
+    COMPLETION_ITEM_RESOLVE,
     CompletionItem,
     CompletionList,
     CompletionParams,
-    CompletionItemKind,
-    InsertTextFormat,
     DidChangeTextDocumentParams,
     DidCloseTextDocumentParams,
     DidOpenTextDocumentParams,
+    DidSaveTextDocumentParams,
     TEXT_DOCUMENT_DID_CHANGE,
     TEXT_DOCUMENT_DID_CLOSE,
     TEXT_DOCUMENT_DID_OPEN,
+    TEXT_DOCUMENT_DID_SAVE,
     TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
     SemanticTokens,
     CompletionOptions,
@@ -21,6 +27,11 @@ from lsprotocol.types import (
     SemanticTokensParams,
     DocumentFormattingParams,
     TEXT_DOCUMENT_FORMATTING,
+    DocumentRangeFormattingParams,
+    TEXT_DOCUMENT_RANGE_FORMATTING,
+    DocumentOnTypeFormattingOptions,
+    DocumentOnTypeFormattingParams,
+    TEXT_DOCUMENT_ON_TYPE_FORMATTING,
     TEXT_DOCUMENT_CODE_LENS,
     CodeLensParams,
     CODE_LENS_RESOLVE,
@@ -30,8 +41,22 @@ from lsprotocol.types import (
     LogMessageParams,
     MessageType,
     PublishDiagnosticsParams,
+    Diagnostic,
+    DiagnosticSeverity,
+    TEXT_DOCUMENT_DIAGNOSTIC,
+    DiagnosticOptions,
+    DocumentDiagnosticParams,
+    WORKSPACE_DIAGNOSTIC,
+    WorkspaceDiagnosticParams,
+    WorkspaceDiagnosticReport,
+    WorkDoneProgressBegin,
+    WorkDoneProgressEnd,
+    WorkDoneProgressReport,
     TEXT_DOCUMENT_HOVER,
     Hover,
+    TEXT_DOCUMENT_INLAY_HINT,
+    InlayHint,
+    InlayHintParams,
     HoverParams,
     MarkupContent,
     MarkupKind,
@@ -52,12 +77,96 @@ from lsprotocol.types import (
     ParameterInformation,
     SignatureHelpOptions,
     TextEdit,
+    INITIALIZED,
+    InitializedParams,
+    SHUTDOWN,
+    WORKSPACE_DID_CHANGE_CONFIGURATION,
+    DidChangeConfigurationParams,
+    WORKSPACE_DID_CHANGE_WATCHED_FILES,
+    DidChangeWatchedFilesParams,
+    FileChangeType,
+    ConfigurationItem,
+    ConfigurationParams,
 )
 from functools import reduce
 from typing import Dict, List, Optional
-from trilogy_language_server.error_reporting import get_diagnostics
+from trilogy_language_server.error_reporting import get_statement_diagnostics
+from trilogy_language_server.diagnostics import (
+    DocumentReport,
+    WorkspaceDiagnostics,
+    document_report,
+)
+from trilogy_language_server.completion import (
+    MAX_COMPLETION_ITEMS,
+    DocumentIndex,
+    ScoreCache,
+    build_document_index,
+    complete,
+    completion_context,
+    context_indexes,
+    extract_prefix,
+    resolve_documentation,
+)
+from trilogy_language_server.metrics import (
+    COMPLEXITY_SETTING,
+    ComplexityThresholds,
+    QueryMetrics,
+)
+from trilogy_language_server.memory import (
+    AllocationTracker,
+    format_memory_report,
+    store_report,
+)
+from trilogy_language_server.formatting import (
+    LineIndex,
+    StatementFormatter,
+    statement_end,
+)
+from trilogy_language_server.function_catalog import lookup_function
+from trilogy_language_server.execution import (
+    QUERY_SETTING,
+    QueryExecutor,
+    QueryLimits,
+    QueryProgress,
+)
+from trilogy_language_server.profiling import (
+    QueryProfile,
+    build_profile,
+    format_seconds,
+    materialize_ctes,
+)
+from trilogy_language_server.rendering import (
+    DEFAULT_DIALECTS,
+    DIALECT_SETTING,
+    SqlRenderer,
+    statement_hash,
+    workspace_dialects,
+)
+from trilogy_language_server.imports import imported_files
+from trilogy_language_server.result_cache import (
+    ResultCache,
+    datasource_fingerprint,
+    default_cache_directory,
+    files_fingerprint,
+    result_key,
+)
+from trilogy_language_server.sampling import (
+    DEFAULT_SAMPLE_PERCENT,
+    SAMPLE_SETTING,
+    SampleCache,
+    default_sample_directory,
+    sample_percent,
+    sample_sources,
+    sampled_environment,
+)
+from trilogy_language_server.scheduler import WorkspaceScheduler
+from trilogy_language_server.semantic import SemanticDiagnostics, document_fingerprint
+from trilogy_language_server.signature import CallIndex
+from trilogy_language_server.statements import StatementSpan, StatementTreeCache
+from trilogy_language_server.watchdog import StallReport, StallWatchdog
 import operator
-from trilogy.parsing.v2.syntax import SyntaxNode
+from trilogy.parsing.parse_engine_v2 import TopLevelStatementParser
+from trilogy.parsing.v2.syntax import SyntaxDocument, SyntaxNode
 from trilogy_language_server.models import (
     TokenModifier,
     Token,
@@ -77,15 +186,13 @@ from trilogy_language_server.parsing import (
     get_definition_locations,
     get_document_symbols,
     extract_datasource_info,
+    PROFILE_QUERY_COMMAND,
     extract_import_info,
     format_datasource_hover,
     format_import_hover,
     TRILOGY_FUNCTIONS,
 )
-from trilogy.parsing.render import Renderer
-from trilogy.parsing.parse_engine_v2 import parse_syntax, TopLevelStatementParser
 from trilogy.authoring import Environment
-from trilogy.dialect.duckdb import DuckDBDialect
 import re
 from pathlib import Path
 
@@ -94,38 +201,208 @@ TokenTypes = ["keyword", "variable", "function", "operator", "parameter", "type"
 ADDITION = re.compile(r"^\s*(\d+)\s*\+\s*(\d+)\s*=(?=\s*$)")
 
 
+class TrilogyLanguageServerProtocol(LanguageServerProtocol):
+    """Records the method and URI being handled so stalls can be attributed."""
+
+    def _handle_request(self, msg_id, method_name: str, params: t.Any):
+        server = t.cast("TrilogyLanguageServer", self._server)
+        with server.watchdog.activity.track(method_name, _params_uri(params)):
+            super()._handle_request(msg_id, method_name, params)
+
+    def _handle_notification(self, method_name: str, params: t.Any):
+        server = t.cast("TrilogyLanguageServer", self._server)
+        with server.watchdog.activity.track(method_name, _params_uri(params)):
+            super()._handle_notification(method_name, params)
+
+
+def _params_uri(params: t.Any) -> Optional[str]:
+    text_document = getattr(params, "text_document", None)
+    return getattr(text_document, "uri", None)
+
+
+def _param(params: t.Any, name: str, default: t.Any = None) -> t.Any:
+    """Read a field of a custom request's params, sent as an object or a dict."""
+    if isinstance(params, dict):
+        return params.get(name, default)
+    return getattr(params, name, default)
+
+
 class TrilogyLanguageServer(LanguageServer):
     CMD_SHOW_CONFIGURATION_ASYNC = "showConfigurationAsync"
     CMD_SHOW_CONFIGURATION_CALLBACK = "showConfigurationCallback"
     CMD_SHOW_CONFIGURATION_THREAD = "showConfigurationThread"
     CMD_UNREGISTER_COMPLETIONS = "unregisterCompletions"
+    CMD_MEMORY_REPORT = "trilogy.memory.report"
+    CMD_METRICS_REPORT = "trilogy.metrics.report"
+    CMD_PROFILE_QUERY = PROFILE_QUERY_COMMAND
+    RENDER_SQL = "trilogy/renderSql"
+    EXECUTE_QUERY = "trilogy/executeQuery"
+    CLOSE_QUERY = "trilogy/closeQuery"
+
+    # Per-URI caches, in the order they are reported by the memory report
+    PER_URI_STORES = (
+        "environments",
+        "tokens",
+        "code_lens",
+        "concept_locations",
+        "concept_info",
+        "datasource_info",
+        "import_info",
+        "completion_indexes",
+        "call_indexes",
+        "statement_trees",
+        "semantic_diagnostics",
+        "syntax_diagnostics",
+        "semantic_results",
+        "complexity_results",
+        "formatters",
+        "query_profiles",
+    )
 
     CONFIGURATION_SECTION = "trilogy"
 
-    def __init__(self) -> None:
-        super().__init__(name="trilogy-lang-server", version="v0.1")
+    def __init__(self, stall_threshold: float = 1.0) -> None:
+        super().__init__(
+            name="trilogy-lang-server",
+            version="v0.1",
+            protocol_cls=TrilogyLanguageServerProtocol,
+        )
         self.tokens: Dict[str, List[Token]] = {}
         self.code_lens: Dict[str, List[CodeLens]] = {}
         self.environments: Dict[str, Environment] = {}
-        self.dialect = DuckDBDialect()
+        # Fingerprint of the imported files each document environment was
+        # built with, to rebuild it when one changes on disk
+        self.environment_imports: Dict[str, str] = {}
+        # Compiles statements for each workspace's dialects, caching the SQL
+        self.sql_renderer = SqlRenderer()
+        self.dialect = self.sql_renderer.dialect(DEFAULT_DIALECTS[0])
+        # Dialects configured per workspace folder, the first used for lenses
+        self.workspace_dialects: Dict[Path, List[str]] = {}
+        # A DuckDB connection per workspace, with the results being paged
+        self.query_executor = QueryExecutor(
+            results=ResultCache(default_cache_directory()),
+            samples=SampleCache(default_sample_directory()),
+        )
+        self.query_limits = QueryLimits()
+        # Percentage of root datasources previews read, None to read them whole
+        self.sample_percent: Optional[float] = None
+        # Latest profile of each query, by statement hash
+        self.query_profiles: Dict[str, Dict[str, QueryProfile]] = {}
         # Storage for concept hover information
         self.concept_locations: Dict[str, List[ConceptLocation]] = {}
         self.concept_info: Dict[str, Dict[str, ConceptInfo]] = {}
         # Storage for datasource and import information
         self.datasource_info: Dict[str, List[DatasourceInfo]] = {}
         self.import_info: Dict[str, List[ImportInfo]] = {}
+        # Completion indexes over each document's concepts and datasources, with
+        # the stores it was built from so it is rebuilt when they are replaced
+        self.completion_indexes: Dict[
+            str,
+            t.Tuple[
+                Dict[str, ConceptInfo],
+                List[DatasourceInfo],
+                List[ConceptLocation],
+                DocumentIndex,
+            ],
+        ] = {}
+        # Parsed statements per document; unchanged statements are not reparsed
+        self.statement_trees: Dict[str, StatementTreeCache] = {}
+        # Hydration results per statement; only edited statements are rechecked
+        self.semantic_diagnostics: Dict[str, SemanticDiagnostics] = {}
+        # Syntax diagnostics are republished alongside each semantic result
+        self.syntax_diagnostics: Dict[str, List[Diagnostic]] = {}
+        self.document_versions: Dict[str, Optional[int]] = {}
+        # Latest semantic diagnostics with the document version they describe
+        self.semantic_results: Dict[
+            str, t.Tuple[Optional[int], List[Diagnostic]]
+        ] = {}
+        # Compiled queries over the complexity thresholds, by document version
+        self.complexity_results: Dict[
+            str, t.Tuple[Optional[int], List[Diagnostic]]
+        ] = {}
+        self.complexity_thresholds = ComplexityThresholds()
+        # Semantic checks in flight, awaited by diagnostic pulls
+        self.semantic_pending: Dict[str, "asyncio.Future[t.Any]"] = {}
+        # Diagnostics for files that are not open, pulled by workspace/diagnostic
+        self.workspace_diagnostics = WorkspaceDiagnostics()
+        # Semantic checks run off the event loop, one document at a time
+        self.semantic_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="trilogy-semantic"
+        )
+        # Rendered statements per document, for range and on-type formatting
+        self.formatters: Dict[str, StatementFormatter] = {}
+        # Bracket/comma index for signature help, with the document version
+        self.call_indexes: Dict[str, t.Tuple[Optional[int], CallIndex]] = {}
+        # Fuzzy match results, refined keystroke by keystroke
+        self.completion_scores = ScoreCache()
+        self.allocation_tracker = AllocationTracker()
+        # Counters for operational events, reported by the metrics command
+        self.metrics: t.Counter[str] = Counter()
+        self.watchdog = StallWatchdog(
+            threshold=stall_threshold, on_stall=self.record_stall
+        )
+        # Checks files that are not open, yielding to interactive requests
+        self.workspace_scheduler = WorkspaceScheduler(
+            self.workspace_diagnostics, idle_for=self.watchdog.activity.idle_for
+        )
+        self.workspace_check: Optional["asyncio.Task[None]"] = None
+
+    def record_stall(self: "TrilogyLanguageServer", report: StallReport):
+        self.metrics["loop_stalls"] += 1
+        if report.method:
+            self.metrics[f"loop_stalls:{report.method}"] += 1
 
     def _validate(
         self: "TrilogyLanguageServer",
         params: t.Union[DidChangeTextDocumentParams, DidOpenTextDocumentParams],
+    ):
+        # didOpen is async, so its validation runs after the protocol has
+        # stopped tracking the notification
+        method = (
+            TEXT_DOCUMENT_DID_OPEN
+            if isinstance(params, DidOpenTextDocumentParams)
+            else TEXT_DOCUMENT_DID_CHANGE
+        )
+        with self.watchdog.activity.track(method, params.text_document.uri):
+            self._validate_document(params)
+
+    @property
+    def pull_diagnostics(self: "TrilogyLanguageServer") -> bool:
+        """Whether the client pulls diagnostics instead of having them pushed."""
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        text_document = getattr(capabilities, "text_document", None)
+        return getattr(text_document, "diagnostic", None) is not None
+
+    def _validate_document(
+        self: "TrilogyLanguageServer",
+        params: t.Union[
+            DidChangeTextDocumentParams,
+            DidOpenTextDocumentParams,
+            DocumentDiagnosticParams,
+        ],
     ):
         self.window_log_message(
             LogMessageParams(type=MessageType.Log, message="Validating document...")
         )
         text_doc = self.workspace.get_text_document(params.text_document.uri)
-        raw_tree, diagnostics = get_diagnostics(text_doc.source)
-        self.text_document_publish_diagnostics(
-            PublishDiagnosticsParams(uri=text_doc.uri, diagnostics=diagnostics)
+        statement_trees = self.statement_trees.setdefault(
+            text_doc.uri, StatementTreeCache()
+        )
+        raw_tree, diagnostics = get_statement_diagnostics(
+            text_doc.source, statement_trees
+        )
+        self.syntax_diagnostics[text_doc.uri] = diagnostics
+        self.document_versions[text_doc.uri] = text_doc.version
+        if not self.pull_diagnostics:
+            self.text_document_publish_diagnostics(
+                PublishDiagnosticsParams(
+                    uri=text_doc.uri,
+                    diagnostics=diagnostics,
+                    version=text_doc.version,
+                )
+            )
+        self.schedule_semantic_diagnostics(
+            text_doc.uri, text_doc.version, statement_trees
         )
         if raw_tree:
             self.publish_tokens(text_doc.source, raw_tree, text_doc.uri)
@@ -133,6 +410,500 @@ class TrilogyLanguageServer(LanguageServer):
             # Extract concept locations for hover support
             self.publish_concept_locations(raw_tree, text_doc.uri)
 
+    def schedule_semantic_diagnostics(
+        self: "TrilogyLanguageServer",
+        uri: str,
+        version: Optional[int],
+        statement_trees: StatementTreeCache,
+    ):
+        """Check the parsed statements of ``uri`` in the background.
+
+        Results are published with the syntax diagnostics (or kept for the next
+        pull), unless the document has changed since; a newer edit cancels a
+        check still in progress.
+        """
+        working_path = self.working_path(uri)
+        stage = self.semantic_diagnostics.setdefault(uri, SemanticDiagnostics())
+        statements = statement_trees.statements
+
+        def stale() -> bool:
+            return self.document_versions.get(uri) != version
+
+        def check() -> Optional[List[Diagnostic]]:
+            return stage.run(statements, working_path, cancelled=stale)
+
+        def publish(semantic: Optional[List[Diagnostic]]):
+            if semantic is None or stale():
+                return
+            self.semantic_results[uri] = (version, semantic)
+            if self.pull_diagnostics:
+                return
+            self.text_document_publish_diagnostics(
+                PublishDiagnosticsParams(
+                    uri=uri, diagnostics=self.current_diagnostics(uri), version=version
+                )
+            )
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            publish(check())
+            return
+        future = loop.run_in_executor(self.semantic_executor, check)
+        self.semantic_pending[uri] = future
+
+        def done(future: "asyncio.Future[Optional[List[Diagnostic]]]"):
+            if self.semantic_pending.get(uri) is future:
+                del self.semantic_pending[uri]
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                self.window_log_message(
+                    LogMessageParams(
+                        type=MessageType.Warning,
+                        message=f"Semantic diagnostics failed: {error}",
+                    )
+                )
+                return
+            publish(future.result())
+
+        future.add_done_callback(done)
+
+    async def document_diagnostics(
+        self: "TrilogyLanguageServer", params: DocumentDiagnosticParams
+    ) -> List[Diagnostic]:
+        """Return syntax and semantic diagnostics for the current document."""
+        uri = params.text_document.uri
+        doc = self.workspace.get_text_document(uri)
+        if uri not in self.syntax_diagnostics or (
+            self.document_versions.get(uri) != doc.version
+        ):
+            self._validate_document(params)
+        pending = self.semantic_pending.get(uri)
+        if pending is not None:
+            # a pull that is cancelled must not cancel the shared check
+            await asyncio.wait([asyncio.shield(pending)])
+        return self.current_diagnostics(uri)
+
+    async def check_workspace(self: "TrilogyLanguageServer"):
+        """Check the workspace's files in the background, reporting progress.
+
+        Open files and their imports are checked first. Push clients are sent
+        each closed file's diagnostics as they arrive; pull clients are asked to
+        refresh once the check completes.
+        """
+        roots = self.workspace_roots()
+        if not roots:
+            return
+        open_files = self.open_files()
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        token: Optional[str] = None
+        window = getattr(capabilities, "window", None)
+        if getattr(window, "work_done_progress", False):
+            token = f"trilogy-workspace-{uuid.uuid4()}"
+            try:
+                await self.work_done_progress.create_async(token)
+            except Exception as e:
+                self.window_log_message(
+                    LogMessageParams(
+                        type=MessageType.Log,
+                        message=f"Workspace progress unavailable: {e}",
+                    )
+                )
+                token = None
+        if token:
+            self.work_done_progress.begin(
+                token,
+                WorkDoneProgressBegin(title="Checking workspace", percentage=0),
+            )
+
+        def on_result(path: Path, result):
+            uri = from_fs_path(str(path))
+            if (
+                self.pull_diagnostics
+                or uri is None
+                or uri in self.workspace.text_documents
+            ):
+                return
+            self.text_document_publish_diagnostics(
+                PublishDiagnosticsParams(
+                    uri=uri, diagnostics=result.diagnostics if result else []
+                )
+            )
+
+        def on_progress(done: int, total: int):
+            if token and total:
+                self.work_done_progress.report(
+                    token,
+                    WorkDoneProgressReport(
+                        message=f"{done}/{total} files",
+                        percentage=done * 100 // total,
+                    ),
+                )
+
+        task = self.workspace_scheduler.start(
+            roots, open_files, on_result, on_progress
+        )
+        await asyncio.wait([task])
+        if not task.cancelled() and task.exception() is not None:
+            self.window_log_message(
+                LogMessageParams(
+                    type=MessageType.Warning,
+                    message=f"Workspace check failed: {task.exception()}",
+                )
+            )
+        if token:
+            self.work_done_progress.end(token, WorkDoneProgressEnd())
+        workspace = getattr(capabilities, "workspace", None)
+        diagnostics = getattr(workspace, "diagnostics", None)
+        refresh = getattr(diagnostics, "refresh_support", False)
+        if self.pull_diagnostics and refresh and not task.cancelled():
+            self.workspace_diagnostic_refresh(None)
+
+    def schedule_workspace_check(self: "TrilogyLanguageServer") -> None:
+        """Recheck the workspace's stale files, replacing a check in progress."""
+        self.workspace_check = asyncio.get_running_loop().create_task(
+            self.check_workspace()
+        )
+
+    def open_files(self: "TrilogyLanguageServer") -> List[Path]:
+        """Paths of the documents open in the editor."""
+        return [
+            Path(path)
+            for path in map(to_fs_path, list(self.workspace.text_documents))
+            if path
+        ]
+
+    def working_path(self: "TrilogyLanguageServer", uri: str) -> Path:
+        """The directory imports in ``uri`` are resolved against."""
+        fs_path_str = to_fs_path(uri)
+        return Path(fs_path_str).parent if fs_path_str else Path.cwd()
+
+    def format_statements(
+        self: "TrilogyLanguageServer",
+        uri: str,
+        text: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        whole_document: bool = False,
+    ) -> Optional[List[TextEdit]]:
+        """Edits formatting the statements of ``text`` between two offsets."""
+        statement_trees = self.statement_trees.setdefault(uri, StatementTreeCache())
+        # a no-op for unchanged statements when the document was just validated
+        statement_trees.parse(text)
+        formatter = self.formatters.setdefault(uri, StatementFormatter())
+        return formatter.edits(
+            text,
+            statement_trees.statements,
+            self.working_path(uri),
+            start,
+            end,
+            whole_document=whole_document,
+        )
+
+    def workspace_roots(self: "TrilogyLanguageServer") -> List[Path]:
+        roots = []
+        for folder in self.workspace.folders.values():
+            path = to_fs_path(folder.uri)
+            if path:
+                roots.append(Path(path))
+        if not roots and self.workspace.root_path:
+            roots.append(Path(self.workspace.root_path))
+        return roots
+
+    def dialects_for(self: "TrilogyLanguageServer", uri: str) -> List[str]:
+        """The dialects configured for the workspace folder holding ``uri``."""
+        fs_path = to_fs_path(uri)
+        if not fs_path:
+            return list(DEFAULT_DIALECTS)
+        path = Path(fs_path)
+        roots = [root for root in self.workspace_dialects if path.is_relative_to(root)]
+        if roots:
+            return self.workspace_dialects[max(roots, key=lambda root: len(root.parts))]
+        return workspace_dialects(path.parent)
+
+    async def load_dialects(self: "TrilogyLanguageServer"):
+        """Read each workspace folder's dialects from its settings and trilogy.toml."""
+        roots = self.workspace_roots()
+        settings: t.Sequence[t.Any] = [None] * len(roots)
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        if getattr(getattr(capabilities, "workspace", None), "configuration", False):
+            try:
+                settings = await self.workspace_configuration_async(
+                    ConfigurationParams(
+                        items=[
+                            ConfigurationItem(
+                                scope_uri=from_fs_path(str(root)),
+                                section=DIALECT_SETTING,
+                            )
+                            for root in roots
+                        ]
+                    )
+                )
+            except Exception as e:
+                self.window_log_message(
+                    LogMessageParams(
+                        type=MessageType.Log,
+                        message=f"Dialect settings unavailable: {e}",
+                    )
+                )
+        self.workspace_dialects = {
+            root: workspace_dialects(root, setting)
+            for root, setting in zip(roots, settings)
+        }
+
+    async def load_query_settings(self: "TrilogyLanguageServer"):
+        """Read query limits, sample mode and complexity thresholds from settings."""
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        if not getattr(getattr(capabilities, "workspace", None), "configuration", False):
+            return
+        try:
+            settings, sample, complexity = await self.workspace_configuration_async(
+                ConfigurationParams(
+                    items=[
+                        ConfigurationItem(section=QUERY_SETTING),
+                        ConfigurationItem(section=SAMPLE_SETTING),
+                        ConfigurationItem(section=COMPLEXITY_SETTING),
+                    ]
+                )
+            )
+        except Exception as e:
+            self.window_log_message(
+                LogMessageParams(
+                    type=MessageType.Log,
+                    message=f"Query settings unavailable: {e}",
+                )
+            )
+            return
+        self.query_limits = QueryLimits().override(
+            timeout=_param(settings, "timeout"),
+            max_rows=_param(settings, "maxRows"),
+            max_bytes=_param(settings, "maxBytes"),
+        )
+        self.sample_percent = (
+            sample_percent(_param(sample, "percent"), DEFAULT_SAMPLE_PERCENT)
+            if _param(sample, "enabled")
+            else None
+        )
+        self.complexity_thresholds = ComplexityThresholds().override(
+            max_ctes=_param(complexity, "maxCtes"),
+            max_joins=_param(complexity, "maxJoins"),
+            max_fan_out=_param(complexity, "maxFanOut"),
+            max_datasources=_param(complexity, "maxDatasources"),
+        )
+
+    def query_progress(
+        self: "TrilogyLanguageServer", token: t.Optional[t.Union[int, str]] = None
+    ) -> t.Tuple[t.Callable[[QueryProgress], None], t.Callable[[], None]]:
+        """
+        Callbacks reporting a running query's progress, and ending the report.
+
+        The request's work done token is used when the client sent one;
+        otherwise a progress is created once a query outlasts its first
+        report, if the client supports server initiated progress.
+        """
+        state: t.Dict[str, t.Any] = {"token": token, "begun": False}
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        window = getattr(capabilities, "window", None)
+
+        def created(*args):
+            state["token"] = state["pending"]
+
+        def report(progress: QueryProgress):
+            if state["token"] is None:
+                if getattr(window, "work_done_progress", False) and not state.get(
+                    "pending"
+                ):
+                    state["pending"] = f"trilogy-query-{uuid.uuid4()}"
+                    self.work_done_progress.create(state["pending"], created)
+                return
+            message = f"{progress.rows:,} rows, {progress.elapsed:.1f}s"
+            percentage = (
+                None if progress.percentage is None else int(progress.percentage)
+            )
+            if state["begun"]:
+                self.work_done_progress.report(
+                    state["token"],
+                    WorkDoneProgressReport(message=message, percentage=percentage),
+                )
+                return
+            state["begun"] = True
+            self.work_done_progress.begin(
+                state["token"],
+                WorkDoneProgressBegin(
+                    title="Running query", message=message, percentage=percentage
+                ),
+            )
+
+        def end():
+            if state["begun"]:
+                self.work_done_progress.end(state["token"], WorkDoneProgressEnd())
+
+        return report, end
+
+    def profile_hints(self: "TrilogyLanguageServer", uri: str) -> List[InlayHint]:
+        """
+        Inlay hints showing the latest profile of each query in ``uri``.
+
+        Each profiled query gets its time and rows, and the lines defining
+        what its hot CTEs derive (concepts) or scan (datasources) get the
+        CTE's share of the time. Every hint's tooltip is the full profile.
+        """
+        profiles = self.query_profiles.get(uri)
+        if not profiles:
+            return []
+        doc = self.workspace.get_text_document(uri)
+        lines = doc.source.split("\n")
+        statement_trees = self.statement_trees.setdefault(uri, StatementTreeCache())
+        statement_trees.parse(doc.source)
+        found = {
+            statement_hash(span.text): span for span, _ in statement_trees.statements
+        }
+        # profiles of statements that were edited away are dropped
+        for key in [key for key in profiles if key not in found]:
+            del profiles[key]
+        definitions = {
+            location.concept_address: location.start_line - 1
+            for location in self.concept_locations.get(uri, [])
+            if location.is_definition
+        }
+        definitions.update(
+            (info.name, info.start_line - 1)
+            for info in self.datasource_info.get(uri, [])
+        )
+        hints: Dict[int, InlayHint] = {}
+
+        def hint(line: int, label: str, profile: QueryProfile):
+            if line in hints or not 0 <= line < len(lines):
+                return
+            hints[line] = InlayHint(
+                position=Position(line, len(lines[line].rstrip())),
+                label=label,
+                tooltip=MarkupContent(
+                    kind=MarkupKind.Markdown, value=profile.to_markdown()
+                ),
+                padding_left=True,
+            )
+
+        for key, profile in profiles.items():
+            span = found[key]
+            hint(
+                span.line,
+                f"{format_seconds(profile.seconds)}, {profile.rows:,} rows",
+                profile,
+            )
+            for cte in profile.hot():
+                label = (
+                    f"{cte.name}: {format_seconds(cte.seconds)} "
+                    f"({profile.share(cte):.0%}), {cte.rows:,} rows"
+                )
+                for name in cte.concepts + cte.datasources:
+                    if name in definitions:
+                        hint(definitions[name], label, profile)
+        return [hints[line] for line in sorted(hints)]
+
+    def workspace_root(self: "TrilogyLanguageServer", uri: str) -> Path:
+        """The workspace folder holding ``uri``, or its directory outside one."""
+        path = Path(to_fs_path(uri) or ".")
+        roots = [root for root in self.workspace_roots() if path.is_relative_to(root)]
+        if roots:
+            return max(roots, key=lambda root: len(root.parts))
+        return self.working_path(uri)
+
+    def statement_at(
+        self: "TrilogyLanguageServer", uri: str, position: t.Any
+    ) -> Optional[t.Tuple[StatementSpan, SyntaxNode]]:
+        """The statement of ``uri`` at a ``{"line", "character"}`` position."""
+        doc = self.workspace.get_text_document(uri)
+        statement_trees = self.statement_trees.setdefault(uri, StatementTreeCache())
+        statement_trees.parse(doc.source)
+        offset = LineIndex(doc.source).offset(
+            Position(_param(position, "line", 0), _param(position, "character", 0))
+        )
+        return next(
+            (
+                (span, tree)
+                for span, tree in statement_trees.statements
+                if span.start <= offset <= statement_end(span)
+            ),
+            None,
+        )
+
+    def document_environment(
+        self: "TrilogyLanguageServer", uri: str
+    ) -> t.Tuple[Environment, str]:
+        """The environment after the whole document, with its fingerprint."""
+        statements = self.statement_trees[uri].statements
+        working_path = self.working_path(uri)
+        texts = [span.text for span, _ in statements]
+        imports = files_fingerprint(imported_files(working_path, texts))
+        environment = self.environments.get(uri)
+        if environment is None or self.environment_imports.get(uri) != imports:
+            environment = Environment(working_path=working_path)
+            parser = TopLevelStatementParser(environment=environment)
+            for span, tree in statements:
+                try:
+                    parser.parse(SyntaxDocument(text=span.text, tree=tree))
+                except Exception:
+                    continue
+            self.environments[uri] = environment
+            self.environment_imports[uri] = imports
+        return environment, document_fingerprint(working_path, texts)
+
+    def completion_index(self: "TrilogyLanguageServer", uri: str) -> DocumentIndex:
+        """Return the completion index for ``uri``, rebuilding it if stale."""
+        concept_info = self.concept_info.get(uri, {})
+        datasources = self.datasource_info.get(uri, [])
+        locations = self.concept_locations.get(uri, [])
+        cached = self.completion_indexes.get(uri)
+        if (
+            cached
+            and cached[0] is concept_info
+            and cached[1] is datasources
+            and cached[2] is locations
+        ):
+            return cached[3]
+        index = build_document_index(concept_info, datasources, uri, locations)
+        self.completion_indexes[uri] = (concept_info, datasources, locations, index)
+        return index
+
+    def call_index(self: "TrilogyLanguageServer", uri: str) -> CallIndex:
+        """Return the call index for the current version of ``uri``."""
+        doc = self.workspace.get_text_document(uri)
+        cached = self.call_indexes.get(uri)
+        if cached and cached[0] is not None and cached[0] == doc.version:
+            return cached[1]
+        index = CallIndex(doc.source)
+        self.call_indexes[uri] = (doc.version, index)
+        return index
+
+    def memory_report(
+        self: "TrilogyLanguageServer", tracemalloc: Optional[str] = None, top: int = 10
+    ) -> Dict[str, t.Any]:
+        """Report approximate retained size per per-URI store.
+
+        ``tracemalloc`` optionally controls allocation tracking: ``start`` records a
+        baseline snapshot, ``diff`` adds the top allocation sites grown since the
+        baseline (``rebase`` does the same and moves the baseline forward), and
+        ``stop`` ends tracking.
+        """
+        report = store_report(
+            {name: getattr(self, name) for name in self.PER_URI_STORES}
+        )
+        if tracemalloc == "start":
+            self.allocation_tracker.start()
+        elif tracemalloc in ("diff", "rebase"):
+            report["allocations"] = self.allocation_tracker.diff(
+                top=top, rebase=tracemalloc == "rebase"
+            )
+        elif tracemalloc == "stop":
+            self.allocation_tracker.stop()
+        elif tracemalloc is not None:
+            raise ValueError(f"Unknown tracemalloc action: {tracemalloc}")
+        report["tracemalloc"] = self.allocation_tracker.active
+        return report
+
     def publish_tokens(
         self: "TrilogyLanguageServer", original_text: str, raw_tree: SyntaxNode, uri: str
     ):
@@ -198,6 +969,50 @@ class TrilogyLanguageServer(LanguageServer):
             )
             self.import_info[uri] = []
 
+    def publish_complexity(
+        self: "TrilogyLanguageServer",
+        uri: str,
+        text: str,
+        metrics: Dict[int, QueryMetrics],
+    ):
+        """Flag compiled queries over the complexity thresholds as warnings."""
+        lines = text.split("\n")
+        diagnostics = [
+            Diagnostic(
+                Range(
+                    Position(line, 0),
+                    Position(line, len(lines[line]) if line < len(lines) else 0),
+                ),
+                message,
+                severity=DiagnosticSeverity.Warning,
+            )
+            for line, found in sorted(metrics.items())
+            for message in self.complexity_thresholds.exceeded(found)
+        ]
+        _, previous = self.complexity_results.get(uri, (None, []))
+        self.complexity_results[uri] = (self.document_versions.get(uri), diagnostics)
+        if (diagnostics or previous) and not self.pull_diagnostics:
+            self.text_document_publish_diagnostics(
+                PublishDiagnosticsParams(
+                    uri=uri,
+                    diagnostics=self.current_diagnostics(uri),
+                    version=self.document_versions.get(uri),
+                )
+            )
+
+    def current_diagnostics(
+        self: "TrilogyLanguageServer", uri: str
+    ) -> List[Diagnostic]:
+        """Syntax diagnostics, with the other results for the same version."""
+        diagnostics = list(self.syntax_diagnostics.get(uri, []))
+        for version, found in (
+            self.complexity_results.get(uri, (None, [])),
+            self.semantic_results.get(uri, (None, [])),
+        ):
+            if version == self.document_versions.get(uri):
+                diagnostics.extend(found)
+        return diagnostics
+
     def publish_code_lens(
         self: "TrilogyLanguageServer", original_text: str, raw_tree: SyntaxNode, uri: str
     ):
@@ -210,13 +1025,17 @@ class TrilogyLanguageServer(LanguageServer):
         if not environment:
             environment = Environment(working_path=env_path)
             self.environments[uri] = environment
+        metrics: Dict[int, QueryMetrics] = {}
         lenses = code_lense_tree(
             environment=environment,
             text=original_text,
             input=raw_tree,
-            dialect=self.dialect,
+            dialect=self.sql_renderer.dialect(self.dialects_for(uri)[0]),
+            uri=uri,
+            metrics=metrics,
         )
         self.code_lens[uri] = lenses
+        self.publish_complexity(uri, original_text, metrics)
 
         # Extract concept information from the environment for hover support
         try:
@@ -249,9 +1068,200 @@ class TrilogyLanguageServer(LanguageServer):
 trilogy_server = TrilogyLanguageServer()
 
 
+@trilogy_server.feature(INITIALIZED)
+def initialized(ls: TrilogyLanguageServer, params: InitializedParams):
+    """Start background services once the client is connected."""
+    loop = asyncio.get_running_loop()
+    ls.watchdog.start(loop)
+    ls.schedule_workspace_check()
+    loop.create_task(ls.load_dialects())
+    loop.create_task(ls.load_query_settings())
+
+
+@trilogy_server.feature(WORKSPACE_DID_CHANGE_CONFIGURATION)
+async def did_change_configuration(
+    ls: TrilogyLanguageServer, params: DidChangeConfigurationParams
+):
+    await ls.load_dialects()
+    await ls.load_query_settings()
+
+
+@trilogy_server.feature(SHUTDOWN)
+def shutdown(ls: TrilogyLanguageServer, params: None):
+    ls.watchdog.stop()
+    ls.workspace_scheduler.shutdown()
+    ls.sql_renderer.shutdown()
+    ls.query_executor.shutdown()
+
+
+@trilogy_server.feature(TrilogyLanguageServer.RENDER_SQL)
+async def render_sql(ls: TrilogyLanguageServer, params: t.Any):
+    """Compile the statement at a position for several dialects at once.
+
+    Params are ``{"textDocument": {"uri"}, "position": {"line", "character"}}``
+    and optionally ``"dialects"``, which defaults to the workspace's dialects.
+    Returns one ``{"dialect", "sql", "error", "cached"}`` entry per dialect.
+    """
+    uri = _param(_param(params, "textDocument"), "uri")
+    target = ls.statement_at(uri, _param(params, "position"))
+    if target is None:
+        return []
+    environment, fingerprint = ls.document_environment(uri)
+    dialects = _param(params, "dialects") or ls.dialects_for(uri)
+    rendered = await ls.sql_renderer.render(
+        dialects, environment, fingerprint, target[0].text, target[1]
+    )
+    return [result.to_dict() for result in rendered]
+
+
+@trilogy_server.feature(TrilogyLanguageServer.EXECUTE_QUERY)
+async def execute_query(ls: TrilogyLanguageServer, params: t.Any):
+    """Run a query on the workspace's DuckDB connection, returning one page.
+
+    Params are either ``{"sql"}``, a ``{"textDocument", "position"}`` statement
+    to compile, or ``{"cursor"}`` to continue an earlier result. ``pageSize``
+    optionally sets the rows per page. Returns ``{"columns", "rows", "cursor",
+    "offset", "done", "cached", "truncated", "sample"}``; pass ``cursor`` back
+    for the next page. Compiled statements over local files are answered from the
+    result cache while those files are unchanged.
+
+    ``timeout``, ``maxRows`` and ``maxBytes`` override the configured limits
+    of a new query. Cancelling the request interrupts DuckDB, and a query
+    still running after a moment reports its progress.
+
+    In sample mode, or given ``sample`` (true, or a percentage), compiled
+    statements read a deterministic sample of each root datasource over
+    local files, taken on first use and again only once its files change;
+    the first page's ``sample`` is the percentage read.
+    """
+    report, end = ls.query_progress(_param(params, "workDoneToken"))
+    try:
+        page = await _execute_query(ls, params, report)
+    finally:
+        end()
+    return page.to_dict()
+
+
+async def _execute_query(
+    ls: TrilogyLanguageServer,
+    params: t.Any,
+    report: t.Callable[[QueryProgress], None],
+):
+    cursor = _param(params, "cursor")
+    if cursor:
+        return await ls.query_executor.next_page(cursor, report)
+    uri = _param(_param(params, "textDocument"), "uri")
+    root = ls.workspace_root(uri) if uri else Path.cwd()
+    sql = _param(params, "sql")
+    cache_key = None
+    sampled = None
+    limits = ls.query_limits.override(
+        timeout=_param(params, "timeout"),
+        max_rows=_param(params, "maxRows"),
+        max_bytes=_param(params, "maxBytes"),
+    )
+    if sql is None:
+        target = ls.statement_at(uri, _param(params, "position"))
+        if target is None:
+            raise ValueError("No statement at the given position")
+        environment, fingerprint = ls.document_environment(uri)
+        percent = sample_percent(_param(params, "sample"), ls.sample_percent)
+        roots = sample_sources(environment, root) if percent else []
+        if percent and roots:
+            samples = await ls.query_executor.sample(
+                root, roots, percent, limits, report
+            )
+            environment = sampled_environment(environment, samples)
+            # rendered against the samples, so cached apart from the full query
+            paths = sorted(str(path) for path in samples.values())
+            fingerprint = "\n".join([fingerprint, *paths])
+            sampled = percent
+        (rendered,) = await ls.sql_renderer.render(
+            DEFAULT_DIALECTS,
+            environment,
+            fingerprint,
+            target[0].text,
+            target[1],
+        )
+        if rendered.sql is None:
+            raise ValueError(rendered.error)
+        sql = rendered.sql
+        # compiled queries only read datasources, so their results can be
+        # reused until a file behind one changes
+        sources = datasource_fingerprint(environment, root, rendered.datasources)
+        if sources is not None:
+            cache_key = result_key(sql, sources)
+    page = await ls.query_executor.execute(
+        root, sql, _param(params, "pageSize"), cache_key, limits, report
+    )
+    return page._replace(sample=sampled)
+
+
+@trilogy_server.command(TrilogyLanguageServer.CMD_PROFILE_QUERY)
+async def profile_query(ls: TrilogyLanguageServer, *args):
+    """Profile the query at ``{"textDocument", "position"}`` with EXPLAIN ANALYZE.
+
+    The statement is compiled for DuckDB with its CTEs materialized, so the
+    time of each can be told apart, and run on the workspace's connection.
+    The profile is shown as inlay hints until the statement is edited.
+    """
+    params = args[0] if args else {}
+    uri = _param(_param(params, "textDocument"), "uri")
+    target = ls.statement_at(uri, _param(params, "position"))
+    if target is None:
+        raise ValueError("No statement at the given position")
+    span, tree = target
+    environment, _ = ls.document_environment(uri)
+    dialect = DEFAULT_DIALECTS[0]
+
+    def compile_query() -> t.Tuple[t.Any, str]:
+        processed = ls.sql_renderer.plan(dialect, environment, span.text, tree)
+        sql = ls.sql_renderer.dialect(dialect).compile_statement(processed)
+        # all but the last CTE, which is rendered as the final select
+        names = [cte.name for cte in processed.ctes[:-1]]
+        return processed, materialize_ctes(sql, names)
+
+    loop = asyncio.get_running_loop()
+    environment = environment.duplicate()
+    processed, sql = await loop.run_in_executor(
+        ls.sql_renderer.executor, compile_query
+    )
+    report, end = ls.query_progress()
+    try:
+        plan = await ls.query_executor.profile(
+            ls.workspace_root(uri), sql, ls.query_limits, report
+        )
+    finally:
+        end()
+    profile = build_profile(processed, plan, statement_hash(span.text))
+    ls.query_profiles.setdefault(uri, {})[profile.statement] = profile
+    capabilities = getattr(ls.protocol, "client_capabilities", None)
+    inlay_hint = getattr(getattr(capabilities, "workspace", None), "inlay_hint", None)
+    if getattr(inlay_hint, "refresh_support", False):
+        ls.workspace_inlay_hint_refresh(None)
+    return profile.to_dict()
+
+
+@trilogy_server.feature(TEXT_DOCUMENT_INLAY_HINT)
+def inlay_hint(ls: TrilogyLanguageServer, params: InlayHintParams) -> List[InlayHint]:
+    """Return the query profile hints within the requested lines."""
+    start, end = params.range.start.line, params.range.end.line
+    return [
+        hint
+        for hint in ls.profile_hints(params.text_document.uri)
+        if start <= hint.position.line <= end
+    ]
+
+
+@trilogy_server.feature(TrilogyLanguageServer.CLOSE_QUERY)
+def close_query(ls: TrilogyLanguageServer, params: t.Any) -> bool:
+    """Release a result that will not be read to the end."""
+    return ls.query_executor.close(_param(params, "cursor"))
+
+
 @trilogy_server.feature(TEXT_DOCUMENT_FORMATTING)
 def format_document(
-    ls: LanguageServer, params: DocumentFormattingParams
+    ls: TrilogyLanguageServer, params: DocumentFormattingParams
 ) -> Optional[List[TextEdit]]:
     """Format the entire document"""
     ls.window_log_message(
@@ -260,49 +1270,61 @@ def format_document(
 
     doc = ls.workspace.get_text_document(params.text_document.uri)
 
-    # Extract working path from document URI for proper import resolution
-    # Imports are relative to the file containing the import statement
-    fs_path_str = to_fs_path(params.text_document.uri)
-    if fs_path_str:
-        working_path = Path(fs_path_str).parent
-        env = Environment(working_path=working_path)
-    else:
-        # For non-file URIs (e.g., untitled:), use default Environment
-        env = Environment()
-
+    # Aliased imports are stubbed rather than loaded; the rest resolve relative
+    # to the document (see ``working_path``). Only statements that change are
+    # sent, a line diff at a time, and statements known to be formatted are not
+    # rendered again.
     try:
-        r = Renderer()
-        source_text = doc.source
-        syntax_doc = parse_syntax(source_text)
-        parser = TopLevelStatementParser(environment=env)
-        pass_two = parser.parse(syntax_doc)
-        formatted_text = "\n".join([r.to_string(v) for v in pass_two])
-
-        # Calculate the range covering the entire document
-        lines = source_text.split("\n")
-        last_line = len(lines) - 1
-        last_char = len(lines[last_line]) if lines else 0
-
-        # Return a TextEdit that replaces the entire document
-        return [
-            TextEdit(
-                range=Range(
-                    start=Position(line=0, character=0),
-                    end=Position(line=last_line, character=last_char),
-                ),
-                new_text=formatted_text,
-            )
-        ]
+        edits = ls.format_statements(
+            params.text_document.uri, doc.source, whole_document=True
+        )
     except Exception as e:
         ls.window_log_message(
             LogMessageParams(type=MessageType.Error, message=f"Formatting failed: {e}")
         )
         return None
+    if edits is None:
+        ls.window_log_message(
+            LogMessageParams(
+                type=MessageType.Error,
+                message="Formatting failed: no statement could be rendered",
+            )
+        )
+    return edits
+
+
+@trilogy_server.feature(TEXT_DOCUMENT_RANGE_FORMATTING)
+def format_range(
+    ls: TrilogyLanguageServer, params: DocumentRangeFormattingParams
+) -> Optional[List[TextEdit]]:
+    """Format only the statements overlapping the selected range."""
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    lines = LineIndex(doc.source)
+    return ls.format_statements(
+        params.text_document.uri,
+        doc.source,
+        lines.offset(params.range.start),
+        lines.offset(params.range.end),
+    )
+
+
+@trilogy_server.feature(
+    TEXT_DOCUMENT_ON_TYPE_FORMATTING,
+    DocumentOnTypeFormattingOptions(first_trigger_character=";"),
+)
+def format_on_type(
+    ls: TrilogyLanguageServer, params: DocumentOnTypeFormattingParams
+) -> Optional[List[TextEdit]]:
+    """Format the statement just terminated with a semicolon."""
+    doc = ls.workspace.get_text_document(params.text_document.uri)
+    # the semicolon is the character before the cursor
+    offset = max(LineIndex(doc.source).offset(params.position) - 1, 0)
+    return ls.format_statements(params.text_document.uri, doc.source, offset, offset)
 
 
 @trilogy_server.feature(
     TEXT_DOCUMENT_COMPLETION,
-    CompletionOptions(trigger_characters=[",", ".", " "]),
+    CompletionOptions(trigger_characters=[",", ".", " "], resolve_provider=True),
 )
 def completions(ls: TrilogyLanguageServer, params: Optional[CompletionParams] = None):
     """Returns completion items."""
@@ -317,135 +1339,40 @@ def completions(ls: TrilogyLanguageServer, params: Optional[CompletionParams] =
         )
     )
 
-    items: t.List[CompletionItem] = []
-
-    # Get concept information from the document
-    concept_info_map = ls.concept_info.get(uri, {})
-
-    # Add concepts as completion items
-    for address, concept in concept_info_map.items():
-        # Skip internal concepts
-        if concept.namespace == "__preql_internal":
-            continue
-
-        # Determine icon based on purpose
-        kind = CompletionItemKind.Variable
-        if concept.purpose == "key":
-            kind = CompletionItemKind.Field
-        elif concept.purpose == "property":
-            kind = CompletionItemKind.Property
-        elif concept.purpose == "metric":
-            kind = CompletionItemKind.Value
-        elif concept.purpose == "constant":
-            kind = CompletionItemKind.Constant
-
-        # Create documentation
-        doc_parts = [f"**{concept.purpose}** `{concept.name}`: `{concept.datatype}`"]
-        if concept.description:
-            doc_parts.append(concept.description)
-        if concept.lineage:
-            doc_parts.append(
-                f"Derivation: `{concept.lineage[:50]}...`"
-                if len(concept.lineage) > 50
-                else f"Derivation: `{concept.lineage}`"
-            )
-
-        items.append(
-            CompletionItem(
-                label=concept.name,
-                kind=kind,
-                detail=f"{concept.purpose}: {concept.datatype}",
-                documentation=MarkupContent(
-                    kind=MarkupKind.Markdown,
-                    value="\n\n".join(doc_parts),
-                ),
-                insert_text=concept.name,
-                sort_text=f"0_{concept.name}",  # Prioritize concepts
-            )
-        )
-
-    # Add Trilogy keywords
-    keywords = [
-        "select",
-        "key",
-        "property",
-        "metric",
-        "const",
-        "datasource",
-        "import",
-        "as",
-        "where",
-        "order",
-        "by",
-        "limit",
-        "asc",
-        "desc",
-        "and",
-        "or",
-        "not",
-        "in",
-        "between",
-        "like",
-        "is",
-        "null",
-        "true",
-        "false",
-        "grain",
-        "address",
-        "auto",
-        "persist",
-        "into",
-        "rowset",
-        "merge",
-        "show",
-    ]
-
-    for keyword in keywords:
-        items.append(
-            CompletionItem(
-                label=keyword,
-                kind=CompletionItemKind.Keyword,
-                detail="keyword",
-                insert_text=keyword,
-                sort_text=f"1_{keyword}",  # Keywords after concepts
-            )
-        )
-
-    # Add Trilogy functions
-    for func_name, func_info in TRILOGY_FUNCTIONS.items():
-        items.append(
-            CompletionItem(
-                label=func_name,
-                kind=CompletionItemKind.Function,
-                detail=func_info["signature"],
-                documentation=MarkupContent(
-                    kind=MarkupKind.Markdown,
-                    value=func_info["description"],
-                ),
-                insert_text=f"{func_name}($1)",
-                insert_text_format=InsertTextFormat.Snippet,
-                sort_text=f"2_{func_name}",  # Functions after keywords
-            )
-        )
-
-    # Add datasource names
-    datasources = ls.datasource_info.get(uri, [])
-    for ds in datasources:
-        items.append(
-            CompletionItem(
-                label=ds.name,
-                kind=CompletionItemKind.Struct,
-                detail=f"datasource -> {ds.address}",
-                documentation=MarkupContent(
-                    kind=MarkupKind.Markdown,
-                    value=f"**Datasource:** `{ds.name}`\n\n**Address:** `{ds.address}`",
-                ),
-                insert_text=ds.name,
-                sort_text=f"3_{ds.name}",
-            )
+    doc = ls.workspace.get_text_document(uri)
+    line, character = params.position.line, params.position.character
+    prefix = extract_prefix(doc.source, line, character)
+    indexes, search, narrowed = context_indexes(
+        ls.completion_index(uri),
+        completion_context(doc.source, line, character, prefix),
+        prefix,
+        params.context.trigger_character if params.context else None,
+    )
+    items, truncated = complete(
+        indexes, search, limit=MAX_COMPLETION_ITEMS, cache=ls.completion_scores
+    )
+    # An incomplete list makes the client re-request as the prefix grows instead
+    # of filtering a truncated or narrowed set locally, which would hide the
+    # keywords and functions left out of a list of concepts
+    return CompletionList(is_incomplete=truncated or narrowed, items=items)
+
+
+@trilogy_server.feature(COMPLETION_ITEM_RESOLVE)
+def completion_resolve(ls: TrilogyLanguageServer, item: CompletionItem):
+    """Fill in documentation for the completion item the user highlighted."""
+    if not isinstance(item.data, dict) or item.documentation is not None:
+        return item
+    uri = item.data.get("uri")
+    documentation = resolve_documentation(
+        item.data,
+        ls.concept_info.get(uri, {}) if uri else {},
+        ls.datasource_info.get(uri, []) if uri else [],
+    )
+    if documentation:
+        item.documentation = MarkupContent(
+            kind=MarkupKind.Markdown, value=documentation
         )
-
-    return CompletionList(is_incomplete=False, items=items)
+    return item
 
 
 @trilogy_server.feature(TEXT_DOCUMENT_DID_CHANGE)
@@ -466,6 +1393,73 @@ async def did_open(ls: TrilogyLanguageServer, params: DidOpenTextDocumentParams)
     ls._validate(params)
 
 
+@trilogy_server.feature(TEXT_DOCUMENT_DID_SAVE)
+def did_save(ls: TrilogyLanguageServer, params: DidSaveTextDocumentParams):
+    """Recheck closed files, which may import the saved document."""
+    ls.schedule_workspace_check()
+
+
+@trilogy_server.feature(WORKSPACE_DID_CHANGE_WATCHED_FILES)
+def did_change_watched_files(
+    ls: TrilogyLanguageServer, params: DidChangeWatchedFilesParams
+):
+    """Recheck closed files after Trilogy files change on disk."""
+    for change in params.changes:
+        if change.type != FileChangeType.Deleted:
+            continue
+        path = to_fs_path(change.uri)
+        if path:
+            ls.workspace_diagnostics.store(Path(path), None)
+        # clear what was pushed for the deleted file
+        if not ls.pull_diagnostics and change.uri not in ls.workspace.text_documents:
+            ls.text_document_publish_diagnostics(
+                PublishDiagnosticsParams(uri=change.uri, diagnostics=[])
+            )
+    # only files without a fresh result, such as importers, are rechecked
+    ls.schedule_workspace_check()
+
+
+@trilogy_server.feature(
+    TEXT_DOCUMENT_DIAGNOSTIC,
+    DiagnosticOptions(
+        identifier="trilogy",
+        inter_file_dependencies=True,
+        workspace_diagnostics=True,
+    ),
+)
+async def document_diagnostic(
+    ls: TrilogyLanguageServer, params: DocumentDiagnosticParams
+) -> DocumentReport:
+    """Pull diagnostics for a document, reporting unchanged results by id."""
+    diagnostics = await ls.document_diagnostics(params)
+    return document_report(diagnostics, params.previous_result_id)
+
+
+@trilogy_server.feature(WORKSPACE_DIAGNOSTIC)
+async def workspace_diagnostic(
+    ls: TrilogyLanguageServer, params: WorkspaceDiagnosticParams
+) -> WorkspaceDiagnosticReport:
+    """Pull diagnostics for the workspace files that are not open."""
+    roots = ls.workspace_roots()
+    task = ls.workspace_scheduler.task
+    if task is None or task.done():
+        # stale files are checked in the process pool, so a full report never
+        # queues ahead of the open documents' checks on the semantic executor
+        task = ls.workspace_scheduler.start(roots, ls.open_files())
+    # shielded so a cancelled request leaves the background check running
+    await asyncio.wait([asyncio.shield(task)])
+    previous = {item.uri: item.value for item in params.previous_result_ids}
+    # files changed since the check are checked here, off the semantic executor
+    reports = await asyncio.get_running_loop().run_in_executor(
+        None,
+        ls.workspace_diagnostics.reports,
+        roots,
+        previous,
+        list(ls.workspace.text_documents),
+    )
+    return WorkspaceDiagnosticReport(items=reports)
+
+
 @trilogy_server.feature(
     TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
     SemanticTokensLegend(
@@ -804,75 +1798,34 @@ def signature_help(
         )
     )
 
-    # Get the document and current line content
-    doc = ls.workspace.get_text_document(uri)
-    lines = doc.source.split("\n")
-
-    if position.line >= len(lines):
+    call = ls.call_index(uri).enclosing_call(position.line, position.character)
+    if call is None:
         return None
-
-    line = lines[position.line]
-    col = position.character
-
-    # Find the function name by looking backwards from cursor
-    # Look for pattern like "function_name("
-    text_before_cursor = line[:col]
-
-    # Find the last open parenthesis and extract function name
-    paren_depth = 0
-    func_start = -1
-    for i in range(len(text_before_cursor) - 1, -1, -1):
-        char = text_before_cursor[i]
-        if char == ")":
-            paren_depth += 1
-        elif char == "(":
-            if paren_depth == 0:
-                # Found the opening paren, now find function name
-                func_end = i
-                func_start = i - 1
-                while func_start >= 0 and (
-                    text_before_cursor[func_start].isalnum()
-                    or text_before_cursor[func_start] == "_"
-                ):
-                    func_start -= 1
-                func_start += 1
-                func_name = text_before_cursor[func_start:func_end].strip()
-
-                # Check if this is a known function
-                if func_name.lower() in TRILOGY_FUNCTIONS:
-                    func_info = TRILOGY_FUNCTIONS[func_name.lower()]
-
-                    # Count commas to determine active parameter
-                    text_after_paren = text_before_cursor[func_end + 1 :]
-                    active_param = text_after_paren.count(",")
-
-                    return SignatureHelp(
-                        signatures=[
-                            SignatureInformation(
-                                label=func_info["signature"],
-                                documentation=MarkupContent(
-                                    kind=MarkupKind.Markdown,
-                                    value=func_info["description"],
-                                ),
-                                parameters=[
-                                    ParameterInformation(
-                                        label=param["name"],
-                                        documentation=param.get("description", ""),
-                                    )
-                                    for param in func_info.get("parameters", [])
-                                ],
-                            )
-                        ],
-                        active_signature=0,
-                        active_parameter=min(
-                            active_param, len(func_info.get("parameters", [])) - 1
-                        ),
+    func_info = lookup_function(TRILOGY_FUNCTIONS, call.name)
+    if func_info is None:
+        return None
+    return SignatureHelp(
+        signatures=[
+            SignatureInformation(
+                label=func_info["signature"],
+                documentation=MarkupContent(
+                    kind=MarkupKind.Markdown,
+                    value=func_info["description"],
+                ),
+                parameters=[
+                    ParameterInformation(
+                        label=param["name"],
+                        documentation=param.get("description", ""),
                     )
-                break
-            else:
-                paren_depth -= 1
-
-    return None
+                    for param in func_info.get("parameters", [])
+                ],
+            )
+        ],
+        active_signature=0,
+        active_parameter=min(
+            call.argument, len(func_info.get("parameters", [])) - 1
+        ),
+    )
 
 
 @trilogy_server.feature(TEXT_DOCUMENT_CODE_LENS)
@@ -923,6 +1876,37 @@ def code_lens_resolve(ls: LanguageServer, item: CodeLens):
     return item
 
 
+@trilogy_server.command(TrilogyLanguageServer.CMD_MEMORY_REPORT)
+def memory_report(ls: TrilogyLanguageServer, *args):
+    """Report approximate memory use of the per-URI caches.
+
+    Accepts an optional options object, e.g. ``{"tracemalloc": "diff", "top": 20}``.
+    """
+    options = args[0] if args and isinstance(args[0], dict) else {}
+    try:
+        report = ls.memory_report(
+            tracemalloc=options.get("tracemalloc"), top=int(options.get("top", 10))
+        )
+    except (RuntimeError, ValueError) as e:
+        ls.window_log_message(
+            LogMessageParams(type=MessageType.Error, message=f"Memory report: {e}")
+        )
+        return None
+    ls.window_log_message(
+        LogMessageParams(type=MessageType.Info, message=format_memory_report(report))
+    )
+    return report
+
+
+@trilogy_server.command(TrilogyLanguageServer.CMD_METRICS_REPORT)
+def metrics_report(ls: TrilogyLanguageServer, *args):
+    """Return operational counters and the most recent event loop stalls."""
+    return {
+        "counters": dict(ls.metrics),
+        "stalls": [report.model_dump() for report in ls.watchdog.stalls],
+    }
+
+
 def handle_config(ls: TrilogyLanguageServer, config):
     """Handle the configuration sent by the client."""
     try:
@@ -0,0 +1,102 @@
+"""Locates the function call enclosing a cursor position for signature help."""
+
+from bisect import bisect_left
+from typing import List, NamedTuple, Optional
+
+
+class CallState(NamedTuple):
+    """The innermost open call after a bracket or comma event."""
+
+    name: str
+    # zero-based index of the argument being written
+    argument: int
+
+
+class CallIndex:
+    """
+    Bracket and comma events of a document, with the call state after each.
+
+    Built in one forward pass that skips strings and comments, so calls spanning
+    several lines and nested calls are tracked correctly. A position lookup is a
+    bisect over the event offsets.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.line_starts = [0]
+        position = text.find("\n")
+        while position >= 0:
+            self.line_starts.append(position + 1)
+            position = text.find("\n", position + 1)
+        self.length = len(text)
+        self.offsets: List[int] = []
+        self.states: List[Optional[CallState]] = []
+        self._scan(text)
+
+    def _scan(self, text: str) -> None:
+        # each entry is the open bracket's call, or None for non-call brackets
+        stack: List[Optional[CallState]] = []
+        name_start = name_end = -1
+        idx = 0
+        length = len(text)
+        while idx < length:
+            char = text[idx]
+            if char in "'\"`":
+                idx = _skip_string(text, idx)
+                name_end = -1
+                continue
+            if char == "#" or text.startswith("//", idx):
+                end = text.find("\n", idx)
+                idx = length if end < 0 else end + 1
+                continue
+            if char.isalnum() or char == "_":
+                name_start = idx
+                while idx < length and (text[idx].isalnum() or text[idx] == "_"):
+                    idx += 1
+                name_end = idx
+                continue
+            if char == "(":
+                # the identifier directly before the bracket, whitespace aside
+                called = name_end >= 0 and not text[name_end:idx].strip()
+                stack.append(
+                    CallState(text[name_start:name_end].lower(), 0) if called else None
+                )
+            elif char == "[":
+                stack.append(None)
+            elif char in ")]":
+                if stack:
+                    stack.pop()
+            elif char == ",":
+                if stack and stack[-1] is not None:
+                    stack[-1] = stack[-1]._replace(argument=stack[-1].argument + 1)
+            elif char == ";":
+                stack.clear()
+            if char in "()[],;":
+                self.offsets.append(idx)
+                self.states.append(stack[-1] if stack else None)
+            if not char.isspace():
+                name_end = -1
+            idx += 1
+
+    def offset(self, line: int, character: int) -> int:
+        if line >= len(self.line_starts):
+            return self.length
+        return min(self.line_starts[line] + character, self.length)
+
+    def enclosing_call(self, line: int, character: int) -> Optional[CallState]:
+        """Return the innermost call open at the position, if any."""
+        event = bisect_left(self.offsets, self.offset(line, character)) - 1
+        return self.states[event] if event >= 0 else None
+
+
+def _skip_string(text: str, start: int) -> int:
+    """Return the offset after the string starting at ``start``."""
+    quote = text[start]
+    idx = start + 1
+    while idx < len(text):
+        if text[idx] == "\\":
+            idx += 2
+            continue
+        if text[idx] == quote:
+            return idx + 1
+        idx += 1
+    return len(text)
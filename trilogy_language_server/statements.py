@@ -0,0 +1,206 @@
+"""Statement-level parsing, so a syntax error only costs its own statement."""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from trilogy.core.exceptions import InvalidSyntaxException
+from trilogy.parsing.parse_engine_v2 import parse_syntax
+from trilogy.parsing.v2.syntax import SyntaxNode, SyntaxNodeKind, SyntaxToken
+
+SyntaxElement = Union[SyntaxNode, SyntaxToken]
+
+
+class StatementSpan(NamedTuple):
+    """A top-level statement and where it starts in the document (0-based)."""
+
+    text: str
+    start: int
+    line: int
+    column: int
+
+
+def split_statements(text: str) -> List[StatementSpan]:
+    """
+    Split a document after each top-level ``;``.
+
+    Strings and comments are skipped so semicolons inside them do not split.
+    Each span starts at its first non-whitespace character and keeps leading
+    comments, so inserting blank lines above a statement leaves its text (and
+    cached parse) unchanged. A trailing blank remainder is dropped.
+    """
+    spans: List[StatementSpan] = []
+    start = line = column = 0
+    current_line = 0
+    line_start = 0
+    idx = 0
+    length = len(text)
+    while idx < length:
+        char = text[idx]
+        if char in "'\"`":
+            end = string_end(text, idx)
+        elif char == "#" or text.startswith("//", idx):
+            end = text.find("\n", idx)
+            end = length if end < 0 else end
+        else:
+            end = idx + 1
+        newlines = text.count("\n", idx, end)
+        if newlines:
+            current_line += newlines
+            line_start = text.rfind("\n", idx, end) + 1
+        if char == ";":
+            spans.append(_span(text, start, end, line, column))
+            start, line, column = end, current_line, end - line_start
+        idx = end
+    if text[start:].strip():
+        spans.append(_span(text, start, length, line, column))
+    return spans
+
+
+def _span(text: str, start: int, end: int, line: int, column: int) -> StatementSpan:
+    segment = text[start:end]
+    stripped = segment.lstrip()
+    lead = len(segment) - len(stripped)
+    newlines = segment.count("\n", 0, lead)
+    if newlines:
+        line += newlines
+        column = lead - segment.rfind("\n", 0, lead) - 1
+    else:
+        column += lead
+    return StatementSpan(stripped, start + lead, line, column)
+
+
+def string_end(text: str, start: int) -> int:
+    quote = text[start]
+    if text.startswith(quote * 3, start):
+        end = text.find(quote * 3, start + 3)
+        return len(text) if end < 0 else end + 3
+    idx = start + 1
+    while idx < len(text):
+        if text[idx] == "\\":
+            idx += 2
+            continue
+        if text[idx] == quote:
+            return idx + 1
+        idx += 1
+    return len(text)
+
+
+def shift_element(element: SyntaxElement, span: StatementSpan) -> SyntaxElement:
+    """
+    Copy a statement-relative syntax element to document coordinates.
+
+    Parsed lines and columns are 1-based; columns only move on the statement's
+    first line. Cached parse results are shared, so they are never mutated.
+    """
+
+    def line(value: Optional[int]) -> Optional[int]:
+        return None if value is None else value + span.line
+
+    def column(value: Optional[int], at_line: Optional[int]) -> Optional[int]:
+        if value is None or at_line != 1:
+            return value
+        return value + span.column
+
+    def pos(value: Optional[int]) -> Optional[int]:
+        return None if value is None else value + span.start
+
+    if isinstance(element, SyntaxToken):
+        return SyntaxToken(
+            element.name,
+            element.value,
+            line(element.line),
+            column(element.column, element.line),
+            line(element.end_line),
+            column(element.end_column, element.end_line),
+            pos(element.start_pos),
+            pos(element.end_pos),
+            element.kind,
+        )
+    return SyntaxNode(
+        element.name,
+        [shift_element(child, span) for child in element.children],
+        line(element.line),
+        column(element.column, element.line),
+        line(element.end_line),
+        column(element.end_column, element.end_line),
+        pos(element.start_pos),
+        pos(element.end_pos),
+        element.kind,
+    )
+
+
+class StatementFailure(NamedTuple):
+    span: StatementSpan
+    error: InvalidSyntaxException
+
+
+class StatementTreeCache:
+    """
+    Parses a document statement by statement, reusing unchanged statements.
+
+    Statement trees are cached by statement text and their document-positioned
+    copies by (text, offset), so an edit reparses only the edited statement and
+    only re-positions the statements after it. Broken statements are reported
+    and left out of the combined tree, so tokens, hover and completion keep
+    working for the rest of the document.
+    """
+
+    def __init__(self) -> None:
+        self.trees: Dict[str, Union[SyntaxNode, InvalidSyntaxException]] = {}
+        self.placed: Dict[StatementSpan, List[SyntaxElement]] = {}
+        # statement-relative trees of the last parse, in document order
+        self.statements: List[Tuple[StatementSpan, SyntaxNode]] = []
+        self.parsed = 0
+
+    def __len__(self) -> int:
+        return len(self.trees)
+
+    def _statement_tree(self, text: str) -> Union[SyntaxNode, InvalidSyntaxException]:
+        cached = self.trees.get(text)
+        if cached is None:
+            self.parsed += 1
+            try:
+                cached = parse_syntax(text).tree
+            except InvalidSyntaxException as e:
+                cached = e
+        return cached
+
+    def parse(self, text: str) -> Tuple[SyntaxNode, List[StatementFailure]]:
+        """Return a document tree of the statements that parse, and the failures."""
+        trees: Dict[str, Union[SyntaxNode, InvalidSyntaxException]] = {}
+        placed: Dict[StatementSpan, List[SyntaxElement]] = {}
+        children: List[SyntaxElement] = []
+        failures: List[StatementFailure] = []
+        statements: List[Tuple[StatementSpan, SyntaxNode]] = []
+        for span in split_statements(text):
+            tree = self._statement_tree(span.text)
+            trees[span.text] = tree
+            if isinstance(tree, InvalidSyntaxException):
+                failures.append(StatementFailure(span, tree))
+                continue
+            statements.append((span, tree))
+            elements = self.placed.get(span)
+            if elements is None:
+                elements = (
+                    list(tree.children)
+                    if span.start == 0
+                    else [shift_element(child, span) for child in tree.children]
+                )
+            placed[span] = elements
+            children.extend(elements)
+        # Only the current document's statements are kept
+        self.trees = trees
+        self.placed = placed
+        self.statements = statements
+        end_line = text.count("\n") + 1
+        root = SyntaxNode(
+            "start",
+            children,
+            1,
+            1,
+            end_line,
+            len(text) - text.rfind("\n"),
+            0,
+            len(text),
+            SyntaxNodeKind.DOCUMENT,
+        )
+        return root, failures
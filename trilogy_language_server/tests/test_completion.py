@@ -0,0 +1,224 @@
+import sys
+from typing import Optional
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.completion import (
+    DATASOURCE_COLUMNS,
+    GENERAL,
+    IMPORT,
+    ORDER,
+    SELECT,
+    STATEMENT,
+    WHERE,
+    KEYWORD,
+    STATIC_INDEX,
+    build_document_index,
+    complete,
+    completion_context,
+    context_indexes,
+    extract_prefix,
+    ScoreCache,
+    fuzzy_score,
+    resolve_documentation,
+    score_candidates,
+)
+from trilogy_language_server.models import ConceptInfo, ConceptLocation
+
+
+def make_concept(
+    name: str, namespace: str = "local", description: Optional[str] = None
+) -> ConceptInfo:
+    return ConceptInfo(
+        name=name,
+        address=f"{namespace}.{name}",
+        datatype="INTEGER",
+        purpose="key",
+        namespace=namespace,
+        description=description,
+    )
+
+
+def reference(address: str) -> ConceptLocation:
+    return ConceptLocation(
+        concept_address=address, start_line=0, start_column=0, end_line=0, end_column=1
+    )
+
+
+def test_extract_prefix():
+    text = "key user_id int;\nselect us\nselect b.ord"
+    assert extract_prefix(text, 1, 9) == "us"
+    assert extract_prefix(text, 2, 12) == "b.ord"
+    assert extract_prefix(text, 1, 7) == ""
+    assert extract_prefix(text, 0, 100) == ""
+    assert extract_prefix(text, 10, 0) == ""
+
+
+def test_complete_ranks_concepts_before_keywords():
+    index = build_document_index({"local.selected": make_concept("selected")}, [])
+    items, truncated = complete([STATIC_INDEX, index.concepts], "sel")
+    assert not truncated
+    assert [item.label for item in items] == ["selected", "select"]
+    assert items[0].sort_text < items[1].sort_text
+
+
+def test_complete_truncates_large_models():
+    concepts = {
+        f"local.concept_{idx}": make_concept(f"concept_{idx}") for idx in range(5000)
+    }
+    index = build_document_index(concepts, [])
+    items, truncated = complete([STATIC_INDEX, index.concepts], "", limit=50)
+    assert truncated
+    assert len(items) == 50
+
+    items, truncated = complete(
+        [STATIC_INDEX, index.concepts], "concept_4999", limit=50
+    )
+    assert not truncated
+    assert [item.label for item in items] == ["concept_4999"]
+
+
+def test_static_index_contains_keywords_and_functions():
+    labels = {c.label: c.category for c in STATIC_INDEX.candidates}
+    assert labels["select"] == KEYWORD
+    assert "count" in labels
+
+
+def test_items_are_cached_per_index_and_resolved_lazily():
+    concepts = {"local.user_id": make_concept("user_id")}
+    index = build_document_index(concepts, [], "file:///a.preql")
+    first, _ = complete([index.concepts], "user")
+    second, _ = complete([index.concepts], "user")
+    assert first[0] is not second[0]
+    assert index.concepts.candidates[0].item is index.concepts.candidates[0].item
+    assert first[0].documentation is None
+    assert first[0].data == {"uri": "file:///a.preql", "concept": "local.user_id"}
+
+    doc = resolve_documentation(first[0].data, concepts, [])
+    assert doc is not None and "`user_id`" in doc
+    assert resolve_documentation({"concept": "local.missing"}, concepts, []) is None
+
+
+def test_function_items_resolve_description():
+    items, _ = complete([STATIC_INDEX], "count")
+    item = next(i for i in items if i.label == "count")
+    assert item.documentation is None
+    assert resolve_documentation(item.data, {}, [])
+
+
+def test_completion_context():
+    def context(text: str) -> str:
+        lines = text.split("\n")
+        line, character = len(lines) - 1, len(lines[-1])
+        prefix = extract_prefix(text, line, character)
+        return completion_context(text, line, character, prefix)
+
+    assert context("") == STATEMENT
+    assert context("key x int;\nsel") == STATEMENT
+    assert context("select a, ") == SELECT
+    assert context("select a, count(b) as c where ") == WHERE
+    assert context("where a = 'select' and ") == WHERE
+    assert context("select a order by ") == ORDER
+    assert context("select a where x in (select ") == WHERE
+    assert context("import foo as ") == IMPORT
+    assert context("datasource orders (\n  id: ") == DATASOURCE_COLUMNS
+    assert context("metric total <- sum(") == GENERAL
+    assert context("select a # where\n, ") == SELECT
+
+
+def test_context_indexes_member_completion():
+    concepts = {
+        "local.user_id": make_concept("user_id"),
+        "b.order_id": make_concept("order_id", "b"),
+        "b.order_date": make_concept("order_date", "b"),
+        "c.order_id": make_concept("order_id", "c"),
+    }
+    index = build_document_index(concepts, [])
+
+    indexes, search, _ = context_indexes(index, SELECT, "b.ord")
+    items, _ = complete(indexes, search)
+    assert sorted(item.data["concept"] for item in items) == [
+        "b.order_date",
+        "b.order_id",
+    ]
+
+    indexes, search, _ = context_indexes(index, SELECT, "b.")
+    assert len(complete(indexes, search)[0]) == 2
+    assert context_indexes(index, SELECT, "missing.")[0] == []
+
+
+def test_context_indexes_triggers_do_not_dump_everything():
+    index = build_document_index({"local.user_id": make_concept("user_id")}, [])
+
+    indexes, search, narrowed = context_indexes(index, SELECT, "", trigger=",")
+    assert [item.label for item in complete(indexes, search)[0]] == ["user_id"]
+    # keywords and functions were left out, so the client must ask again
+    assert narrowed
+    assert context_indexes(index, SELECT, "", trigger=".")[0] == []
+
+    indexes, search, narrowed = context_indexes(index, STATEMENT, "sel")
+    assert [item.label for item in complete(indexes, search)[0]] == ["select"]
+    assert narrowed
+    assert context_indexes(index, STATEMENT, "")[2] is False
+
+    indexes, search, _ = context_indexes(index, WHERE, "n")
+    labels = [item.label for item in complete(indexes, search)[0]]
+    assert "not" in labels and "select" not in labels
+
+
+def test_fuzzy_score_prefers_boundaries():
+    assert fuzzy_score("oid", "order_id") is not None
+    assert fuzzy_score("xyz", "order_id") is None
+    # word starts beat scattered letters
+    assert fuzzy_score("oid", "order_id") > fuzzy_score("oid", "over_paid")
+    assert fuzzy_score("cn", "customerName") > fuzzy_score("cn", "country")
+    # prefix matches beat boundary matches, exact matches beat both
+    assert fuzzy_score("ord", "order_id") > fuzzy_score("ord", "big_order")
+    assert fuzzy_score("order", "order") > fuzzy_score("order", "order_id")
+
+
+def test_fuzzy_ranking_uses_usage_and_secondary_fields():
+    concepts = {
+        "local.order_id": make_concept("order_id"),
+        "local.order_date": make_concept("order_date"),
+        "local.revenue": make_concept("revenue", description="Gross sales total"),
+        "b.customer_id": make_concept("customer_id", "b"),
+    }
+    locations = [reference("local.order_date")] * 3
+    index = build_document_index(concepts, [], locations=locations)
+
+    items, _ = complete([index.concepts], "ord")
+    assert [item.label for item in items] == ["order_date", "order_id"]
+
+    items, _ = complete([index.concepts], "oid")
+    assert items[0].label == "order_id"
+
+    items, _ = complete([index.concepts], "sales")
+    assert [item.label for item in items] == ["revenue"]
+    assert items[0].filter_text == "sales"
+
+    items, _ = complete([index.concepts], "b.cust")
+    assert [item.label for item in items] == ["customer_id"]
+
+
+def test_score_cache_refines_previous_results():
+    concepts = {
+        f"local.concept_{idx}": make_concept(f"concept_{idx}") for idx in range(50)
+    }
+    concepts["local.other"] = make_concept("other")
+    index = build_document_index(concepts, [])
+    cache = ScoreCache(size=2)
+
+    first = score_candidates([index.concepts], "co", cache)
+    assert len(first) == 50
+    assert score_candidates([index.concepts], "co", cache) is first
+    refined = score_candidates([index.concepts], "con49", cache)
+    assert [c.label for _, c in refined] == ["concept_49"]
+    assert len(cache) == 2
+
+    # a rebuilt index is a new version and never reuses stale scores
+    rebuilt = build_document_index(concepts, [])
+    assert rebuilt.concepts.version != index.concepts.version
+    assert len(score_candidates([rebuilt.concepts], "con", cache)) == 50
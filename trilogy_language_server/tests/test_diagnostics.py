@@ -0,0 +1,206 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import Mock, PropertyMock, patch
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from lsprotocol.types import (
+    ClientCapabilities,
+    DiagnosticClientCapabilities,
+    DidChangeWatchedFilesParams,
+    DidSaveTextDocumentParams,
+    DocumentDiagnosticParams,
+    FileChangeType,
+    FileEvent,
+    RelatedFullDocumentDiagnosticReport,
+    RelatedUnchangedDocumentDiagnosticReport,
+    TextDocumentClientCapabilities,
+    TextDocumentIdentifier,
+    WorkspaceDiagnosticParams,
+    WorkspaceFullDocumentDiagnosticReport,
+    WorkspaceUnchangedDocumentDiagnosticReport,
+)
+from pygls.uris import from_fs_path
+
+from trilogy_language_server.diagnostics import (
+    WorkspaceDiagnostics,
+    document_report,
+    result_id,
+)
+from trilogy_language_server.error_reporting import get_diagnostics
+from trilogy_language_server.server import (
+    TrilogyLanguageServer,
+    did_change_watched_files,
+    did_save,
+    document_diagnostic,
+    workspace_diagnostic,
+)
+
+BROKEN = "key id int;\nselect id, missing;\n"
+
+
+def test_result_id_depends_only_on_content():
+    _, first = get_diagnostics("select 1 ->;")
+    _, second = get_diagnostics("select 1 ->;")
+    assert first and result_id(first) == result_id(second)
+    assert result_id(first) != result_id([])
+
+    report = document_report(first, None)
+    assert isinstance(report, RelatedFullDocumentDiagnosticReport)
+    unchanged = document_report(second, report.result_id)
+    assert isinstance(unchanged, RelatedUnchangedDocumentDiagnosticReport)
+
+
+def test_workspace_reports_unopened_files(tmp_path: Path):
+    (tmp_path / "broken.preql").write_text(BROKEN)
+    (tmp_path / "open.preql").write_text(BROKEN)
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "skipped.preql").write_text(BROKEN)
+    open_uri = from_fs_path(str(tmp_path / "open.preql"))
+    workspace = WorkspaceDiagnostics()
+
+    reports = workspace.reports([tmp_path], {}, skip=[open_uri])
+    assert len(reports) == 1
+    assert isinstance(reports[0], WorkspaceFullDocumentDiagnosticReport)
+    assert "missing" in reports[0].items[0].message
+    assert reports[0].items[0].range.start.line == 1
+
+    # unchanged files are neither rechecked nor resent
+    previous = {reports[0].uri: str(reports[0].result_id)}
+    again = workspace.reports([tmp_path], previous, skip=[open_uri])
+    assert isinstance(again[0], WorkspaceUnchangedDocumentDiagnosticReport)
+    assert workspace.checked == 1
+
+    path = tmp_path / "broken.preql"
+    path.write_text("key id int;\nselect id;\n")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    fixed = workspace.reports([tmp_path], previous, skip=[open_uri])
+    assert isinstance(fixed[0], WorkspaceFullDocumentDiagnosticReport)
+    assert fixed[0].items == []
+
+    path.unlink()
+    assert workspace.reports([tmp_path], previous, skip=[open_uri]) == []
+    assert workspace.results == {}
+
+
+def test_importers_are_rechecked_when_an_import_changes(tmp_path: Path):
+    base = tmp_path / "base.preql"
+    base.write_text("key id int;\n")
+    (tmp_path / "report.preql").write_text("import base;\nselect id;\n")
+    workspace = WorkspaceDiagnostics()
+
+    report_uri = from_fs_path(str(tmp_path / "report.preql"))
+    reports = {r.uri: r for r in workspace.reports([tmp_path], {})}
+    report = reports[report_uri]
+    assert isinstance(report, WorkspaceFullDocumentDiagnosticReport)
+    assert report.items == []
+    assert workspace.checked == 2
+
+    # the importer is unchanged on disk, but what it imports is not
+    base.write_text("key other int;\n")
+    stat = base.stat()
+    os.utime(base, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    reports = {r.uri: r for r in workspace.reports([tmp_path], {})}
+    assert workspace.checked == 4
+    report = reports[report_uri]
+    assert isinstance(report, WorkspaceFullDocumentDiagnosticReport)
+    assert report.items
+
+
+def test_workspace_pull_does_not_use_the_semantic_executor(tmp_path: Path):
+    (tmp_path / "broken.preql").write_text(BROKEN)
+    server = TrilogyLanguageServer()
+    server.workspace_scheduler.executor_factory = lambda workers: (
+        ThreadPoolExecutor(max_workers=workers)
+    )
+    server.semantic_executor = Mock()
+    workspace = Mock(folders={}, root_path=str(tmp_path), text_documents={})
+
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        report = asyncio.run(
+            workspace_diagnostic(server, WorkspaceDiagnosticParams([]))
+        )
+    server.workspace_scheduler.shutdown()
+
+    assert len(report.items) == 1
+    assert isinstance(report.items[0], WorkspaceFullDocumentDiagnosticReport)
+    assert "missing" in report.items[0].items[0].message
+    # checked once, by the scheduler, and reused for the report
+    assert server.workspace_diagnostics.checked == 1
+    server.semantic_executor.submit.assert_not_called()
+
+
+def test_pull_diagnostics_include_semantic_results():
+    server = TrilogyLanguageServer()
+    server.protocol.client_capabilities = ClientCapabilities(
+        text_document=TextDocumentClientCapabilities(
+            diagnostic=DiagnosticClientCapabilities()
+        )
+    )
+    server.window_log_message = Mock()
+    server.text_document_publish_diagnostics = Mock()
+    workspace = Mock()
+    workspace.get_text_document.return_value = Mock(
+        source=BROKEN, version=1, uri="untitled:doc"
+    )
+    params = DocumentDiagnosticParams(
+        text_document=TextDocumentIdentifier(uri="untitled:doc")
+    )
+
+    async def pull(previous=None):
+        params.previous_result_id = previous
+        return await document_diagnostic(server, params)
+
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        report = asyncio.run(pull())
+        unchanged = asyncio.run(pull(report.result_id))
+
+    assert isinstance(report, RelatedFullDocumentDiagnosticReport)
+    assert [d.range.start.line for d in report.items] == [1]
+    assert isinstance(unchanged, RelatedUnchangedDocumentDiagnosticReport)
+    # pull clients are never pushed diagnostics
+    server.text_document_publish_diagnostics.assert_not_called()
+
+
+def test_closed_files_are_rechecked_after_saves_and_disk_changes(tmp_path: Path):
+    deleted = tmp_path / "deleted.preql"
+    deleted.write_text(BROKEN)
+    uri = from_fs_path(str(deleted))
+    server = TrilogyLanguageServer()
+    server.workspace_diagnostics.file_diagnostics(deleted)
+    deleted.unlink()
+
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched, patch.object(
+        server, "text_document_publish_diagnostics"
+    ) as publish, patch.object(
+        server, "schedule_workspace_check"
+    ) as schedule:
+        patched.return_value = Mock(text_documents={})
+        did_change_watched_files(
+            server,
+            DidChangeWatchedFilesParams(
+                changes=[FileEvent(uri=uri, type=FileChangeType.Deleted)]
+            ),
+        )
+        did_save(
+            server,
+            DidSaveTextDocumentParams(text_document=TextDocumentIdentifier(uri=uri)),
+        )
+
+    assert server.workspace_diagnostics.results == {}
+    (published,) = publish.call_args.args
+    assert published.uri == uri and published.diagnostics == []
+    assert schedule.call_count == 2
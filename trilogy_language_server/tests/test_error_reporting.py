@@ -0,0 +1,75 @@
+import sys
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from lark import Token
+from lark.exceptions import UnexpectedToken
+from trilogy.core.exceptions import InvalidSyntaxException
+
+from trilogy_language_server.error_reporting import (
+    get_diagnostics,
+    syntax_error_location,
+)
+
+
+def ranges(text: str):
+    _, diagnostics = get_diagnostics(text)
+    return [
+        (
+            d.range.start.line,
+            d.range.start.character,
+            d.range.end.line,
+            d.range.end.character,
+        )
+        for d in diagnostics
+    ]
+
+
+def test_every_broken_statement_is_reported_with_token_ranges():
+    text = "key x int;\nselect x,, y;\nselect a where b = ;\nselect 1 ->;"
+    _, diagnostics = get_diagnostics(text)
+    assert ranges(text) == [(1, 9, 1, 10), (2, 19, 2, 20), (3, 11, 3, 12)]
+    assert diagnostics[2].message == "Syntax error: expected IDENTIFIER"
+    assert diagnostics[2].data == {"expected": ["IDENTIFIER"]}
+    assert "select_item" in diagnostics[0].data["expected"]
+
+
+def test_coded_errors_keep_their_message_without_the_snippet():
+    _, diagnostics = get_diagnostics("select a from b;")
+    assert diagnostics[0].message.startswith("Syntax [101]")
+    assert "Location:" not in diagnostics[0].message
+    # the whole offending keyword is covered
+    assert ranges("select a from b;") == [(0, 9, 0, 13)]
+
+
+def test_errors_at_end_of_text_cover_the_last_token():
+    assert ranges("select a") == [(0, 7, 0, 8)]
+    assert ranges("select 'abc") == [(0, 7, 0, 11)]
+    assert ranges("key x int;\n\nselect order_id   ") == [(2, 7, 2, 15)]
+
+
+def test_lark_errors_use_the_unexpected_token():
+    token = Token(
+        "SEMICOLON",
+        ";",
+        start_pos=11,
+        line=1,
+        column=12,
+        end_line=1,
+        end_column=13,
+        end_pos=12,
+    )
+    error = InvalidSyntaxException("Unexpected token")
+    error.__context__ = UnexpectedToken(token, {"IDENTIFIER", "_LPAR"})
+    location = syntax_error_location(error, "select 1 ->;")
+    assert location[:4] == (0, 11, 0, 12)
+    assert location.expected == {"IDENTIFIER", "_LPAR"}
+    assert location.message == "Unexpected token"
+
+
+def test_unlocated_errors_fall_back_to_the_first_token():
+    location = syntax_error_location(InvalidSyntaxException(), "select a;")
+    assert location[:4] == (0, 0, 0, 6)
+    assert location.message == "Syntax error"
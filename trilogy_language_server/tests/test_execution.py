@@ -0,0 +1,205 @@
+import asyncio
+import datetime
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import Mock, PropertyMock, patch
+
+import pytest
+from pygls.uris import from_fs_path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.execution import (
+    QueryExecutor,
+    QueryLimits,
+    QueryProgress,
+    QueryTimeout,
+    json_value,
+    setup_scripts,
+)
+from trilogy_language_server.result_cache import ResultCache
+from trilogy_language_server.server import (
+    TrilogyLanguageServer,
+    close_query,
+    execute_query,
+)
+
+
+def test_json_value_converts_duckdb_types():
+    assert json_value(Decimal("1.50")) == 1.5
+    assert json_value(datetime.date(2024, 1, 2)) == "2024-01-02"
+    assert json_value(datetime.timedelta(minutes=1)) == 60.0
+    assert json_value({"a": [b"\x01", None]}) == {"a": ["01", None]}
+
+
+def test_results_are_paged_with_cursors(tmp_path):
+    executor = QueryExecutor(page_size=2048)
+    page = executor.start(tmp_path, "select range as x from range(5000)")
+    assert page.columns == [{"name": "x", "type": "int64"}]
+    pages = [page]
+    while pages[-1].cursor is not None:
+        pages.append(executor.fetch(pages[-1].cursor))
+    assert [len(page.rows) for page in pages] == [2048, 2048, 904, 0]
+    assert [page.offset for page in pages] == [0, 2048, 4096, 5000]
+    assert [row[0] for page in pages for row in page.rows] == list(range(5000))
+    with pytest.raises(KeyError):
+        executor.fetch(page.cursor)
+    executor.shutdown()
+
+
+def test_connection_is_kept_per_workspace(tmp_path):
+    (tmp_path / "data.csv").write_text("a,b\n1,x\n2,y\n")
+    executor = QueryExecutor()
+    executor.start(tmp_path, "create table t as select * from 'data.csv'")
+    page = executor.start(tmp_path, "select a, b from t order by a")
+    assert page.rows == [[1, "x"], [2, "y"]]
+    assert executor.connection(tmp_path) is executor.connection(tmp_path)
+    assert executor.connection(tmp_path / "other") is not executor.connection(tmp_path)
+    executor.shutdown()
+
+
+def test_new_connections_run_setup_scripts(tmp_path):
+    (tmp_path / "trilogy.toml").write_text(
+        '[setup]\nsql = ["setup/tables.sql", "setup/broken.sql"]\n'
+    )
+    (tmp_path / "setup").mkdir()
+    (tmp_path / "setup" / "tables.sql").write_text("create table t as select 1 as a;")
+    (tmp_path / "setup" / "broken.sql").write_text("select from nowhere;")
+    assert setup_scripts(tmp_path / "models") == [
+        tmp_path / "setup" / "tables.sql",
+        tmp_path / "setup" / "broken.sql",
+    ]
+    executor = QueryExecutor()
+    # a failing script is skipped rather than failing every query
+    page = executor.start(tmp_path, "select a from t")
+    assert page.rows == [[1]]
+    executor.shutdown()
+
+
+def test_oldest_cursor_is_closed_over_the_limit(tmp_path):
+    executor = QueryExecutor(page_size=1, max_cursors=2)
+    tokens = [
+        executor.start(tmp_path, "select * from range(3)").cursor for _ in range(3)
+    ]
+    assert list(executor.cursors) == tokens[1:]
+    assert executor.close(tokens[1])
+    assert not executor.close(tokens[0])
+    executor.shutdown()
+
+
+def test_execute_query_request(tmp_path):
+    server = TrilogyLanguageServer()
+    server.query_executor.results = ResultCache(tmp_path / "results")
+    workspace = Mock(folders={}, root_path=None)
+    workspace.get_text_document.return_value = Mock(source="const a <- 1;\nselect a;\n")
+    uri = from_fs_path(str(tmp_path / "query.preql"))
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        statement = {
+            "textDocument": {"uri": uri},
+            "position": {"line": 1, "character": 0},
+        }
+        compiled = asyncio.run(execute_query(server, statement))
+        rerun = asyncio.run(execute_query(server, statement))
+        first = asyncio.run(
+            execute_query(
+                server,
+                {
+                    "textDocument": {"uri": uri},
+                    "sql": "select * from range(3)",
+                    "pageSize": 2,
+                },
+            )
+        )
+        second = asyncio.run(execute_query(server, {"cursor": first["cursor"]}))
+    assert compiled["columns"] == [{"name": "a", "type": "int32"}]
+    assert compiled["rows"] == [[1]]
+    assert not compiled["cached"] and rerun["cached"]
+    assert rerun["rows"] == [[1]]
+    assert first["rows"] == [[0], [1]] and not first["done"]
+    assert second["rows"] == [[2]] and second["offset"] == 2
+    assert not close_query(server, {"cursor": "missing"})
+    server.query_executor.shutdown()
+    server.sql_renderer.shutdown()
+
+
+SLOW_QUERY = "select sum(a.range * b.range) from range(100000000) a, range(1000) b"
+
+
+def test_limits_override():
+    limits = QueryLimits().override(timeout=0, max_rows=5, max_bytes=None)
+    assert limits == QueryLimits(timeout=None, max_rows=5, max_bytes=None)
+
+
+def test_row_and_byte_limits_stop_reading(tmp_path):
+    executor = QueryExecutor(page_size=2048)
+    sql = "select range as x from range(5000)"
+    first = executor.start(tmp_path, sql, limits=QueryLimits(max_rows=3000))
+    last = executor.fetch(first.cursor)
+    assert (len(last.rows), last.cursor, last.truncated) == (952, None, True)
+    assert not executor.cursors
+    small = executor.start(tmp_path, sql, limits=QueryLimits(max_bytes=800))
+    assert small.truncated and small.cursor is None
+    assert 0 < len(small.rows) <= 100
+    executor.shutdown()
+
+
+def test_timeout_interrupts_duckdb(tmp_path):
+    executor = QueryExecutor(progress_interval=0.05)
+    reports = []
+    with pytest.raises(QueryTimeout):
+        asyncio.run(
+            executor.execute(
+                tmp_path,
+                SLOW_QUERY,
+                limits=QueryLimits(timeout=0.3),
+                on_progress=reports.append,
+            )
+        )
+    assert reports and reports[-1].elapsed >= reports[0].elapsed
+    assert not executor.cursors
+    executor.shutdown()
+
+
+def test_cancelling_interrupts_duckdb(tmp_path):
+    executor = QueryExecutor()
+
+    async def cancel():
+        task = asyncio.ensure_future(
+            executor.execute(tmp_path, SLOW_QUERY, limits=QueryLimits(timeout=None))
+        )
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    started = time.monotonic()
+    asyncio.run(cancel())
+    # the worker thread is free again once DuckDB stops
+    executor.executor.shutdown(wait=True)
+    assert time.monotonic() - started < 10
+    executor.shutdown()
+
+
+def test_query_progress_uses_the_request_token():
+    server = TrilogyLanguageServer()
+    progress = Mock()
+    with patch.object(
+        TrilogyLanguageServer, "work_done_progress", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = progress
+        report, end = server.query_progress("token")
+        report(QueryProgress(1.0, 0, None))
+        report(QueryProgress(2.0, 2048, 50.0))
+        end()
+    begin = progress.begin.call_args.args
+    assert begin[0] == "token" and begin[1].message == "0 rows, 1.0s"
+    assert progress.report.call_args.args[1].percentage == 50
+    assert progress.end.call_count == 1
+    server.query_executor.shutdown()
+    server.sql_renderer.shutdown()
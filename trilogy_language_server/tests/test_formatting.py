@@ -0,0 +1,160 @@
+import sys
+from pathlib import Path
+from unittest.mock import Mock, PropertyMock, patch
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from lsprotocol.types import (
+    DocumentOnTypeFormattingParams,
+    DocumentRangeFormattingParams,
+    FormattingOptions,
+    Position,
+    Range,
+    TextDocumentIdentifier,
+)
+
+from trilogy_language_server.formatting import (
+    LineIndex,
+    StatementFormatter,
+    line_edits,
+)
+from trilogy_language_server.server import (
+    TrilogyLanguageServer,
+    format_on_type,
+    format_range,
+)
+from trilogy_language_server.statements import StatementTreeCache
+
+DOCUMENT = """key x int;
+property x.name   string;
+
+select x,
+ name;
+select   missing;
+key y int;
+"""
+
+
+def statements(text: str):
+    cache = StatementTreeCache()
+    cache.parse(text)
+    return cache.statements
+
+
+def apply(text: str, edits) -> str:
+    lines = LineIndex(text)
+    for edit in sorted(edits, key=lambda e: lines.offset(e.range.start), reverse=True):
+        start, end = lines.offset(edit.range.start), lines.offset(edit.range.end)
+        text = text[:start] + edit.new_text + text[end:]
+    return text
+
+
+def test_range_formatting_renders_only_overlapping_statements():
+    formatter = StatementFormatter()
+    start = DOCUMENT.index("select x")
+    edits = formatter.edits(DOCUMENT, statements(DOCUMENT), Path("."), start, start + 3)
+    assert len(edits) == 1
+    assert edits[0].range == Range(Position(3, 0), Position(4, 6))
+    assert apply(DOCUMENT, edits) == DOCUMENT.replace(
+        "select x,\n name;", "select\n    x,\n    name,\n;"
+    )
+    # statements after the range are never hydrated
+    assert formatter.checked == 3
+
+
+def test_formatted_and_broken_statements_produce_no_edits():
+    formatter = StatementFormatter()
+    edits = formatter.edits(DOCUMENT, statements(DOCUMENT), Path("."))
+    formatted = apply(DOCUMENT, edits)
+    assert len(edits) == 2
+    assert "select   missing;" in formatted
+    assert formatter.edits(formatted, statements(formatted), Path(".")) == []
+
+
+def test_formatted_hashes_are_kept_for_the_current_document_only():
+    formatter = StatementFormatter()
+    for name in ("a", "b", "c"):
+        text = f"key {name} int;\n"
+        assert formatter.edits(text, statements(text), Path(".")) == []
+    # only the statement of the last document is remembered
+    assert len(formatter.formatted) == 1
+    edits = formatter.edits(DOCUMENT, statements(DOCUMENT), Path("."))
+    formatted = apply(DOCUMENT, edits)
+    assert len(formatter.formatted) == 4
+    assert formatter.edits(formatted, statements(formatted), Path(".")) == []
+    assert len(formatter.formatted) == 4
+
+
+def test_line_edits_replace_only_changed_lines():
+    original = "select\n    x,\n  name\n;"
+    rendered = "select\n    x,\n    name,\n;"
+    assert line_edits(original, rendered, 10) == [(24, 31, "    name,\n")]
+
+
+def test_whole_document_normalizes_gaps_between_statements():
+    text = "\n\nkey x int;\n\n\nkey y int; # trailing\n\n"
+    formatter = StatementFormatter()
+    edits = formatter.edits(text, statements(text), Path("."), whole_document=True)
+    assert apply(text, edits) == "key x int;\nkey y int; # trailing\n"
+    # the statements themselves were already formatted
+    assert all(not edit.new_text.strip() for edit in edits)
+
+
+def test_aliased_imports_are_not_loaded(tmp_path):
+    # the imported model would fail to parse if it were loaded
+    (tmp_path / "base.preql").write_text("this is not trilogy")
+    text = "import base as b;\nselect b.x, sum(b.y) by b.x as total;\n"
+    formatter = StatementFormatter()
+    edits = formatter.edits(text, statements(text), tmp_path, whole_document=True)
+    assert apply(text, edits) == (
+        "import base as b;\nselect\n    b.x,\n    sum(b.y) by b.x as total,\n;\n"
+    )
+    assert formatter.stubbed == {"b"}
+
+
+def test_imports_are_loaded_when_their_stubs_fail(tmp_path):
+    # a stub is a key, so a metric derived from it would fail to hydrate
+    (tmp_path / "base.preql").write_text(
+        "key id int;\nproperty id.amount float;\nmetric revenue <- sum(amount);\n"
+    )
+    text = "import base as b;\nmetric r2 <- b.revenue * 2;\nselect r2;\n"
+    formatter = StatementFormatter()
+    edits = formatter.edits(text, statements(text), tmp_path, whole_document=True)
+    assert apply(text, edits) == (
+        "import base as b;\nauto r2 <- b.revenue * 2;\nselect\n    r2,\n;\n"
+    )
+    assert formatter.resolved == {"b"}
+    # the import stays loaded when the statements before an edit are replayed
+    edited = text.replace("select r2;", "select r2, b.id;")
+    edits = formatter.edits(edited, statements(edited), tmp_path, whole_document=True)
+    assert apply(edited, edits).endswith("select\n    r2,\n    b.id,\n;\n")
+
+
+def test_on_type_and_range_handlers():
+    server = TrilogyLanguageServer()
+    workspace = Mock()
+    workspace.get_text_document.return_value = Mock(source=DOCUMENT)
+    document = TextDocumentIdentifier(uri="untitled:doc")
+    options = FormattingOptions(tab_size=4, insert_spaces=True)
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        typed = format_on_type(
+            server,
+            DocumentOnTypeFormattingParams(
+                text_document=document,
+                position=Position(1, 25),
+                ch=";",
+                options=options,
+            ),
+        )
+        selected = format_range(
+            server,
+            DocumentRangeFormattingParams(
+                document, Range(Position(0, 0), Position(1, 3)), options
+            ),
+        )
+    assert [edit.new_text for edit in typed] == ["property x.name string;"]
+    assert [edit.range.start.line for edit in selected] == [1]
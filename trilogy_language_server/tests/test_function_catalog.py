@@ -0,0 +1,90 @@
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy import __version__
+from trilogy.core.functions import FUNCTION_REGISTRY
+
+from trilogy_language_server.function_catalog import (
+    CATALOG_PATH,
+    FUNCTION_DOCUMENTATION,
+    generate_catalog,
+    grammar_function_names,
+    load_function_catalog,
+    lookup_function,
+)
+
+
+def test_catalog_covers_callable_registry_functions():
+    functions = generate_catalog()["functions"]
+    callable_names = grammar_function_names()
+    for function_type in FUNCTION_REGISTRY:
+        name = function_type.value
+        if name in callable_names and name != "case":
+            assert name in functions
+    # registry functions the grammar cannot call are not offered
+    for name in ["isnull", "power", "unix_to_timestamp", "grain_pin"]:
+        assert name not in functions
+    assert set(functions) - set(FUNCTION_DOCUMENTATION) <= callable_names
+
+    date_add = functions["date_add"]
+    assert date_add["arg_count"] == 3
+    assert [p["types"] for p in date_add["parameters"]][1:] == ["date_part", "int"]
+    assert date_add["return_type"] == "date"
+    assert functions["current_date"]["parameters"] == []
+    assert functions["coalesce"]["arg_count"] < 0
+
+
+def test_catalog_prefers_documentation():
+    functions = generate_catalog()["functions"]
+    assert functions["count"]["description"].startswith("Count the number")
+    # documented surface arity wins over internal registry arguments
+    assert [p["name"] for p in functions["trim"]["parameters"]] == ["string"]
+    assert "like" in functions
+    assert functions["sum"]["signature"] == "sum(concept) -> numeric"
+    assert functions["round"]["signature"] == "round(value, decimals?) -> numeric"
+    assert functions["abs"]["return_type"] == "numeric"
+
+
+def test_load_generates_stale_catalog_once_per_version(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({"trilogy_version": "0.0.0", "functions": {}}))
+    cache = tmp_path / "cache"
+    functions = load_function_catalog(path, cache)
+    assert "count" in functions
+    # the build rewrites the bundled file; a generated one goes to the cache
+    assert json.loads(path.read_text())["trilogy_version"] == "0.0.0"
+    cached = cache / f"function_catalog-{__version__}.json"
+    assert json.loads(cached.read_text())["functions"] == functions
+
+    with patch("trilogy_language_server.function_catalog.generate_catalog") as generate:
+        assert load_function_catalog(path, cache) == functions
+    generate.assert_not_called()
+
+    assert load_function_catalog(tmp_path / "missing" / "catalog.json", cache)
+
+
+def test_bundled_catalog_is_well_formed():
+    # requirements allow newer pytrilogy releases than the one it was built with
+    catalog = json.loads(CATALOG_PATH.read_text())
+    assert isinstance(catalog["trilogy_version"], str)
+    assert catalog["functions"]
+    for name, entry in catalog["functions"].items():
+        assert entry["name"] == name
+        assert entry["signature"].startswith(name)
+        assert isinstance(entry["arg_count"], int)
+        assert isinstance(entry["parameters"], list)
+        assert {"description", "return_type", "purpose", "family"} <= set(entry)
+    if catalog["trilogy_version"] == __version__:
+        assert catalog == generate_catalog()
+
+
+def test_lookup_function_aliases():
+    functions = generate_catalog()["functions"]
+    assert lookup_function(functions, "COUNT")["name"] == "count"
+    assert lookup_function(functions, "date_trunc")["name"] == "date_truncate"
+    assert lookup_function(functions, "missing") is None
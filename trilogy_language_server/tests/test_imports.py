@@ -0,0 +1,32 @@
+import os
+import sys
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.imports import imported_files, import_targets
+
+
+def test_import_targets_resolve_relative_to_the_file():
+    path = Path("/models/nested/main.preql")
+    text = "# import commented;\nimport a.b as b;\nimport ..up;\nimport std.money;"
+    assert import_targets(path, text) == [
+        Path("/models/nested/a/b.preql"),
+        Path("/models/up.preql"),
+    ]
+
+
+def test_imported_files_follow_imports_on_disk(tmp_path: Path):
+    (tmp_path / "nested").mkdir()
+    base = tmp_path / "nested" / "base.preql"
+    base.write_text("import ..shared as shared;\nkey x int;\n")
+    (tmp_path / "shared.preql").write_text("key y int;\n")
+    texts = ["import nested.base as base;", "import missing as m;", "select 1;"]
+    assert imported_files(tmp_path, texts) == [base, tmp_path / "shared.preql"]
+    assert imported_files(tmp_path, ["select 1;"]) == []
+
+    # a rewritten file is read again
+    base.write_text("key x int;\n")
+    os.utime(base, ns=(1, 1))
+    assert imported_files(tmp_path, texts) == [base]
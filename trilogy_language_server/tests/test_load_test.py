@@ -0,0 +1,74 @@
+import pytest
+import random
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.load_test import (
+    DID_CHANGE,
+    MethodStats,
+    Session,
+    build_sample_document,
+    format_report,
+    parse_mix,
+    percentile,
+    METHODS,
+)
+from trilogy_language_server.parsing import gen_tree
+
+
+def test_parse_mix_normalizes_weights():
+    weights = parse_mix("didChange=2, hover=1,completion=1")
+    assert weights == {"didChange": 0.5, "hover": 0.25, "completion": 0.25}
+
+
+def test_parse_mix_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        parse_mix("rename=1")
+    with pytest.raises(ValueError):
+        parse_mix("hover=0")
+
+
+def test_percentile():
+    values = [float(x) for x in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
+    assert percentile([], 99) == 0.0
+
+
+def test_sample_document_parses_and_targets_identifiers():
+    text, targets = build_sample_document(9)
+    assert gen_tree(text) is not None
+    lines = text.split("\n")
+    for position in targets:
+        assert lines[position.line][position.character].isalnum()
+
+
+def test_format_report_skips_idle_methods():
+    stats = {method: MethodStats(method=method) for method in METHODS}
+    stats["hover"].sent = 2
+    stats["hover"].completed = 2
+    stats["hover"].latencies_ms = [1.0, 3.0]
+    report = format_report(stats, duration=1.0)
+    assert "hover" in report
+    assert "references" not in report
+
+
+def test_change_latency_is_matched_by_document_version():
+    stats = {method: MethodStats(method=method) for method in METHODS}
+    session = Session(Mock(), "file:///doc.preql", "", [], stats, 1.0, random.Random(0))
+    session.did_change()
+    session.did_change()
+    # the server publishes several times per change; only the first counts
+    session.on_diagnostics(3)
+    session.on_diagnostics(3)
+    session.on_diagnostics(None)
+    assert stats[DID_CHANGE].completed == 1
+    assert list(session.pending_changes) == [2]
+
+    session.expire_changes()
+    assert stats[DID_CHANGE].dropped == 1
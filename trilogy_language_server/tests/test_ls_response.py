@@ -1,4 +1,5 @@
 import pytest
+from functools import partial
 from unittest.mock import Mock
 import sys
 from pathlib import Path
@@ -11,20 +12,28 @@ from trilogy_language_server.server import (
     trilogy_server,
     format_document,
     completions,
+    completion_resolve,
     did_change,
     did_close,
     code_lens,
     code_lens_resolve,
     handle_config,
     hover,
+    signature_help,
+    memory_report,
+    metrics_report,
     TokenTypes,
     ADDITION,
     Token,
     TokenModifier,
-    get_diagnostics,
 )
+from trilogy_language_server.error_reporting import get_diagnostics
+from trilogy_language_server.formatting import LineIndex
+from trilogy_language_server.completion import ScoreCache
 from trilogy_language_server.models import ConceptInfo, ConceptLocation
 from lsprotocol.types import (
+    CompletionContext,
+    CompletionTriggerKind,
     DidChangeTextDocumentParams,
     DidCloseTextDocumentParams,
     TextDocumentIdentifier,
@@ -36,12 +45,29 @@ from lsprotocol.types import (
     DocumentFormattingParams,
     MessageType,
     HoverParams,
+    SignatureHelpParams,
     TextEdit,
 )
 
 TEST_TEXT = """select 1-> test;"""
 
 
+def add_formatting(server):
+    """Give a mock server the real formatting methods and their stores."""
+    server.statement_trees = {}
+    server.formatters = {}
+    server.working_path = partial(TrilogyLanguageServer.working_path, server)
+    server.format_statements = partial(TrilogyLanguageServer.format_statements, server)
+
+
+def apply_edits(text: str, edits) -> str:
+    lines = LineIndex(text)
+    for edit in sorted(edits, key=lambda e: lines.offset(e.range.start), reverse=True):
+        start, end = lines.offset(edit.range.start), lines.offset(edit.range.end)
+        text = text[:start] + edit.new_text + text[end:]
+    return text
+
+
 class TestTrilogyLanguageServer:
     """Test cases for the TrilogyLanguageServer class."""
 
@@ -140,6 +166,14 @@ class TestFeatureFunctions:
         server.concept_locations = {}
         server.datasource_info = {}
         server.import_info = {}
+        server.completion_indexes = {}
+        server.completion_scores = ScoreCache()
+        server.completion_index = partial(
+            TrilogyLanguageServer.completion_index, server
+        )
+        server.call_indexes = {}
+        server.call_index = partial(TrilogyLanguageServer.call_index, server)
+        add_formatting(server)
         return server
 
     @pytest.fixture
@@ -199,13 +233,36 @@ class TestFeatureFunctions:
 
         result = format_document(mock_server, params)
 
-        # Should return a TextEdit covering the entire document
+        # Each changed statement is replaced in place
         assert result is not None
-        assert len(result) == 1
-        # End line should be 1 (0-indexed, original has 2 lines)
-        assert result[0].range.end.line == 1
-        # End character should be length of last line
-        assert result[0].range.end.character == len("SELECT 2 as b;")
+        assert len(result) == 2
+        assert result[1].range.start == Position(line=1, character=0)
+        assert result[1].range.end == Position(line=1, character=len("SELECT 2 as b;"))
+        assert apply_edits(mock_document.source, result) == (
+            "select\n    1 as a,\n;\nselect\n    2 as b,\n;"
+        )
+
+    def test_format_document_skips_formatted_statements(self, mock_server):
+        """Formatting an already formatted document renders nothing."""
+        mock_document = Mock()
+        mock_document.source = "key x int;\n\n\nselect x;\n"
+        mock_server.workspace.get_text_document.return_value = mock_document
+        params = DocumentFormattingParams(
+            text_document=TextDocumentIdentifier(uri="file:///test/example.trilogy"),
+            options=Mock(),
+        )
+
+        result = format_document(mock_server, params)
+        # only the blank lines and the changed line of the select are edited
+        assert [edit.new_text for edit in result] == ["\nselect\n    x,\n;"]
+        formatted = apply_edits(mock_document.source, result)
+        assert formatted == "key x int;\nselect\n    x,\n;\n"
+
+        mock_document.source = formatted
+        formatter = mock_server.formatters["file:///test/example.trilogy"]
+        checked = formatter.checked
+        assert format_document(mock_server, params) == []
+        assert formatter.checked == checked
 
     def test_format_document_handles_parse_error(self, mock_server):
         """Test that format_document returns None on parse errors."""
@@ -225,22 +282,130 @@ class TestFeatureFunctions:
 
     def test_completions_with_params(self, mock_server):
         """Test the completions function with parameters."""
+        mock_server.workspace.get_text_document.return_value = Mock(source="")
         params = CompletionParams(
             text_document=TextDocumentIdentifier(uri="file:///test/example.trilogy"),
-            position=Position(line=0, character=10),
+            position=Position(line=0, character=0),
         )
 
         result = completions(mock_server, params)
 
         mock_server.window_log_message.assert_called_once()
         assert result.is_incomplete is False
-        # Should have keywords and functions in the completion list
+        # Statement keywords at the start of a statement
         assert len(result.items) > 0
-        # Check that keywords are present
         labels = [item.label for item in result.items]
         assert "select" in labels
         assert "key" in labels
-        assert "count" in labels  # Function
+
+        # Functions once an expression is being typed
+        mock_server.workspace.get_text_document.return_value = Mock(source="select cou")
+        params.position = Position(line=0, character=10)
+        labels = [item.label for item in completions(mock_server, params).items]
+        assert "count" in labels
+
+    def test_completions_filter_by_prefix(self, mock_server):
+        """Test that completions only return items matching the typed prefix."""
+        uri = "file:///test/example.trilogy"
+        mock_server.workspace.get_text_document.return_value = Mock(
+            source="key user_id int;\nselect us"
+        )
+        mock_server.concept_info = {
+            uri: {
+                f"local.{name}": ConceptInfo(
+                    name=name,
+                    address=f"local.{name}",
+                    datatype="INTEGER",
+                    purpose="key",
+                    namespace="local",
+                )
+                for name in ["user_id", "order_id"]
+            }
+        }
+        params = CompletionParams(
+            text_document=TextDocumentIdentifier(uri=uri),
+            position=Position(line=1, character=9),
+        )
+
+        result = completions(mock_server, params)
+
+        labels = [item.label for item in result.items]
+        assert labels[0] == "user_id"
+        assert "order_id" not in labels
+        # the prefix left candidates out, so the client asks again as it changes
+        assert result.is_incomplete is True
+
+    def test_completions_after_a_concept_are_incomplete(self, mock_server):
+        """Keywords left out after a trigger are offered once typing starts."""
+        uri = "file:///test/example.trilogy"
+        mock_server.workspace.get_text_document.return_value = Mock(
+            source="key a int;\nselect a "
+        )
+        params = CompletionParams(
+            text_document=TextDocumentIdentifier(uri=uri),
+            position=Position(line=1, character=9),
+            context=CompletionContext(
+                trigger_kind=CompletionTriggerKind.TriggerCharacter,
+                trigger_character=" ",
+            ),
+        )
+        result = completions(mock_server, params)
+        assert "where" not in [item.label for item in result.items]
+        assert result.is_incomplete is True
+
+        mock_server.workspace.get_text_document.return_value = Mock(
+            source="key a int;\nselect a wh"
+        )
+        params.position = Position(line=1, character=11)
+        params.context = None
+        labels = [item.label for item in completions(mock_server, params).items]
+        assert "where" in labels
+
+    def test_completion_resolve_adds_documentation(self, mock_server):
+        """Test that resolve fills in documentation for a concept item."""
+        uri = "file:///test/example.trilogy"
+        mock_server.workspace.get_text_document.return_value = Mock(
+            source="select user"
+        )
+        mock_server.concept_info = {
+            uri: {
+                "local.user_id": ConceptInfo(
+                    name="user_id",
+                    address="local.user_id",
+                    datatype="INTEGER",
+                    purpose="key",
+                    namespace="local",
+                    description="Unique user",
+                )
+            }
+        }
+        params = CompletionParams(
+            text_document=TextDocumentIdentifier(uri=uri),
+            position=Position(line=0, character=11),
+        )
+        item = completions(mock_server, params).items[0]
+        assert item.documentation is None
+
+        resolved = completion_resolve(mock_server, item)
+        assert "Unique user" in resolved.documentation.value
+
+    def test_signature_help_multi_line_call(self, mock_server):
+        """Test that signature help tracks arguments across lines."""
+        mock_server.workspace.get_text_document.return_value = Mock(
+            source="select\n  substring(\n    a,\n    ", version=1
+        )
+        params = SignatureHelpParams(
+            text_document=TextDocumentIdentifier(uri="file:///test/example.trilogy"),
+            position=Position(line=3, character=4),
+        )
+
+        result = signature_help(mock_server, params)
+
+        assert result.signatures[0].label.startswith("substring")
+        assert result.active_parameter == 1
+
+        params.position = Position(line=0, character=3)
+        assert signature_help(mock_server, params) is None
 
     def test_completions_without_params(self, mock_server):
         """Test the completions function without parameters."""
@@ -328,6 +493,45 @@ class TestFeatureFunctions:
         assert args.type == MessageType.Info
         assert "test_value" in args.message
 
+    def test_memory_report(self):
+        """Test the memory report command covers every per-URI store."""
+        server = TrilogyLanguageServer()
+        server.window_log_message = Mock()
+        server.tokens["file:///test/example.trilogy"] = [
+            Token(line=1, offset=1, text="select")
+        ]
+
+        report = memory_report(server)
+
+        assert set(report["stores"]) == set(TrilogyLanguageServer.PER_URI_STORES)
+        assert report["stores"]["tokens"]["entries"] == 1
+        assert report["stores"]["tokens"]["bytes"] > 0
+        assert report["tracemalloc"] is False
+        server.window_log_message.assert_called_once()
+
+    def test_memory_report_tracemalloc_diff_requires_start(self):
+        """Test that diffing without a baseline reports an error."""
+        server = TrilogyLanguageServer()
+        server.window_log_message = Mock()
+
+        assert memory_report(server, {"tracemalloc": "diff"}) is None
+        args = server.window_log_message.call_args[0][0]
+        assert args.type == MessageType.Error
+
+    def test_metrics_report_counts_stalls(self):
+        """Test that watchdog stalls are counted in the server metrics."""
+        server = TrilogyLanguageServer()
+        with server.watchdog.activity.track(
+            "textDocument/didChange", "file:///test/example.trilogy"
+        ):
+            server.watchdog.check(now=server.watchdog.last_tick + 5)
+
+        report = metrics_report(server)
+
+        assert report["counters"]["loop_stalls"] == 1
+        assert report["counters"]["loop_stalls:textDocument/didChange"] == 1
+        assert report["stalls"][0]["uri"] == "file:///test/example.trilogy"
+
     def test_hover_with_concept(self, mock_server):
         """Test the hover function with concept information."""
         uri = "file:///test/example.trilogy"
@@ -452,6 +656,7 @@ class TestNestedImportFormatting:
         server = Mock(spec=TrilogyLanguageServer)
         server.workspace = Mock()
         server.window_log_message = Mock()
+        add_formatting(server)
         return server
 
     @pytest.fixture
@@ -491,11 +696,11 @@ class TestNestedImportFormatting:
         # Verify formatting succeeded and returns List[TextEdit]
         assert result is not None
         assert isinstance(result, list)
-        assert len(result) == 1
-        assert isinstance(result[0], TextEdit)
-        # Check the formatted text contains the import statement
-        assert "import base as base" in result[0].new_text
-        assert "base.x" in result[0].new_text
+        assert all(isinstance(edit, TextEdit) for edit in result)
+        # The import is kept and the select rendered against it
+        assert apply_edits(main_content, result) == (
+            "import base as base;\nselect\n    base.x,\n;\n"
+        )
 
     def test_format_document_with_nested_import_resolves_correctly(
         self, mock_server, nested_fixtures_path
@@ -525,10 +730,10 @@ class TestNestedImportFormatting:
         # The formatted result should be a List[TextEdit]
         assert result is not None
         assert isinstance(result, list)
-        assert len(result) == 1
         # The formatted text should include the import and the selection
-        assert "import" in result[0].new_text
-        assert "select" in result[0].new_text
+        assert apply_edits(main_content, result) == (
+            "import base as base;\nselect\n    base.x,\n;\n"
+        )
 
     def test_format_document_with_invalid_uri_handles_gracefully(self, mock_server):
         """Test that format_document handles non-file URIs gracefully.
@@ -586,7 +791,8 @@ class TestNestedImportFormatting:
         # Result should be List[TextEdit]
         assert result is not None
         assert isinstance(result, list)
-        assert len(result) == 1
-        assert isinstance(result[0], TextEdit)
-        # The formatted output should contain the import
-        assert "import base as base" in result[0].new_text
+        assert all(isinstance(edit, TextEdit) for edit in result)
+        # The import is kept and the select rendered against it
+        assert apply_edits(content, result) == (
+            "import base as base;\nselect\n    base.x,\n;"
+        )
@@ -0,0 +1,60 @@
+import pytest
+import sys
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.memory import (
+    AllocationTracker,
+    approximate_size,
+    format_memory_report,
+    store_report,
+)
+from trilogy_language_server.models import Token
+
+
+def test_approximate_size_counts_nested_objects():
+    small = [Token(line=1, offset=1, text="a")]
+    large = [Token(line=1, offset=1, text="a" * 10_000)]
+    assert approximate_size(large) > approximate_size(small) + 9_000
+
+
+def test_approximate_size_counts_shared_objects_once():
+    shared = "x" * 10_000
+    seen = set()
+    first = approximate_size([shared], seen)
+    second = approximate_size([shared], seen)
+    assert second < first - 9_000
+
+
+def test_store_report():
+    report = store_report(
+        {
+            "tokens": {"file:///a.preql": ["x" * 1000], "file:///b.preql": []},
+            "code_lens": {},
+        }
+    )
+    assert report["stores"]["tokens"]["entries"] == 2
+    assert report["stores"]["code_lens"]["bytes"] == 0
+    uris = list(report["stores"]["tokens"]["uris"])
+    assert uris[0] == "file:///a.preql"
+    assert report["total_bytes"] == report["stores"]["tokens"]["bytes"]
+    assert "tokens" in format_memory_report(report)
+
+
+def test_allocation_tracker_diff():
+    tracker = AllocationTracker()
+    with pytest.raises(RuntimeError):
+        tracker.diff()
+    tracker.start()
+    try:
+        retained = [bytearray(100_000) for _ in range(5)]
+        sites = tracker.diff(top=5)
+        assert sites
+        assert sites[0]["size_diff"] >= 500_000
+        assert "test_memory.py" in sites[0]["site"]
+        del retained
+    finally:
+        tracker.stop()
+    assert not tracker.active
@@ -0,0 +1,134 @@
+import sys
+from pathlib import Path
+from unittest.mock import Mock, PropertyMock, patch
+
+from pygls.uris import from_fs_path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy.authoring import Environment
+from trilogy.dialect.duckdb import DuckDBDialect
+from trilogy.parsing.parse_engine_v2 import parse_syntax
+
+from trilogy_language_server.metrics import (
+    ComplexityThresholds,
+    QueryMetrics,
+    query_metrics,
+)
+from trilogy_language_server.parsing import code_lense_tree
+from trilogy_language_server.rendering import SqlRenderer
+from trilogy_language_server.server import TrilogyLanguageServer
+
+MODEL = """key id int;
+property id.amt float;
+key tag string;
+key item string;
+datasource orders (id, amt) grain (id) address `orders.parquet`;
+datasource order_tags (id, tag) grain (id, tag) address `order_tags.parquet`;
+datasource order_items (id, item) grain (id, item) address `order_items.parquet`;
+"""
+# tags and items are both many per order, so one joins in repeating the other
+QUERY = "select id, amt, tag, item;"
+
+
+def _plan(text: str):
+    environment = Environment()
+    environment.parse(MODEL)
+    return SqlRenderer().plan("duckdb", environment, text, parse_syntax(text).tree)
+
+
+def test_query_metrics_counts_fan_out_joins():
+    metrics = query_metrics(_plan(QUERY))
+    assert metrics.joins == 2
+    assert metrics.fan_out == 1
+    assert metrics.datasources == ["order_items", "order_tags", "orders"]
+    assert metrics.summary() == "2 joins, 1 fan-out join, 3 datasources"
+
+
+def test_query_metrics_many_to_one_join():
+    metrics = query_metrics(_plan("select id, amt, tag;"))
+    # each tag matches a single order
+    assert metrics.joins == 1
+    assert metrics.fan_out == 0
+    assert metrics.summary() == "1 join, 2 datasources"
+
+
+def test_query_metrics_do_not_count_the_final_select():
+    environment = Environment()
+    environment.parse("""key id int;
+property id.name string;
+property id.v float;
+datasource names (id, name) grain (id) address `names.parquet`;
+datasource values (id, v) grain (id) address `values.parquet`;
+""")
+    text = "select name, sum(v) as total;"
+    processed = SqlRenderer().plan("duckdb", environment, text, parse_syntax(text).tree)
+    # the planner's base is not the CTE rendered as the select
+    assert processed.base is not processed.ctes[-1]
+    metrics = query_metrics(processed)
+    assert metrics.ctes == 0
+    assert metrics.summary() == "1 join, 2 datasources"
+
+
+def test_thresholds_exceeded():
+    metrics = QueryMetrics(ctes=5, joins=2, fan_out=1, datasources=["a", "b"])
+    assert ComplexityThresholds().exceeded(metrics) == []
+    thresholds = ComplexityThresholds().override(
+        max_ctes=3, max_joins=None, max_fan_out=0, max_datasources=1
+    )
+    # 0 removes a threshold, None keeps it
+    assert thresholds.max_fan_out is None
+    assert thresholds.max_joins == 10
+    assert thresholds.exceeded(metrics) == [
+        "Compiled query has 5 CTEs (threshold 3)",
+        "Compiled query has 2 datasources (threshold 1)",
+    ]
+
+
+def test_render_lens_shows_metrics():
+    text = MODEL + QUERY
+    environment = Environment()
+    metrics: dict = {}
+    lenses = code_lense_tree(
+        environment=environment,
+        text=text,
+        input=parse_syntax(text).tree,
+        dialect=DuckDBDialect(),
+        metrics=metrics,
+    )
+    query_line = text.count("\n")
+    assert list(metrics) == [query_line]
+    (render,) = [
+        lens
+        for lens in lenses
+        if lens.range.start.line == query_line
+        and lens.command.title.startswith("Render SQL")
+    ]
+    assert metrics[query_line].summary() in render.command.title
+
+
+def test_server_flags_complex_queries(tmp_path):
+    text = MODEL + QUERY
+    path = tmp_path / "model.preql"
+    path.write_text(text)
+    uri = from_fs_path(str(path))
+    server = TrilogyLanguageServer()
+    server.window_log_message = Mock()
+    server.text_document_publish_diagnostics = Mock()
+    server.complexity_thresholds = ComplexityThresholds(max_fan_out=0)
+    server.document_versions[uri] = 1
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = Mock(folders={}, root_path=None)
+        server.publish_code_lens(text, parse_syntax(text).tree, uri)
+    (diagnostic,) = server.current_diagnostics(uri)
+    assert diagnostic.message == "Compiled query has 1 fan-out join (threshold 0)"
+    assert diagnostic.range.start.line == text.count("\n")
+    published = server.text_document_publish_diagnostics.call_args.args[0]
+    assert published.diagnostics == [diagnostic]
+
+    # a newer version drops the stale warning
+    server.document_versions[uri] = 2
+    assert server.current_diagnostics(uri) == []
@@ -8,12 +8,14 @@ from trilogy_language_server.parsing import (
     tree_to_symbols,
     gen_tree,
     code_lense_tree,
+    compile_statements,
     extract_concept_locations,
     extract_concepts_from_environment,
     find_concept_at_position,
     format_concept_hover,
     resolve_concept_address,
 )
+from unittest.mock import patch
 from lsprotocol.types import CodeLens, Range, Position, Command
 from trilogy.dialect.duckdb import DuckDBDialect
 from trilogy.authoring import Environment
@@ -83,6 +85,50 @@ def test_code_lense_tree():
     ), str(comp[1].command)
 
 
+def test_code_lenses_target_the_statement_in_a_document():
+    basic = "const omicron <- 1;\n\nSELECT omicron;\n"
+    comp = code_lense_tree(
+        environment=Environment(),
+        text=basic,
+        input=gen_tree(basic),
+        dialect=DuckDBDialect(),
+        uri="file:///models/example.preql",
+    )
+    target = {
+        "textDocument": {"uri": "file:///models/example.preql"},
+        "position": {"line": 2, "character": 0},
+    }
+    run, render, profile = comp
+    assert run.command.arguments[1] == target
+    assert render.command.arguments[2] == target
+    assert profile.command.arguments == [target]
+
+
+def test_compile_statements_plans_each_query_once():
+    dialect = DuckDBDialect()
+
+    def compile(text):
+        environment = Environment()
+        statements = TopLevelStatementParser(environment=environment).parse(
+            parse_syntax(text)
+        )
+        with patch.object(
+            dialect, "generate_queries", wraps=dialect.generate_queries
+        ) as generate:
+            return compile_statements(statements, dialect, environment), generate
+
+    compiled, generate = compile("const a <- 1;\nselect a;\nselect a + 1 as b;")
+    assert compiled == {1: 'SELECT\n    1 as "a"\n', 2: 'SELECT\n    1 + 1 as "b"\n'}
+    assert generate.call_count == 2
+
+    # a query without a datasource fails alone, and nothing is planned twice
+    compiled, generate = compile(
+        "const a <- 1;\nselect a;\nkey x int;\nselect x;\nselect a + 1 as b;"
+    )
+    assert sorted(compiled) == [1, 4]
+    assert generate.call_count == 3
+
+
 def test_root_datasource_parsing():
     """Test that 'root datasource' syntax parses successfully without warnings"""
     code_with_root_datasource = """key id int;
@@ -0,0 +1,148 @@
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import Mock, PropertyMock, patch
+
+import duckdb
+from pygls.uris import from_fs_path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy.parsing.parse_engine_v2 import parse_syntax
+
+from trilogy_language_server.parsing import (
+    extract_concept_locations,
+    extract_datasource_info,
+)
+from trilogy_language_server.profiling import cte_timings, materialize_ctes
+from trilogy_language_server.server import TrilogyLanguageServer, profile_query
+
+MODEL = """key id int;
+property id.amt float;
+key grp int;
+property grp.name string;
+datasource orders (id, grp:grp, amt) grain (id) address `orders.parquet`;
+datasource groups (grp, name) grain (grp) address `groups.parquet`;
+auto grp_total <- sum(amt) by grp;
+select name, grp_total, avg(grp_total) by * -> overall;
+"""
+
+
+# the planner's base is not the CTE rendered as the final select
+JOINED = """key id int;
+property id.name string;
+property id.v float;
+datasource names (id, name) grain (id) address `names.parquet`;
+datasource values (id, v) grain (id) address `values.parquet`;
+select name, sum(v) as total;
+"""
+
+
+def test_materialize_ctes():
+    sql = 'WITH \nfirst as (\nSELECT 1),\n"second" as (\nSELECT 2)\nSELECT 3'
+    assert materialize_ctes(sql, ["first", "second"]) == (
+        'WITH \nfirst as MATERIALIZED (\nSELECT 1),\n"second" as MATERIALIZED '
+        "(\nSELECT 2)\nSELECT 3"
+    )
+
+
+def test_cte_timings_attribute_operators_to_ctes():
+    def operator(name, timing, rows, *children, **extra):
+        return {
+            "operator_name": name,
+            "operator_timing": timing,
+            "operator_cardinality": rows,
+            "extra_info": extra,
+            "children": list(children),
+        }
+
+    plan = {
+        "children": [
+            operator(
+                "EXPLAIN_ANALYZE",
+                0.0,
+                0,
+                operator(
+                    "CTE",
+                    0.5,
+                    0,
+                    operator("HASH_GROUP_BY", 2.0, 10, operator("TABLE_SCAN", 1.0, 99)),
+                    operator("PROJECTION", 0.25, 10, operator("CTE_SCAN", 0.25, 10)),
+                    **{"CTE Name": "base"},
+                ),
+            )
+        ]
+    }
+    timings = cte_timings(plan, "final")
+    assert timings["base"].seconds == 3.5
+    assert timings["base"].rows == 10
+    assert timings["base"].operators[0] == ("HASH_GROUP_BY", 2.0)
+    assert timings["final"].seconds == 0.5
+    assert timings["final"].rows == 10
+
+
+def _profile(tmp_path: Path, text: str, line: int):
+    server = TrilogyLanguageServer()
+    uri = from_fs_path(str(tmp_path / "query.preql"))
+    workspace = Mock(folders={}, root_path=None)
+    workspace.get_text_document.return_value = Mock(source=text)
+    tree = parse_syntax(text).tree
+    server.concept_locations[uri] = extract_concept_locations(tree)
+    server.datasource_info[uri] = extract_datasource_info(tree)
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        result = asyncio.run(
+            profile_query(
+                server,
+                {
+                    "textDocument": {"uri": uri},
+                    "position": {"line": line, "character": 0},
+                },
+            )
+        )
+        hints = server.profile_hints(uri)
+    server.query_executor.shutdown()
+    server.sql_renderer.shutdown()
+    return result, hints
+
+
+def test_profile_query_command(tmp_path):
+    connection = duckdb.connect()
+    connection.execute(
+        f"copy (select range as id, range % 7 as grp, range * 1.5 as amt "
+        f"from range(5000)) to '{tmp_path / 'orders.parquet'}'"
+    )
+    connection.execute(
+        f"copy (select range as grp, 'g' || range as name from range(7)) "
+        f"to '{tmp_path / 'groups.parquet'}'"
+    )
+    connection.close()
+    result, hints = _profile(tmp_path, MODEL, 7)
+    assert result["rows"] == 7
+    assert len(result["ctes"]) > 1
+    assert abs(sum(cte["share"] for cte in result["ctes"]) - 1) < 1e-6
+    # the query's own line, and the definitions behind its hot CTEs
+    assert hints[-1].position.line == 7
+    assert str(hints[-1].label).endswith("7 rows")
+    assert all("Query profile" in hint.tooltip.value for hint in hints)
+
+
+def test_profile_attributes_the_final_select_to_the_last_cte(tmp_path):
+    connection = duckdb.connect()
+    connection.execute(
+        f"copy (select range as id, 'n' || (range % 3) as name from range(500)) "
+        f"to '{tmp_path / 'names.parquet'}'"
+    )
+    connection.execute(
+        f"copy (select range as id, range * 1.5 as v from range(500)) "
+        f"to '{tmp_path / 'values.parquet'}'"
+    )
+    connection.close()
+    result, _ = _profile(tmp_path, JOINED, 5)
+    assert result["rows"] == 3
+    (cte,) = result["ctes"]
+    assert cte["rows"] == 3
+    assert cte["share"] == 1.0
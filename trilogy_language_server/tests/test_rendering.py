@@ -0,0 +1,123 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from unittest.mock import Mock, PropertyMock, patch
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from pygls.uris import from_fs_path
+from trilogy.authoring import Environment
+from trilogy.parsing.parse_engine_v2 import TopLevelStatementParser
+from trilogy.parsing.v2.syntax import SyntaxDocument
+
+from trilogy_language_server.rendering import (
+    CompiledQueryCache,
+    SqlRenderer,
+    workspace_dialects,
+)
+from trilogy_language_server.server import TrilogyLanguageServer, render_sql
+from trilogy_language_server.statements import StatementTreeCache
+
+DOCUMENT = """const a <- 1;
+select a;
+"""
+
+
+def test_workspace_dialects_merge_project_and_settings(tmp_path):
+    assert workspace_dialects(tmp_path) == ["duck_db"]
+    (tmp_path / "trilogy.toml").write_text('[engine]\ndialect = "bigquery"\n')
+    assert workspace_dialects(tmp_path, ["duckdb", "bigquery", "nope"]) == [
+        "bigquery",
+        "duck_db",
+    ]
+
+
+def test_compiled_query_cache_evicts_least_recently_used():
+    cache = CompiledQueryCache(maxsize=2)
+    cache.put(("a", "env"), "select 1")
+    cache.put(("b", "env"), "select 2")
+    assert cache.get(("a", "env")) == "select 1"
+    cache.put(("c", "env"), "select 3")
+    assert cache.get(("b", "env")) is None
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_render_compiles_each_dialect_and_caches():
+    cache = StatementTreeCache()
+    cache.parse(DOCUMENT)
+    (_, constant), (span, tree) = cache.statements
+    environment = Environment()
+    renderer = SqlRenderer()
+    TopLevelStatementParser(environment=environment).parse(
+        SyntaxDocument(text="const a <- 1;", tree=constant)
+    )
+
+    def render(names):
+        return asyncio.run(renderer.render(names, environment, "env", span.text, tree))
+
+    first = render(["duckdb", "bigquery", "nope"])
+    assert [result.dialect for result in first] == ["duck_db", "bigquery", "nope"]
+    assert first[0].sql == 'SELECT\n    1 as "a"\n'
+    assert first[1].sql == "SELECT\n    1 as `a`\n"
+    assert first[2].error == "Unknown dialect"
+    assert not any(result.cached for result in first)
+    assert all(result.cached for result in render(["duck_db", "bigquery"]))
+    renderer.shutdown()
+
+
+def test_render_sql_follows_imported_files(tmp_path):
+    base = tmp_path / "base.preql"
+    base.write_text("key id int;\ndatasource t (id) grain (id) address first;\n")
+    server = TrilogyLanguageServer()
+    workspace = Mock()
+    workspace.get_text_document.return_value = Mock(
+        source="import base as b;\nselect b.id;\n"
+    )
+    params = {
+        "textDocument": {"uri": from_fs_path(str(tmp_path / "query.preql"))},
+        "position": {"line": 1, "character": 3},
+        "dialects": ["duck_db"],
+    }
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        (before,) = asyncio.run(render_sql(server, params))
+        base.write_text("key id int;\ndatasource t (id) grain (id) address second;\n")
+        os.utime(base, ns=(1, 1))
+        (after,) = asyncio.run(render_sql(server, params))
+    assert "first" in before["sql"]
+    assert "second" in after["sql"] and not after["cached"]
+    server.sql_renderer.shutdown()
+
+
+def test_render_sql_request():
+    server = TrilogyLanguageServer()
+    workspace = Mock()
+    workspace.get_text_document.return_value = Mock(source=DOCUMENT)
+    params = {
+        "textDocument": {"uri": "untitled:doc"},
+        "position": {"line": 1, "character": 3},
+        "dialects": ["duck_db"],
+    }
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        result = asyncio.run(render_sql(server, params))
+        outside = asyncio.run(
+            render_sql(server, {**params, "position": {"line": 5, "character": 0}})
+        )
+    assert result == [
+        {
+            "dialect": "duck_db",
+            "sql": 'SELECT\n    1 as "a"\n',
+            "error": None,
+            "cached": False,
+        }
+    ]
+    assert outside == []
+    server.sql_renderer.shutdown()
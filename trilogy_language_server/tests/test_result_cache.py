@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy import Environment, parse
+from trilogy.parsing.parse_engine_v2 import parse_syntax
+
+from trilogy_language_server.execution import QueryExecutor, QueryLimits
+from trilogy_language_server.result_cache import (
+    ResultCache,
+    datasource_fingerprint,
+    result_key,
+)
+from trilogy_language_server.rendering import SqlRenderer
+
+MODEL = """key id int;
+datasource users (id) grain (id) address `users.csv`;
+datasource events (id) grain (id) address events_table;
+"""
+
+
+def test_fingerprint_follows_local_files(tmp_path):
+    data = tmp_path / "users.csv"
+    data.write_text("id\n1\n")
+    environment = Environment(working_path=tmp_path)
+    parse(MODEL, environment)
+    first = datasource_fingerprint(environment, tmp_path, ["users"])
+    assert first is not None
+    assert datasource_fingerprint(environment, tmp_path, ["users"]) == first
+    data.write_text("id\n1\n2\n")
+    os.utime(data, ns=(1, 1))
+    assert datasource_fingerprint(environment, tmp_path, ["users"]) != first
+    # a table may change without any file changing
+    assert datasource_fingerprint(environment, tmp_path, ["users", "events"]) is None
+
+
+def test_schema_qualified_tables_are_not_cached(tmp_path):
+    text = "select id;"
+    environment = Environment(working_path=tmp_path)
+    parse(
+        "key id int;\ndatasource o (id:id) grain (id) address main.orders;",
+        environment,
+    )
+    renderer = SqlRenderer()
+    (rendered,) = asyncio.run(
+        renderer.render(["duckdb"], environment, "env", text, parse_syntax(text).tree)
+    )
+    renderer.shutdown()
+    # the address is quoted in the SQL, and read as a table
+    assert '"main"."orders"' in rendered.sql
+    assert rendered.datasources == ("o",)
+    assert datasource_fingerprint(environment, tmp_path, rendered.datasources) is None
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=10)
+
+    def write(content: bytes):
+        return lambda target: target.write_bytes(content)
+
+    cache.put("a", write(b"aaaa"))
+    cache.put("b", write(b"bbbb"))
+    assert cache.get("a") is not None
+    cache.put("c", write(b"cccc"))
+    assert cache.get("b") is None
+    assert sorted(path.stem for path in tmp_path.iterdir()) == ["a", "c"]
+    # the index is rebuilt from the directory, most recently used last
+    reopened = ResultCache(tmp_path, max_bytes=10)
+    assert reopened.size == 8
+    assert list(reopened._entries()) == ["a", "c"]
+
+
+def test_cached_results_are_not_recomputed(tmp_path):
+    executor = QueryExecutor(page_size=2, results=ResultCache(tmp_path / "results"))
+    sql = "select range as x from range(3);"
+    key = result_key(sql, "sources")
+    first = executor.start(tmp_path, sql, cache_key=key)
+    assert not first.cached
+    assert first.rows == [[0], [1]]
+    assert executor.fetch(first.cursor).rows == [[2]]
+    second = executor.start(tmp_path, sql, cache_key=key)
+    assert second.cached and second.rows == [[0], [1]]
+    assert executor.results.hits == 1
+    executor.shutdown()
+
+
+def test_capped_queries_are_not_cached(tmp_path):
+    executor = QueryExecutor(page_size=2048, results=ResultCache(tmp_path / "results"))
+    sql = "select range as x from range(5000)"
+    key = result_key(sql, "sources")
+    capped = executor.start(
+        tmp_path, sql, cache_key=key, limits=QueryLimits(max_rows=10)
+    )
+    # the query was cut off rather than run to completion into the cache
+    assert (len(capped.rows), capped.truncated, capped.cached) == (10, True, False)
+    assert executor.results.get(key) is None
+
+    executor.start(tmp_path, sql, cache_key=key)
+    # once cached, capped queries read the cached result
+    capped = executor.start(
+        tmp_path, sql, cache_key=key, limits=QueryLimits(max_rows=10)
+    )
+    assert (len(capped.rows), capped.truncated, capped.cached) == (10, True, True)
+    executor.shutdown()
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from unittest.mock import Mock, PropertyMock, patch
+
+import duckdb
+import pytest
+from pygls.uris import from_fs_path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy.authoring import Environment
+
+from trilogy_language_server.execution import QueryExecutor
+from trilogy_language_server.result_cache import ResultCache
+from trilogy_language_server.sampling import (
+    SampleCache,
+    sample_percent,
+    sample_sources,
+)
+from trilogy_language_server.server import TrilogyLanguageServer, execute_query
+
+ROOT = """key id int;
+property id.amt float;
+root datasource orders (id, amt) grain (id) address `orders.parquet`;
+"""
+MODEL = ROOT + "datasource totals (id, amt) grain (id) address `totals.parquet`;\n"
+
+
+def _write_orders(path: Path, rows: int) -> None:
+    duckdb.connect().execute(
+        f"copy (select range as id, range * 1.5 as amt from range({rows})) "
+        f"to '{path}'"
+    )
+
+
+def test_sample_percent():
+    assert sample_percent(None, None) is None
+    assert sample_percent(None, 5.0) == 5.0
+    assert sample_percent(True, 5.0) == 5.0
+    assert sample_percent(False, 5.0) is None
+    assert sample_percent(0, 5.0) is None
+    assert sample_percent(20, None) == 20.0
+    with pytest.raises(ValueError):
+        sample_percent(150, None)
+
+
+def test_only_root_file_datasources_are_sampled(tmp_path):
+    _write_orders(tmp_path / "orders.parquet", 10)
+    _write_orders(tmp_path / "totals.parquet", 10)
+    environment = Environment(working_path=tmp_path)
+    environment.parse(MODEL)
+    (source,) = sample_sources(environment, tmp_path)
+    assert source.name == "orders"
+    assert source.location == str(tmp_path / "orders.parquet")
+
+
+def test_samples_are_kept_until_their_files_change(tmp_path):
+    orders = tmp_path / "orders.parquet"
+    _write_orders(orders, 20000)
+    environment = Environment(working_path=tmp_path)
+    environment.parse(MODEL)
+    executor = QueryExecutor(samples=SampleCache(tmp_path / "samples"))
+
+    def sampled_ids(path: Path):
+        return (
+            duckdb.connect().execute(f"select id from '{path}' order by id").fetchall()
+        )
+
+    first = executor.take_samples(tmp_path, sample_sources(environment, tmp_path), 10)
+    ids = sampled_ids(first["orders"])
+    # about a tenth of the rows
+    assert 1500 < len(ids) < 2500
+    stamp = first["orders"].stat().st_mtime_ns
+    again = executor.take_samples(tmp_path, sample_sources(environment, tmp_path), 10)
+    assert again == first
+    assert first["orders"].stat().st_mtime_ns == stamp
+
+    # the same rows are kept when the file is rewritten unchanged
+    _write_orders(orders, 20000)
+    os.utime(orders, ns=(stamp + 10**9, stamp + 10**9))
+    refreshed = executor.take_samples(
+        tmp_path, sample_sources(environment, tmp_path), 10
+    )
+    assert refreshed["orders"] != first["orders"]
+    assert not first["orders"].exists()
+    assert sampled_ids(refreshed["orders"]) == ids
+    executor.shutdown()
+
+
+def test_execute_query_reads_samples(tmp_path):
+    _write_orders(tmp_path / "orders.parquet", 20000)
+    server = TrilogyLanguageServer()
+    server.query_executor.results = ResultCache(tmp_path / "results")
+    server.query_executor.samples = SampleCache(tmp_path / "samples")
+    workspace = Mock(folders={}, root_path=None)
+    workspace.get_text_document.return_value = Mock(
+        source=ROOT + "select count(id) -> orders;\n"
+    )
+    uri = from_fs_path(str(tmp_path / "query.preql"))
+    statement = {
+        "textDocument": {"uri": uri},
+        "position": {"line": 3, "character": 0},
+    }
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        full = asyncio.run(execute_query(server, statement))
+        server.sample_percent = 10.0
+        sampled = asyncio.run(execute_query(server, statement))
+        rerun = asyncio.run(execute_query(server, statement))
+        whole = asyncio.run(execute_query(server, {**statement, "sample": False}))
+    assert full["rows"] == [[20000]] and full["sample"] is None
+    assert sampled["sample"] == 10.0
+    assert 1500 < sampled["rows"][0][0] < 2500
+    assert rerun["cached"] and rerun["rows"] == sampled["rows"]
+    assert whole["rows"] == [[20000]] and whole["sample"] is None
+    assert len(list((tmp_path / "samples").glob("*.parquet"))) == 1
+    server.query_executor.shutdown()
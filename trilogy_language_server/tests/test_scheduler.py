@@ -0,0 +1,115 @@
+import asyncio
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.__main__ import main
+from trilogy_language_server.diagnostics import WorkspaceDiagnostics
+from trilogy_language_server.scheduler import (
+    WorkspaceScheduler,
+    prioritize,
+)
+from trilogy_language_server.watchdog import ActivityTracker
+
+
+def write_workspace(root: Path) -> None:
+    (root / "nested").mkdir()
+    (root / "main.preql").write_text("import nested.base as base;\nselect base.x;\n")
+    (root / "nested" / "base.preql").write_text(
+        "import ..shared as shared;\nkey x int;\nselect missing;\n"
+    )
+    (root / "shared.preql").write_text("key y int;\n")
+    (root / "aaa.preql").write_text("key z int;\n")
+
+
+def test_prioritize_open_files_then_import_closure(tmp_path: Path):
+    write_workspace(tmp_path)
+    files = sorted(tmp_path.rglob("*.preql"))
+    ordered = prioritize(files, [tmp_path / "main.preql"])
+    assert [path.relative_to(tmp_path).as_posix() for path in ordered] == [
+        "main.preql",
+        "nested/base.preql",
+        "shared.preql",
+        "aaa.preql",
+    ]
+
+
+def test_scheduler_checks_stale_files_in_worker_processes(tmp_path: Path):
+    write_workspace(tmp_path)
+    diagnostics = WorkspaceDiagnostics()
+    idle = iter([0.0, 0.0])
+    scheduler = WorkspaceScheduler(
+        diagnostics,
+        idle_for=lambda: next(idle, float("inf")),
+        workers=1,
+        quiet_period=0.01,
+    )
+    checked = []
+    progress = []
+
+    async def run():
+        return await scheduler.start(
+            [tmp_path],
+            [tmp_path / "main.preql"],
+            on_result=lambda path, _: checked.append(path.name),
+            on_progress=lambda done, total: progress.append((done, total)),
+        )
+
+    try:
+        results = asyncio.run(run())
+        assert checked == ["main.preql", "base.preql", "shared.preql", "aaa.preql"]
+        assert progress[0] == (0, 4) and progress[-1] == (4, 4)
+        base = results[tmp_path / "nested" / "base.preql"]
+        assert base is not None
+        assert [d.range.start.line for d in base.diagnostics] == [2]
+
+        # unchanged files are not checked again
+        assert asyncio.run(run()) == {}
+    finally:
+        scheduler.shutdown()
+
+
+def test_scheduler_checks_files_in_spawned_processes(tmp_path: Path):
+    # workers start from a fresh interpreter on every platform, rather than
+    # forking the server's running threads on Linux
+    write_workspace(tmp_path)
+    scheduler = WorkspaceScheduler(WorkspaceDiagnostics(), workers=1)
+
+    async def run():
+        return await scheduler.start([tmp_path], [tmp_path / "main.preql"])
+
+    try:
+        assert isinstance(scheduler.executor, ProcessPoolExecutor)
+        context = scheduler.executor._mp_context  # type: ignore[attr-defined]
+        assert context is not None and context.get_start_method() == "spawn"
+        results = asyncio.run(run())
+        assert len(results) == 4
+        base = results[tmp_path / "nested" / "base.preql"]
+        assert base is not None
+        assert [d.range.start.line for d in base.diagnostics] == [2]
+    finally:
+        scheduler.shutdown()
+
+
+def test_main_hands_frozen_workers_to_multiprocessing():
+    calls = []
+    with patch(
+        "multiprocessing.freeze_support", side_effect=lambda: calls.append("freeze")
+    ), patch("argparse.ArgumentParser.parse_args", side_effect=SystemExit):
+        try:
+            main()
+        except SystemExit:
+            pass
+    # before arguments a worker would not understand are parsed
+    assert calls == ["freeze"]
+
+
+def test_activity_tracker_idle_time():
+    tracker = ActivityTracker()
+    with tracker.track("textDocument/hover"):
+        assert tracker.idle_for() == 0.0
+    assert 0.0 <= tracker.idle_for() < 1.0
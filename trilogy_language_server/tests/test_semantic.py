@@ -0,0 +1,122 @@
+import os
+import sys
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.semantic import SemanticDiagnostics
+from trilogy_language_server.statements import StatementTreeCache
+
+DOCUMENT = """key order_id int;
+property order_id.total float;
+
+select order_id, totl;
+select upper(total);
+select order_id
+where
+    total = 'a';
+select order_id, total;
+"""
+
+
+def run(stage: SemanticDiagnostics, text: str):
+    cache = StatementTreeCache()
+    cache.parse(text)
+    return stage.run(cache.statements, Path(__file__).parent)
+
+
+def test_reports_every_failing_statement_with_ranges():
+    diagnostics = run(SemanticDiagnostics(), DOCUMENT)
+    assert len(diagnostics) == 3
+    undefined, function, comparison = diagnostics
+    assert "totl" in undefined.message
+    assert (undefined.range.start.line, undefined.range.start.character) == (3, 17)
+    assert undefined.range.end.character == 21
+    assert function.range.start.line == 4
+    assert function.range.start.character == 7
+    assert comparison.range.start.line == 7
+    assert comparison.range.start.character == 4
+
+
+def test_only_changed_statements_are_rechecked():
+    stage = SemanticDiagnostics()
+    run(stage, DOCUMENT)
+    assert stage.checked == 6
+
+    # a select declares nothing, so only the edited statement is rechecked
+    edited = DOCUMENT.replace("totl", "total")
+    diagnostics = run(stage, edited)
+    assert len(diagnostics) == 2
+    assert stage.checked == 7
+
+    # as is a statement reformatted without declaring anything different
+    run(
+        stage,
+        edited.replace(
+            "property order_id.total float;", "property  order_id.total  float;"
+        ),
+    )
+    assert stage.checked == 8
+
+    # moving statements does not invalidate them
+    diagnostics = run(stage, "\n\n" + edited)
+    assert stage.checked == 9
+    assert diagnostics[0].range.start.line == 6
+
+    # a changed declaration rechecks the statements that may depend on it
+    retyped = edited.replace("total float", "total string")
+    run(stage, retyped)
+    assert stage.checked == 9 + 5
+
+
+def test_editing_an_imported_file_rechecks_its_importers(tmp_path):
+    base = tmp_path / "base.preql"
+    base.write_text("key x int;\nkey y int;\n")
+    text = "import base as b;\nselect b.x;\nselect b.y;\n"
+    cache = StatementTreeCache()
+    cache.parse(text)
+    stage = SemanticDiagnostics()
+    assert stage.run(cache.statements, tmp_path) == []
+    assert stage.run(cache.statements, tmp_path) == []
+    assert stage.checked == 3
+
+    base.write_text("key x int;\n")
+    os.utime(base, ns=(1, 1))
+    (missing,) = stage.run(cache.statements, tmp_path)
+    assert "b.y" in missing.message
+    assert missing.range.start.line == 2
+    assert stage.checked == 6
+
+
+def test_cancelled_run_returns_none():
+    cache = StatementTreeCache()
+    cache.parse(DOCUMENT)
+    stage = SemanticDiagnostics()
+    assert stage.run(cache.statements, Path("."), cancelled=lambda: True) is None
+
+
+def test_server_publishes_semantic_after_syntax_diagnostics():
+    from unittest.mock import Mock, PropertyMock, patch
+
+    from lsprotocol.types import DidOpenTextDocumentParams, TextDocumentItem
+
+    from trilogy_language_server.server import TrilogyLanguageServer
+
+    server = TrilogyLanguageServer()
+    document = Mock(source=DOCUMENT, version=1, uri="untitled:doc")
+    workspace = Mock()
+    workspace.get_text_document.return_value = document
+    server.window_log_message = Mock()
+    server.text_document_publish_diagnostics = Mock()
+    with patch.object(
+        TrilogyLanguageServer, "workspace", new_callable=PropertyMock
+    ) as patched:
+        patched.return_value = workspace
+        server._validate_document(
+            DidOpenTextDocumentParams(
+                text_document=TextDocumentItem("untitled:doc", "trilogy", 1, DOCUMENT)
+            )
+        )
+    published = server.text_document_publish_diagnostics.call_args_list
+    assert [len(call.args[0].diagnostics) for call in published] == [0, 3]
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.signature import CallIndex, CallState
+
+
+def call_at_end(text: str):
+    lines = text.split("\n")
+    return CallIndex(text).enclosing_call(len(lines) - 1, len(lines[-1]))
+
+
+def test_enclosing_call_single_line():
+    assert call_at_end("select count(") == CallState("count", 0)
+    assert call_at_end("select coalesce(a, b, ") == CallState("coalesce", 2)
+    assert call_at_end("select count(a)") is None
+    assert call_at_end("select a") is None
+
+
+def test_enclosing_call_multi_line_and_nested():
+    text = "select\n  coalesce(\n    a,\n    sum(b, c),\n    "
+    assert call_at_end(text) == CallState("coalesce", 2)
+    assert call_at_end("select round(sum(x") == CallState("sum", 0)
+    assert call_at_end("select round(sum(x), ") == CallState("round", 1)
+
+
+def test_enclosing_call_ignores_strings_and_comments():
+    assert call_at_end("select concat('a,(b', ") == CallState("concat", 1)
+    assert call_at_end('select concat("x)", ') == CallState("concat", 1)
+    assert call_at_end("select concat(a, # (c, d\n") == CallState("concat", 1)
+    assert call_at_end("select count(a);\nselect ") is None
+
+
+def test_enclosing_call_non_call_brackets():
+    assert call_at_end("select 1 + (a, ") is None
+    assert call_at_end("select count(x[1, ") is None
+
+
+def test_position_lookup():
+    index = CallIndex("select count(\n  a,\n  b\n)")
+    assert index.enclosing_call(0, 6) is None
+    assert index.enclosing_call(1, 2) == CallState("count", 0)
+    assert index.enclosing_call(2, 3) == CallState("count", 1)
+    assert index.enclosing_call(3, 1) is None
+    assert index.enclosing_call(10, 0) is None
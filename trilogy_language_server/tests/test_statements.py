@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy.parsing.parse_engine_v2 import parse_syntax
+
+from trilogy_language_server.error_reporting import get_statement_diagnostics
+from trilogy_language_server.parsing import extract_concept_locations, tree_to_symbols
+from trilogy_language_server.statements import StatementTreeCache, split_statements
+
+DOCUMENT = """key order_id int;
+property order_id.total float; # trailing ; comment
+key customer_id int;
+
+select
+    order_id,
+    total
+where total > 1;
+"""
+
+
+def test_split_statements_skips_strings_and_comments():
+    spans = split_statements("key a int;\nselect 'x;y' as b; // c;\n  select a;")
+    assert [span.text for span in spans] == [
+        "key a int;",
+        "select 'x;y' as b;",
+        "// c;\n  select a;",
+    ]
+    assert [(span.line, span.column) for span in spans] == [(0, 0), (1, 0), (1, 19)]
+    assert split_statements("key a int;\n\n") == [split_statements("key a int;")[0]]
+
+
+def test_statement_tree_matches_full_parse():
+    tree, failures = StatementTreeCache().parse(DOCUMENT)
+    full = parse_syntax(DOCUMENT).tree
+    assert failures == []
+    assert tree_to_symbols(DOCUMENT, tree) == tree_to_symbols(DOCUMENT, full)
+    assert extract_concept_locations(tree) == extract_concept_locations(full)
+
+
+def test_broken_statement_keeps_the_rest():
+    broken = DOCUMENT.replace("key customer_id int;", "key customer_id in t;")
+    tree, diagnostics = get_statement_diagnostics(broken, StatementTreeCache())
+    assert len(diagnostics) == 1
+    assert diagnostics[0].range.start.line == 2
+    addresses = {loc.concept_address for loc in extract_concept_locations(tree)}
+    assert {"local.order_id", "local.total"} <= addresses
+    assert "local.customer_id" not in addresses
+
+
+def test_only_changed_statements_are_reparsed():
+    cache = StatementTreeCache()
+    cache.parse(DOCUMENT)
+    parsed = cache.parsed
+
+    broken = DOCUMENT.replace("where total > 1", "where total >")
+    _, failures = cache.parse(broken)
+    assert cache.parsed == parsed + 1
+    assert len(failures) == 1
+
+    # fixing the error reparses the one statement, and inserting lines above
+    # only re-positions the statements below
+    cache.parse(DOCUMENT)
+    assert cache.parsed == parsed + 2
+    cache.parse("\n\n" + DOCUMENT)
+    assert cache.parsed == parsed + 2
+    tree, _ = cache.parse("\n\n" + DOCUMENT)
+    full = parse_syntax("\n\n" + DOCUMENT).tree
+    assert tree_to_symbols("\n\n" + DOCUMENT, tree) == tree_to_symbols(
+        "\n\n" + DOCUMENT, full
+    )
@@ -0,0 +1,61 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# TODO: less shenanigans
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from trilogy_language_server.watchdog import StallWatchdog
+
+
+def blocking_validation():
+    time.sleep(0.4)
+
+
+def test_watchdog_reports_stall_with_activity_and_stack():
+    reports = []
+    watchdog = StallWatchdog(threshold=0.1, on_stall=reports.append)
+
+    async def main():
+        watchdog.start(asyncio.get_running_loop())
+        await asyncio.sleep(0.05)
+        with watchdog.activity.track("textDocument/didChange", "file:///slow.preql"):
+            blocking_validation()
+        # let the heartbeat run so the stall is marked recovered
+        await asyncio.sleep(0.1)
+        watchdog.stop()
+
+    asyncio.run(main())
+
+    assert len(reports) == 1
+    report = reports[0]
+    assert report.method == "textDocument/didChange"
+    assert report.uri == "file:///slow.preql"
+    assert any("blocking_validation" in frame for frame in report.stack)
+    assert report.recovered
+    assert report.stalled_for >= 0.35
+    assert list(watchdog.stalls) == [report]
+
+
+def test_watchdog_ignores_healthy_loop():
+    watchdog = StallWatchdog(threshold=0.2)
+
+    async def main():
+        watchdog.start(asyncio.get_running_loop())
+        for _ in range(10):
+            await asyncio.sleep(0.02)
+        watchdog.stop()
+
+    asyncio.run(main())
+    assert not watchdog.stalls
+
+
+def test_watchdog_disabled_with_zero_threshold():
+    watchdog = StallWatchdog(threshold=0)
+
+    async def main():
+        watchdog.start(asyncio.get_running_loop())
+
+    asyncio.run(main())
+    assert not watchdog.running
@@ -49,8 +49,13 @@ def get_trilogy_stdlib_files():
                 inclusion_files.append((str(f), str(subroot)))
     return inclusion_files
 
+def get_function_catalog_file():
+    # generated by function_catalog.py before freezing; see build_language_server.py
+    catalog = Path(SPECPATH) / 'function_catalog.json'
+    return [(str(catalog), 'trilogy_language_server')] if catalog.exists() else []
+
 # TODO: evaluate if we want public models by default
-datas = get_trilogy_lark_file() + get_trilogy_stdlib_files()
+datas = get_trilogy_lark_file() + get_trilogy_stdlib_files() + get_function_catalog_file()
 binaries = []
 hiddenimports = ['sqlalchemy_bigquery']
 tmp_ret = collect_all('duckdb')
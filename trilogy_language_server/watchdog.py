@@ -0,0 +1,160 @@
+"""Detects stalls of the asyncio event loop that serves LSP traffic."""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class StallReport(BaseModel):
+    """A single event loop stall, as seen by the watchdog thread."""
+
+    method: Optional[str] = None
+    uri: Optional[str] = None
+    # lag at detection time; updated to the full stall once the loop recovers
+    stalled_for: float
+    recovered: bool = False
+    stack: List[str] = Field(default_factory=list)
+
+    def describe(self) -> str:
+        target = f"{self.method} {self.uri or ''}".strip() or "unknown work"
+        return (
+            f"Event loop stalled for {self.stalled_for:.2f}s while processing "
+            f"{target}\n" + "".join(self.stack)
+        )
+
+
+class ActivityTracker:
+    """Records the method and URI the loop thread is currently processing."""
+
+    def __init__(self) -> None:
+        self.current: Optional[Tuple[str, Optional[str]]] = None
+        # when the loop last finished handling a message
+        self.last_active = time.monotonic()
+
+    @contextmanager
+    def track(self, method: str, uri: Optional[str] = None) -> Iterator[None]:
+        previous = self.current
+        self.current = (method, uri)
+        try:
+            yield
+        finally:
+            self.current = previous
+            self.last_active = time.monotonic()
+
+    def idle_for(self) -> float:
+        """Seconds since the loop last handled a message; 0 while handling one."""
+        if self.current is not None:
+            return 0.0
+        return time.monotonic() - self.last_active
+
+
+class StallWatchdog:
+    """
+    Heartbeat-based stall detector.
+
+    A callback scheduled on the event loop records a tick every ``interval``
+    seconds; a daemon thread checks the age of the last tick and, once it exceeds
+    ``threshold``, captures the loop thread's stack and the active method/URI.
+    A threshold of 0 disables the watchdog.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 1.0,
+        interval: Optional[float] = None,
+        on_stall: Optional[Callable[[StallReport], None]] = None,
+        history: int = 20,
+    ) -> None:
+        self.threshold = threshold
+        self._interval = interval
+        self.on_stall = on_stall
+        self.activity = ActivityTracker()
+        self.stalls: Deque[StallReport] = deque(maxlen=history)
+        self.last_tick = time.monotonic()
+        self._current_stall: Optional[StallReport] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def interval(self) -> float:
+        return self._interval or max(self.threshold / 4, 0.01)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start watching ``loop``; must be called from the loop's thread."""
+        if self.threshold <= 0 or self.running:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self.last_tick = time.monotonic()
+        loop.call_soon(self._tick)
+        self._thread = threading.Thread(
+            target=self._watch, name="trilogy-loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+        self._thread = None
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        stall = self._current_stall
+        if stall is not None:
+            stall.stalled_for = now - self.last_tick
+            stall.recovered = True
+            self._current_stall = None
+            logger.warning(
+                "Event loop recovered after %.2fs stall in %s",
+                stall.stalled_for,
+                stall.method,
+            )
+        self.last_tick = now
+        if not self._stop.is_set() and self._loop is not None:
+            self._loop.call_later(self.interval, self._tick)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self, now: Optional[float] = None) -> Optional[StallReport]:
+        """Report a new stall if the loop has not ticked within the threshold."""
+        lag = (now or time.monotonic()) - self.last_tick
+        if lag <= self.threshold or self._current_stall is not None:
+            return None
+        method, uri = self.activity.current or (None, None)
+        report = StallReport(
+            method=method, uri=uri, stalled_for=lag, stack=self._loop_stack()
+        )
+        self._current_stall = report
+        self.stalls.append(report)
+        logger.warning(report.describe())
+        if self.on_stall:
+            self.on_stall(report)
+        return report
+
+    def _loop_stack(self) -> List[str]:
+        if self._loop_thread_id is None:
+            return []
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return []
+        return traceback.format_stack(frame)